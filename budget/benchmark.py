@@ -0,0 +1,329 @@
+import json
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.db.backends.utils import CursorWrapper
+from django.db.models import Q
+from django.test import Client, RequestFactory, override_settings
+from django.conf import settings
+from django.urls import reverse
+from .bulk import delete_rows
+from .cache import bump_data_version
+from .categories import bump_category_version
+from .instrumentation import QueryRecorder
+from .views import AsyncDashboardView, DashboardView
+from .models import Category, Contribution, DailyBalance, Expense, Goal, Income, Job, MonthlyCategoryTotal
+
+USER_PREFIX = 'bench_user_'
+CATEGORY_PREFIX = 'bench_category_'
+PASSWORD = 'bench-password'
+
+
+def skewed_weights(count, skew):
+    """
+    Returns `count` Zipf-like weights summing to 1: the item of rank ``r`` gets a share proportional
+    to ``1 / r ** skew``, so a few heavy users own most of the rows. ``skew=0`` spreads rows evenly.
+    """
+    raw = [1 / (rank ** skew) for rank in range(1, count + 1)]
+    total = sum(raw)
+    return [weight / total for weight in raw]
+
+
+def clear():
+    """
+    Deletes every benchmark user and category together with everything that belongs to them.
+
+    Dependent rows are deleted with plain set-based DELETEs: a regular cascade would load every
+    row to send the signals that maintain derived totals, which are deleted here as well.
+    """
+    users = User.objects.filter(username__startswith=USER_PREFIX)
+    categories = Category.objects.filter(name__startswith=CATEGORY_PREFIX)
+    with transaction.atomic():
+        for model in (MonthlyCategoryTotal, Expense, Income):
+            delete_rows(model.objects.filter(Q(user__in=users) | Q(category__in=categories)))
+        delete_rows(DailyBalance.objects.filter(user__in=users))
+        delete_rows(Contribution.objects.filter(Q(contributor__in=users) | Q(goal__owner__in=users)))
+        delete_rows(Goal.objects.filter(owner__in=users))
+        users.delete()
+        categories.delete()
+
+
+def seed(users=50, categories=12, goals_per_user=3, contributions=2000, transactions=100000,
+         years=5, skew=1.1, batch_size=5000, seed=0, stdout=None):
+    """
+    Generates a synthetic dataset with bulk inserts and returns the benchmark users, heaviest first.
+
+    Transactions are spread over the last `years` years and across users with `skewed_weights`,
+    about four expenses for every income. Contributions go to random goals, favouring the goals of
+    heavy users. The monthly rollup, daily balances and goal totals are rebuilt at the end, since
+    bulk inserts do not send the signals that normally maintain them.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    today = date.today()
+    days = max(1, years * 365)
+
+    def log(message):
+        if stdout:
+            stdout.write(message)
+
+    with transaction.atomic():
+        offset = User.objects.filter(username__startswith=USER_PREFIX).count()
+        usernames = [f'{USER_PREFIX}{offset + i}' for i in range(users)]
+        User.objects.bulk_create([User(username=username, password=password) for username in usernames], batch_size=batch_size)
+        bench_users = list(User.objects.filter(username__in=usernames).order_by('pk'))
+        Category.objects.bulk_create([Category(name=f'{CATEGORY_PREFIX}{i}') for i in range(categories)])
+        transaction.on_commit(bump_category_version)
+        category_ids = list(Category.objects.filter(name__startswith=CATEGORY_PREFIX).values_list('pk', flat=True))
+        Goal.objects.bulk_create(
+            [
+                Goal(owner=user, name=f'Goal {i}', target_amount=Decimal(rng.randint(500, 50000)))
+                for user in bench_users for i in range(goals_per_user)
+            ],
+            batch_size=batch_size,
+        )
+    log(f'Created {len(bench_users)} users, {len(category_ids)} categories and {len(bench_users) * goals_per_user} goals.')
+
+    user_weights = skewed_weights(len(bench_users), skew)
+    category_weights = skewed_weights(len(category_ids), skew)
+    batch = {Expense: [], Income: []}
+    written = 0
+    for user, weight in zip(bench_users, user_weights):
+        for _ in range(math.ceil(transactions * weight)):
+            model = Income if rng.random() < 0.2 else Expense
+            batch[model].append(model(
+                user=user,
+                name=model.__name__,
+                amount=Decimal(rng.randint(100, 500000)) / 100,
+                category_id=rng.choices(category_ids, category_weights)[0],
+                date=today - timedelta(days=rng.randrange(days)),
+            ))
+            if len(batch[model]) >= batch_size:
+                model.objects.bulk_create(batch[model])
+                written += len(batch[model])
+                batch[model] = []
+    for model, rows in batch.items():
+        model.objects.bulk_create(rows)
+        written += len(rows)
+    log(f'Created {written} transactions.')
+
+    goals = list(Goal.objects.filter(owner__in=bench_users).values_list('pk', 'owner_id'))
+    owner_weight = dict(zip((user.pk for user in bench_users), user_weights))
+    goal_weights = [owner_weight[owner_id] for _, owner_id in goals]
+    if goals:
+        Contribution.objects.bulk_create(
+            (
+                Contribution(
+                    goal_id=rng.choices(goals, goal_weights)[0][0],
+                    contributor=rng.choice(bench_users),
+                    amount=Decimal(rng.randint(100, 100000)) / 100,
+                )
+                for _ in range(contributions)
+            ),
+            batch_size=batch_size,
+        )
+    log(f'Created {contributions if goals else 0} contributions.')
+
+    call_command('rebuild_monthly_totals', users=[user.pk for user in bench_users], stdout=stdout)
+    call_command('rebuild_daily_balances', users=[user.pk for user in bench_users], stdout=stdout)
+    call_command('rebuild_goal_totals', stdout=stdout)
+    return bench_users
+
+
+def benchmark_user(username=None):
+    """
+    Returns the user named `username` or, without one, the heaviest benchmark user, which `seed`
+    creates first. Raises `CommandError` if there is no such user.
+    """
+    if username:
+        user = User.objects.filter(username=username).first()
+    else:
+        user = User.objects.filter(username__startswith=USER_PREFIX).order_by('pk').first()
+    if user is None:
+        raise CommandError('No such user; pass --username or run seed_benchmark first.')
+    return user
+
+
+def percentile(values, pct):
+    """
+    Returns the nearest-rank percentile `pct` (0-100) of `values`.
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _url_kwargs(user):
+    goal = Goal.objects.filter(owner=user).first()
+    expense = Expense.objects.filter(user=user).first()
+    income = Income.objects.filter(user=user).first()
+    job = Job.objects.filter(user=user).first()
+    return {
+        'donation': {'goal_id': goal.pk if goal else 0},
+        'edit_expense': {'transaction_id': expense.pk if expense else 0},
+        'edit_income': {'transaction_id': income.pk if income else 0},
+        'job_status': {'job_id': job.pk if job else 0},
+        'job_download': {'job_id': job.pk if job else 0},
+    }
+
+
+def budget_urls(user):
+    """
+    Returns ``{name: url}`` for every named route of `budget/urls.py`, filling route parameters
+    with objects owned by `user`.
+    """
+    from . import urls
+
+    kwargs = _url_kwargs(user)
+    return {pattern.name: reverse(pattern.name, kwargs=kwargs.get(pattern.name)) for pattern in urls.urlpatterns if pattern.name}
+
+
+def time_urls(user, requests=20, cold=False):
+    """
+    Requests every URL of `budget/urls.py` `requests` times as `user` and returns
+    ``{name: {'p50_ms', 'p95_ms', 'mean_ms', 'queries', 'status'}}``.
+
+    With `cold` the user's data version is bumped before every request, so the cached
+    summaries are recomputed and the uncached cost is measured.
+    """
+    client = Client()
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, url in budget_urls(user).items():
+            timings, queries, status = [], [], None
+            for _ in range(requests):
+                client.force_login(user)
+                if cold:
+                    bump_data_version(user.pk)
+                recorder = QueryRecorder()
+                start = time.perf_counter()
+                with recorder.record():
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+                queries.append(recorder.count)
+                status = response.status_code
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+                'queries': max(queries),
+                'status': status,
+            }
+    return results
+
+
+@contextmanager
+def simulated_latency(seconds):
+    """
+    Delays every SQL statement by `seconds`, on every connection and thread, to stand in for the
+    round trip to a database on another host, which a local database hides.
+    """
+    execute = CursorWrapper._execute_with_wrappers
+
+    def delayed(self, *args, **kwargs):
+        time.sleep(seconds)
+        return execute(self, *args, **kwargs)
+
+    CursorWrapper._execute_with_wrappers = delayed
+    try:
+        yield
+    finally:
+        CursorWrapper._execute_with_wrappers = execute
+
+
+def time_dashboards(user, requests=20, latency=0.005):
+    """
+    Renders the sync `DashboardView` and the `AsyncDashboardView` `requests` times each as `user`,
+    with `latency` seconds added to every statement, and returns
+    ``{'sync': {'p50_ms', 'p95_ms', 'mean_ms'}, 'async': {...}}``.
+
+    The user's data version is bumped before every request, so the sections are always computed
+    rather than read from the cache.
+    """
+    factory = RequestFactory()
+    views = {
+        'sync': DashboardView.as_view(),
+        'async': async_to_sync(AsyncDashboardView.as_view()),
+    }
+    results = {}
+    with simulated_latency(latency):
+        for name, view in views.items():
+            timings = []
+            for _ in range(requests):
+                request = factory.get(reverse('dashboard'))
+                request.user = user
+                request.auser = sync_to_async(lambda: user)
+                bump_data_version(user.pk)
+                start = time.perf_counter()
+                view(request).render()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+            }
+    return results
+
+
+def time_transaction_writes(user, count=200, batch_size=100, seed=0):
+    """
+    Creates `count` expenses for `user` through the `add_expense` form, one POST each, and `count`
+    more through the batch API in requests of `batch_size`, and returns
+    ``{'form': {'rows', 'requests', 'seconds', 'rows_per_s'}, 'api': {...}}``.
+
+    The created expenses are kept; run it against benchmark data, which `clear` removes.
+    """
+    rng = random.Random(seed)
+    category_ids = list(Category.objects.values_list('pk', flat=True))
+    if not category_ids:
+        category_ids = [Category.objects.create(name=f'{CATEGORY_PREFIX}0').pk]
+    today = date.today()
+
+    def item():
+        return {
+            'name': 'Benchmark expense',
+            'category': rng.choice(category_ids),
+            'amount': str(Decimal(rng.randint(100, 50000)) / 100),
+            'date': (today - timedelta(days=rng.randrange(365))).isoformat(),
+        }
+
+    client = Client()
+    client.force_login(user)
+    requests = {
+        'form': [(reverse('add_expense'), item(), None) for _ in range(count)],
+        'api': [
+            (
+                reverse('api_create_transactions'),
+                json.dumps({'transactions': [{'type': 'expense', **item()} for _ in range(min(batch_size, count - start))]}),
+                'application/json',
+            )
+            for start in range(0, count, batch_size)
+        ],
+    }
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, posts in requests.items():
+            started = time.perf_counter()
+            for url, data, content_type in posts:
+                response = client.post(url, data, content_type=content_type) if content_type else client.post(url, data)
+                if response.status_code not in (201, 302):
+                    raise RuntimeError(f'{name} request failed with status {response.status_code}: {response.content[:200]!r}')
+            seconds = time.perf_counter() - started
+            results[name] = {
+                'rows': count,
+                'requests': len(posts),
+                'seconds': round(seconds, 3),
+                'rows_per_s': round(count / seconds, 1),
+            }
+    return results
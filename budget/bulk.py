@@ -0,0 +1,133 @@
+from datetime import date
+from django.db import connections, transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from .cache import bump_data_version
+from .models import DailyBalance, Expense, Income, MonthlyCategoryTotal
+
+
+def create_transactions(user_id, expenses=(), incomes=(), batch_size=None, rebuild_balances=True):
+    """
+    Inserts expenses and incomes of one user with `bulk_create` in one transaction and returns
+    them as ``(expenses, incomes)``.
+
+    `bulk_create` sends no model signals, so the monthly rollup, the daily running totals from the
+    earliest inserted date on and the user's cached summaries are brought in line here. Callers
+    inserting many batches pass ``rebuild_balances=False`` and rebuild the running totals once
+    from the earliest date of all batches, as each rebuild reads every later day.
+    """
+    expenses, incomes = list(expenses), list(incomes)
+    if not expenses and not incomes:
+        return expenses, incomes
+    with transaction.atomic():
+        for model, kind, rows in ((Expense, MonthlyCategoryTotal.EXPENSE, expenses), (Income, MonthlyCategoryTotal.INCOME, incomes)):
+            if rows:
+                model.objects.bulk_create(rows, batch_size=batch_size)
+                MonthlyCategoryTotal.add_transactions(kind, rows)
+        if rebuild_balances:
+            DailyBalance.rebuild(user_id, since=min(item.date for item in expenses + incomes))
+        transaction.on_commit(lambda: bump_data_version(user_id))
+    return expenses, incomes
+
+
+def delete_rows(queryset):
+    """
+    Deletes the rows of `queryset` with one ``DELETE ... WHERE pk IN (SELECT ...)`` and returns
+    how many were deleted. Unlike `QuerySet.delete()`, rows are neither loaded nor cascaded and no
+    signals are sent, so the caller keeps the derived totals in line and deletes dependent rows.
+    """
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    meta = queryset.model._meta
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} IN ({sql})', params)
+        return cursor.rowcount
+
+
+def _rollup_kind(model):
+    return MonthlyCategoryTotal.EXPENSE if model is Expense else MonthlyCategoryTotal.INCOME
+
+
+def _monthly_groups(rows):
+    """
+    Returns the amount and count of `rows` per category and month, computed in one grouped query.
+    """
+    return (
+        rows.order_by()
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('category_id', 'year', 'month')
+        .annotate(amount=Sum('amount'), count=Count('pk'))
+    )
+
+
+def _selected(model, user_id, ids):
+    """
+    Locks the rows of `model` among `ids` that belong to the user and returns them as a queryset
+    filtered by primary key, so the totals taken out match exactly the rows that are then written.
+    """
+    locked = list(model.objects.filter(user_id=user_id, pk__in=ids).select_for_update().values_list('pk', flat=True))
+    return model.objects.filter(pk__in=locked), len(locked)
+
+
+def update_transactions(user_id, model, ids, category_id=None, day=None):
+    """
+    Moves the user's expenses or incomes among `ids` to another category and/or date with a single
+    `update()` and returns how many rows changed. Ids of other users' rows are ignored.
+
+    `update()` sends no signals, so the monthly rollup is adjusted per affected category and month,
+    the daily running totals are rebuilt from the earliest affected date and the user's cached
+    summaries are invalidated.
+    """
+    changes = {}
+    if category_id is not None:
+        changes['category_id'] = category_id
+    if day is not None:
+        changes['date'] = day
+    if not changes:
+        return 0
+    kind = _rollup_kind(model)
+    with transaction.atomic():
+        rows, count = _selected(model, user_id, ids)
+        if not count:
+            return 0
+        groups = list(_monthly_groups(rows))
+        since = rows.aggregate(since=Min('date'))['since']
+        rows.update(**changes)
+
+        for group in groups:
+            month = date(group['year'], group['month'], 1)
+            MonthlyCategoryTotal.adjust(user_id, group['category_id'], kind, month, -group['amount'], -group['count'])
+            MonthlyCategoryTotal.adjust(
+                user_id, changes.get('category_id', group['category_id']), kind, day or month, group['amount'], group['count']
+            )
+        if day is not None:
+            DailyBalance.rebuild(user_id, since=min(since, day))
+        transaction.on_commit(lambda: bump_data_version(user_id))
+    return count
+
+
+def delete_transactions(user_id, model, ids):
+    """
+    Deletes the user's expenses or incomes among `ids` with a single DELETE and returns how many
+    rows were deleted, taking them out of the monthly rollup, the daily running totals and the
+    user's cached summaries. Ids of other users' rows are ignored.
+
+    `QuerySet.delete()` would load every row to send the signals that maintain those totals one
+    row at a time; nothing references transactions, so `delete_rows` issues a plain DELETE.
+    """
+    kind = _rollup_kind(model)
+    with transaction.atomic():
+        rows, count = _selected(model, user_id, ids)
+        if not count:
+            return 0
+        groups = list(_monthly_groups(rows))
+        since = rows.aggregate(since=Min('date'))['since']
+        delete_rows(rows)
+
+        for group in groups:
+            month = date(group['year'], group['month'], 1)
+            MonthlyCategoryTotal.adjust(user_id, group['category_id'], kind, month, -group['amount'], -group['count'])
+        DailyBalance.rebuild(user_id, since=since)
+        transaction.on_commit(lambda: bump_data_version(user_id))
+    return count
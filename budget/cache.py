@@ -0,0 +1,138 @@
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'budget:data-version:{user_id}'
+STATS_KEY = 'budget:cache-stats:{name}:{outcome}'
+
+
+GOALS_VERSION_KEY = 'budget:goals-version'
+
+
+def current_version(key):
+    """
+    Returns the version stored under `key`, starting a new one if the cache has none.
+
+    New versions start at the current time in nanoseconds rather than at 1, so a version key that
+    was evicted can never come back with a number that old cache entries are still stored under.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def data_version(user_id):
+    """
+    Returns the current data version of a user, starting a new one if the cache has none.
+    """
+    return current_version(VERSION_KEY.format(user_id=user_id))
+
+
+def bump_data_version(user_id):
+    """
+    Moves a user to a new data version. Every cache entry computed for the previous version
+    becomes unreachable at once and simply expires, so nothing has to be scanned or deleted.
+    """
+    bump_version(VERSION_KEY.format(user_id=user_id))
+
+
+def goals_version():
+    """
+    Returns the version of the goals of all users, which changes whenever any goal or contribution
+    does. The goals view lists other users' goals, which a user's own data version does not cover.
+    """
+    return current_version(GOALS_VERSION_KEY)
+
+
+def bump_goals_version():
+    bump_version(GOALS_VERSION_KEY)
+
+
+def _record(name, outcome):
+    # `add` only creates a missing counter, so no increment of a concurrent request is overwritten.
+    key = STATS_KEY.format(name=name, outcome=outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted right after it was added; the count is lost either way.
+        pass
+
+
+def cache_stats(names=('dashboard', 'budgets')):
+    """
+    Returns the hit and miss counts of the per-user caches, e.g. ``{'dashboard': {'hits': 3, 'misses': 1}}``.
+
+    The counters live in the cache itself, so they are shared by every worker using it. Redis and
+    Memcached increment them atomically. The default database cache implements `incr` as a read
+    followed by a write, so under concurrent requests its counts are a lower bound; every hit or
+    miss there also costs two queries on the cache table.
+    """
+    keys = {
+        (name, outcome): STATS_KEY.format(name=name, outcome=outcome)
+        for name in names for outcome in ('hits', 'misses')
+    }
+    values = cache.get_many(keys.values())
+    stats = {name: {'hits': 0, 'misses': 0} for name in names}
+    for (name, outcome), key in keys.items():
+        stats[name][outcome] = values.get(key, 0)
+    return stats
+
+
+def _cache_key(user_id, name, key_parts):
+    return ':'.join(['budget', name, str(user_id), str(data_version(user_id)), *map(str, key_parts)])
+
+
+def get_or_compute(user_id, name, compute, *key_parts):
+    """
+    Returns the value cached for `user_id` under `name` and `key_parts` at the user's current
+    data version, calling `compute()` and storing its result on a miss.
+
+    Reading the data version and the entry are cache reads; with the default database cache they
+    are primary-key SELECTs on the cache table, which replace the summary's aggregate queries.
+    """
+    key = _cache_key(user_id, name, key_parts)
+    value = cache.get(key)
+    if value is not None:
+        _record(name, 'hits')
+        logger.debug('Cache hit for %s', key)
+        return value
+
+    _record(name, 'misses')
+    logger.debug('Cache miss for %s', key)
+    value = compute()
+    cache.set(key, value, timeout=getattr(settings, 'BUDGET_CACHE_TIMEOUT', 300))
+    return value
+
+
+async def aget_or_compute(user_id, name, compute, *key_parts, cacheable=None):
+    """
+    Async version of `get_or_compute`, where `compute()` returns an awaitable. When `cacheable`
+    is given, a computed value is only stored if ``cacheable(value)`` is true.
+    """
+    key = await sync_to_async(_cache_key)(user_id, name, key_parts)
+    value = await cache.aget(key)
+    if value is not None:
+        await sync_to_async(_record)(name, 'hits')
+        logger.debug('Cache hit for %s', key)
+        return value
+
+    await sync_to_async(_record)(name, 'misses')
+    logger.debug('Cache miss for %s', key)
+    value = await compute()
+    if cacheable is None or cacheable(value):
+        await cache.aset(key, value, timeout=getattr(settings, 'BUDGET_CACHE_TIMEOUT', 300))
+    return value
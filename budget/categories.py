@@ -0,0 +1,73 @@
+import threading
+from .cache import bump_version, current_version
+from .models import Category
+
+VERSION_KEY = 'budget:category-version'
+
+
+def category_version():
+    """
+    Returns the current version of the category table, starting a new one if the cache has none.
+    """
+    return current_version(VERSION_KEY)
+
+
+def bump_category_version():
+    """
+    Tells every process that the categories changed, so each reloads them on its next lookup.
+    """
+    bump_version(VERSION_KEY)
+
+
+class CategoryRegistry:
+    """
+    In-process copy of the `Category` table, which is small and rarely changes.
+
+    The categories are loaded with one query and kept until the category version in the shared
+    cache changes, which `signals.invalidate_categories` does whenever a category is saved or
+    deleted. Every lookup reads that version instead of the categories: a round trip to Redis,
+    or a primary-key SELECT on the cache table with the default database cache. All workers
+    using the same cache reload after a change.
+
+    The returned `Category` objects are shared between requests and must not be modified.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_pk = {}
+
+    def _categories(self):
+        version = category_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._by_pk = {category.pk: category for category in Category.objects.order_by('pk')}
+                    self._version = version
+        return self._by_pk
+
+    def all(self):
+        return list(self._categories().values())
+
+    def get(self, pk):
+        """
+        Returns the category with this primary key, or None if there is none.
+        """
+        return self._categories().get(pk)
+
+    def choices(self):
+        return [(category.pk, category.name) for category in self.all()]
+
+    def attach(self, items):
+        """
+        Sets `category` on every transaction of `items` from the registry, so templates can use
+        `transaction.category` without a join or a query per row. Returns `items`.
+        """
+        by_pk = self._categories()
+        for item in items:
+            category = by_pk.get(item.category_id)
+            if category is not None:
+                item.category = category
+        return items
+
+
+categories = CategoryRegistry()
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose entries only exist in the process that wrote them.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warns when the default cache is not shared between processes. The data versions, the
+    category version and the cache statistics are kept in it, so with several workers a write
+    handled by one of them would leave the others serving stale summaries, answering 304 to
+    stale pages and rejecting new categories.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f'The default cache ({backend}) is not shared between processes.',
+            hint=(
+                'Use a shared backend such as DatabaseCache or RedisCache whenever more than one '
+                'worker process serves the site, or silence budget.W001 for a single process.'
+            ),
+            id='budget.W001',
+        )
+    ]
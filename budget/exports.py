@@ -0,0 +1,46 @@
+import heapq
+from django.conf import settings
+from .categories import categories
+from .models import Expense, Income
+
+LEDGER_HEADER = ['date', 'type', 'name', 'category', 'amount']
+
+
+def ledger_filters(start_date=None, end_date=None, category=None):
+    """
+    Returns the queryset filters selecting the transactions of an export.
+    """
+    filters = {}
+    if start_date:
+        filters['date__gte'] = start_date
+    if end_date:
+        filters['date__lte'] = end_date
+    if category is not None:
+        filters['category_id'] = category
+    return filters
+
+
+def ledger_rows(user_id, start_date=None, end_date=None, category=None):
+    """
+    Yields the CSV rows of the user's ledger of expenses and incomes ordered by date, header first.
+
+    Expenses and incomes are read with `QuerySet.iterator()` in chunks of `EXPORT_CHUNK_SIZE` rows
+    and merged lazily, so memory stays flat however many transactions the user has. Category names
+    come from the in-process category registry.
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    category_names = dict(categories.choices())
+    filters = ledger_filters(start_date, end_date, category)
+
+    def ledger(model, kind):
+        rows = (
+            model.objects.filter(user_id=user_id, **filters)
+            .order_by('date', 'pk')
+            .values_list('date', 'pk', 'name', 'category_id', 'amount')
+        )
+        for day, pk, name, category_id, amount in rows.iterator(chunk_size=chunk_size):
+            yield day, kind, pk, name, category_names.get(category_id), amount
+
+    yield LEDGER_HEADER
+    for day, kind, _, name, category_name, amount in heapq.merge(ledger(Expense, 'expense'), ledger(Income, 'income')):
+        yield [day.isoformat(), kind, name, category_name, amount]
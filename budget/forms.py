@@ -1,8 +1,71 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from .categories import categories
 from .models import Income, Expense, Goal, Contribution
 
+
+def validate_transaction_amount(amount):
+    """
+    Validates that an income or expense amount is positive.
+
+    Returns:
+        amount (Decimal): The valid amount.
+
+    Raises:
+        forms.ValidationError: If the amount is less than or equal to 0.
+    """
+    if amount <= 0:
+        raise forms.ValidationError("Amount must be a positive number.")
+    return amount
+
+class CategoryChoiceField(forms.ChoiceField):
+    """
+    Select field for a transaction's category, with its options and validation served from the
+    in-process category registry, which only reads the category version from the cache, instead
+    of loading the categories on every render.
+    Cleans to a `Category` instance, like the `ModelChoiceField` it replaces.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(choices=self.category_choices, **kwargs)
+
+    @staticmethod
+    def category_choices():
+        return [('', '---------'), *categories.choices()]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            category = categories.get(int(value))
+        except (TypeError, ValueError):
+            category = None
+        if category is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+        return category
+
+    def validate(self, value):
+        # The choice was already checked against the registry in `to_python`.
+        forms.Field.validate(self, value)
+
+
+class CategoryFromRegistryMixin:
+    """
+    Leaves the category out of the model validation of a `ModelForm`, which would query the
+    database to check that it exists; `CategoryChoiceField` has already checked it against the
+    registry. This keeps validating a batch of transactions free of per-item queries.
+
+    Only for forms whose caller handles the `IntegrityError` raised when a category was deleted
+    after the registry was loaded, like the batch API; the HTML forms keep the existence check.
+    """
+    def _get_validation_exclusions(self):
+        exclusions = super()._get_validation_exclusions()
+        exclusions.add('category')
+        return exclusions
+
+
 class UserRegisterForm(UserCreationForm):
     """
     Form used for user registration, extending the default UserCreationForm.
@@ -28,6 +91,8 @@ class IncomeForm(forms.ModelForm):
     Form used to create or update an income transaction.
     Validates that the amount is a positive number.
     """
+    category = CategoryChoiceField()
+
     class Meta:
         model = Income
         fields = ('name', 'category', 'amount', 'date')
@@ -45,10 +110,7 @@ class IncomeForm(forms.ModelForm):
         Raises:
             forms.ValidationError: If the amount is less than or equal to 0.
         """
-        amount = self.cleaned_data.get('amount')
-        if amount <= 0:
-            raise forms.ValidationError("Amount must be a positive number.")
-        return amount
+        return validate_transaction_amount(self.cleaned_data.get('amount'))
 
 
 class ExpenseForm(forms.ModelForm):
@@ -56,6 +118,8 @@ class ExpenseForm(forms.ModelForm):
     Form used to create or update an expense transaction.
     Validates that the amount is a positive number.
     """
+    category = CategoryChoiceField()
+
     class Meta:
         model = Expense
         fields = ('name', 'category', 'amount', 'date')
@@ -73,10 +137,89 @@ class ExpenseForm(forms.ModelForm):
         Raises:
             forms.ValidationError: If the amount is less than or equal to 0.
         """
-        amount = self.cleaned_data.get('amount')
-        if amount <= 0:
-            raise forms.ValidationError("Amount must be a positive number.")
-        return amount
+        return validate_transaction_amount(self.cleaned_data.get('amount'))
+
+
+class BatchIncomeForm(CategoryFromRegistryMixin, IncomeForm):
+    """
+    `IncomeForm` for one item of the batch creation API, whose category is checked against the
+    category registry rather than loaded from its table for each item.
+    """
+
+
+class BatchExpenseForm(CategoryFromRegistryMixin, ExpenseForm):
+    """
+    `ExpenseForm` for one item of the batch creation API, checked against the category registry
+    like `BatchIncomeForm`.
+    """
+
+
+class TransactionImportForm(forms.Form):
+    """
+    Form used to validate one row of a transaction import without touching the database.
+    Applies the same field limits as `IncomeForm`/`ExpenseForm` and the same amount rule.
+    The category is validated by name, so it can be resolved or created by the importer.
+    """
+    TYPE_CHOICES = [('expense', 'Expense'), ('income', 'Income')]
+
+    type = forms.ChoiceField(choices=TYPE_CHOICES)
+    name = forms.CharField(max_length=128)
+    category = forms.CharField(max_length=128)
+    amount = forms.DecimalField(max_digits=21, decimal_places=2)
+    date = forms.DateField()
+
+    def clean_amount(self):
+        """
+        Validates that the transaction amount is positive.
+        """
+        return validate_transaction_amount(self.cleaned_data.get('amount'))
+
+
+class IdListField(forms.Field):
+    """
+    Field for a list of primary keys, submitted as repeated values such as checkboxes.
+    """
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return [int(pk) for pk in value]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Enter a list of ids.', code='invalid')
+
+
+class TransactionBulkForm(forms.Form):
+    """
+    Form used to apply one action to many of the user's expenses and incomes at once: moving them
+    to another category, moving them to another date, or deleting them.
+    The selected rows arrive as the `expenses` and `incomes` id lists.
+    """
+    ACTION_CHOICES = [('recategorize', 'Change category'), ('redate', 'Change date'), ('delete', 'Delete')]
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    category = CategoryChoiceField(required=False)
+    date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    expenses = IdListField(required=False)
+    incomes = IdListField(required=False)
+
+    def clean(self):
+        """
+        Validates that at least one transaction is selected and that the value the action needs is given.
+
+        Raises:
+            forms.ValidationError: If nothing is selected, or the category or date is missing.
+        """
+        cleaned_data = super().clean()
+        if not cleaned_data.get('expenses') and not cleaned_data.get('incomes'):
+            raise forms.ValidationError('Select at least one transaction.')
+        action = cleaned_data.get('action')
+        if action == 'recategorize' and not cleaned_data.get('category'):
+            self.add_error('category', 'Choose the new category.')
+        if action == 'redate' and not cleaned_data.get('date'):
+            self.add_error('date', 'Choose the new date.')
+        return cleaned_data
 
 
 class GoalForm(forms.ModelForm):
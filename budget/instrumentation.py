@@ -0,0 +1,146 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+_context_wrapper = ContextVar('budget_context_wrapper', default=None)
+
+
+def fingerprint(sql):
+    """
+    Normalises a statement so that repetitions of the same query with different parameters compare
+    equal: literals and placeholders lists of any length are collapsed and whitespace is squashed.
+    """
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERAL.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+@contextmanager
+def _wrapping_connections(wrapper):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that records every statement with its parameters and duration.
+    Unlike `connection.queries` it does not depend on DEBUG, so it can run in production.
+
+    Usage:
+        recorder = QueryRecorder()
+        with recorder.record():
+            ...
+        recorder.count, recorder.total_time, recorder.slowest, recorder.duplicates()
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': params,
+                'time': time.perf_counter() - start,
+                'alias': context['connection'].alias,
+            })
+
+    @contextmanager
+    def record(self):
+        """
+        Installs the recorder on every configured database connection for the duration of the block.
+        """
+        with _wrapping_connections(self):
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query['time'] for query in self.queries)
+
+    @property
+    def slowest(self):
+        return max(self.queries, key=lambda query: query['time'], default=None)
+
+    def duplicates(self):
+        """
+        Returns ``{fingerprint: count}`` of the statements that ran more than once, most repeated first.
+        """
+        counts = Counter(fingerprint(query['sql']) for query in self.queries)
+        return {sql: count for sql, count in counts.most_common() if count > 1}
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that only counts statements, cheap enough to run on every request.
+
+    Usage:
+        counter = QueryCounter()
+        with counter.record():
+            ...
+        counter.count
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def record(self):
+        with _wrapping_connections(self):
+            yield self
+
+
+def _wrap_in_context(execute, sql, params, many, context):
+    wrapper = _context_wrapper.get()
+    if wrapper is None:
+        return execute(sql, params, many, context)
+    return wrapper(execute, sql, params, many, context)
+
+
+def _install_context_wrapper(connection, **kwargs):
+    # Inserted first, because `execute_wrapper` blocks open at this point remove their wrapper
+    # by popping the last one.
+    if _wrap_in_context not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _wrap_in_context)
+
+
+def install_context_wrapping():
+    """
+    Prepares every connection, of this thread now and of any thread once it connects, for
+    `wrapping_context`. Connections pay one context variable lookup per statement.
+    """
+    connection_created.connect(_install_context_wrapper, dispatch_uid='budget.instrumentation.context')
+    for connection in connections.all():
+        _install_context_wrapper(connection)
+
+
+@contextmanager
+def wrapping_context(wrapper):
+    """
+    Applies the execute wrapper to the statements run in the current context for the duration of
+    the block, on whichever thread they run: code run with `sync_to_async` or `async_to_sync`
+    inherits the context, while concurrent requests have contexts of their own.
+    Only connections prepared by `install_context_wrapping` are covered.
+    """
+    token = _context_wrapper.set(wrapper)
+    try:
+        yield wrapper
+    finally:
+        _context_wrapper.reset(token)
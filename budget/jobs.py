@@ -0,0 +1,219 @@
+import csv
+import logging
+import tempfile
+import traceback
+from datetime import date, timedelta
+from io import StringIO
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+from .exports import ledger_filters, ledger_rows
+from .models import Expense, Income, Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def register(kind, max_attempts=None):
+    """
+    Decorator registering the function run for jobs of `kind`. It is called with the job and a
+    `Progress` and returns the JSON-serializable result of the job.
+
+    `max_attempts` overrides `JOB_MAX_ATTEMPTS` for handlers that must not run twice, e.g.
+    because a failed attempt may already have committed part of its work.
+    """
+    def decorator(func):
+        _handlers[kind] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(kind, user=None, payload=None, run_after=None):
+    """
+    Queues a job of a registered `kind` and returns it. The job runs once a worker is free.
+    """
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    max_attempts = _handlers[kind][1] or getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+    return Job.objects.create(
+        kind=kind, user=user, payload=payload or {}, max_attempts=max_attempts, run_after=run_after or now(),
+    )
+
+
+def retry_delay(attempts):
+    """
+    Returns how long to wait before running a job again after its `attempts`-th failed attempt:
+    `JOB_RETRY_DELAY` seconds, doubled after every further failure up to `JOB_RETRY_MAX_DELAY`.
+    """
+    base = getattr(settings, 'JOB_RETRY_DELAY', 30)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600)))
+
+
+def claim(worker, limit=1):
+    """
+    Marks up to `limit` runnable jobs as running on `worker` and returns them, oldest first.
+
+    Runnable are queued jobs that are due and running jobs whose heartbeat is older than
+    `JOB_STALE_SECONDS`, whose worker is assumed to have died. The rows are locked with
+    ``FOR UPDATE SKIP LOCKED``, so concurrent workers each claim different jobs without waiting
+    on one another. Databases without row locks, like SQLite, serialize the claims instead.
+    """
+    current = now()
+    stale = current - timedelta(seconds=getattr(settings, 'JOB_STALE_SECONDS', 600))
+    with transaction.atomic():
+        ids = list(
+            Job.objects.filter(
+                Q(status=Job.QUEUED, run_after__lte=current) | Q(status=Job.RUNNING, heartbeat_at__lt=stale)
+            )
+            .order_by('run_after', 'pk')
+            .select_for_update(skip_locked=True)
+            .values_list('pk', flat=True)[:limit]
+        )
+        Job.objects.filter(pk__in=ids).update(
+            status=Job.RUNNING, worker=worker, attempts=F('attempts') + 1,
+            started_at=current, heartbeat_at=current, error='',
+        )
+    return list(Job.objects.filter(pk__in=ids).order_by('run_after', 'pk'))
+
+
+def heartbeat(worker, job_ids):
+    """
+    Tells other workers that `worker` is still running these jobs.
+    """
+    Job.objects.filter(pk__in=job_ids, worker=worker, status=Job.RUNNING).update(heartbeat_at=now())
+
+
+class Progress:
+    """
+    Passed to job handlers to report how far they got; each call is one UPDATE of the job row,
+    so handlers report per chunk of work rather than per item.
+    """
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, done, total=None, message=None):
+        changes = {'progress_done': done, 'heartbeat_at': now()}
+        if total is not None:
+            changes['progress_total'] = total
+        if message is not None:
+            changes['message'] = message[:255]
+        Job.objects.filter(pk=self.job.pk, worker=self.job.worker).update(**changes)
+
+
+def run(job):
+    """
+    Runs a claimed job and records its outcome: the result when it succeeds, otherwise the error,
+    and the job is queued again after `retry_delay` unless it used up its attempts.
+    Returns the job's new status.
+    """
+    mine = Job.objects.filter(pk=job.pk, worker=job.worker, status=Job.RUNNING)
+    handler = _handlers.get(job.kind, (None, None))[0]
+    if job.attempts > job.max_attempts or handler is None:
+        error = f'Unknown job kind: {job.kind}' if handler is None else 'Worker stopped while running the job.'
+        mine.update(status=Job.FAILED, error=error, finished_at=now())
+        return Job.FAILED
+
+    try:
+        result = handler(job, Progress(job))
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            mine.update(status=Job.QUEUED, error=error, run_after=now() + retry_delay(job.attempts))
+            return Job.QUEUED
+        mine.update(status=Job.FAILED, error=error, finished_at=now())
+        return Job.FAILED
+    mine.update(status=Job.SUCCEEDED, result=result, finished_at=now(), heartbeat_at=now())
+    return Job.SUCCEEDED
+
+
+def _optional_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+@register('export_transactions')
+def export_transactions(job, progress):
+    """
+    Writes the user's ledger, optionally limited by the `start_date`, `end_date` and `category`
+    of the payload, to a CSV file in the default storage, with the same rows as the streamed export.
+    """
+    start_date = _optional_date(job.payload.get('start_date'))
+    end_date = _optional_date(job.payload.get('end_date'))
+    category = job.payload.get('category')
+    filters = ledger_filters(start_date, end_date, category)
+    total = sum(model.objects.filter(user_id=job.user_id, **filters).count() for model in (Expense, Income))
+    progress(0, total)
+
+    step = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        for done, row in enumerate(ledger_rows(job.user_id, start_date, end_date, category)):
+            writer.writerow(row)
+            if done and done % step == 0:
+                progress(done)
+        progress(total)
+        output.seek(0)
+        name = default_storage.save(f'exports/{job.user_id}/transactions-{job.pk}.csv', File(output))
+    return {'file': name, 'rows': total}
+
+
+def expire_exports():
+    """
+    Deletes the files of exports that finished more than `EXPORT_RETENTION_HOURS` ago and drops
+    them from the job results, so their downloads answer 404. Returns the number of expired jobs.
+    """
+    cutoff = now() - timedelta(hours=getattr(settings, 'EXPORT_RETENTION_HOURS', 24))
+    expired = Job.objects.filter(
+        kind='export_transactions', status=Job.SUCCEEDED, finished_at__lt=cutoff, result__has_key='file',
+    )
+    count = 0
+    for job in expired.only('pk', 'result').iterator():
+        result = dict(job.result)
+        default_storage.delete(result.pop('file'))
+        result['expired'] = True
+        Job.objects.filter(pk=job.pk).update(result=result)
+        count += 1
+    return count
+
+
+def _rebuild(command, job, progress):
+    users = job.payload.get('users') or ([job.user_id] if job.user_id else [])
+    output = StringIO()
+    progress(0, 1, f'Running {command}')
+    call_command(command, *[f'--user={user}' for user in users], stdout=output)
+    progress(1)
+    return {'output': output.getvalue().strip()}
+
+
+@register('rebuild_monthly_totals')
+def rebuild_monthly_totals(job, progress):
+    """
+    Rebuilds the monthly rollup of the job's user, of the `users` in the payload, or of everyone.
+    """
+    return _rebuild('rebuild_monthly_totals', job, progress)
+
+
+@register('rebuild_daily_balances')
+def rebuild_daily_balances(job, progress):
+    """
+    Rebuilds the daily running totals of the job's user, of the `users` in the payload, or of everyone.
+    """
+    return _rebuild('rebuild_daily_balances', job, progress)
+
+
+@register('import_transactions', max_attempts=1)
+def import_transactions(job, progress):
+    """
+    Imports the CSV file at the `path` of the payload for the job's user. Every batch is committed
+    on its own, so a failed import is not retried, which would insert the earlier batches twice.
+    """
+    output = StringIO()
+    progress(0, 1, 'Importing')
+    call_command('import_transactions', job.payload['path'], username=job.user.username, stdout=output, stderr=output)
+    progress(1)
+    return {'output': output.getvalue().strip()}
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from budget import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Compares the wall-clock latency of the sync and the async dashboard, with a simulated delay
+    added to every SQL statement to stand in for a database on another host. Cached summaries
+    are invalidated before every request, so both views compute every section.
+
+    Without --username, the user is chosen by `benchmark.benchmark_user`.
+
+    Usage:
+        python manage.py benchmark_dashboard --latency-ms 5 --requests 50
+        python manage.py benchmark_dashboard --username alice --latency-ms 20
+    """
+    help = 'Compares the latency of the sync and async dashboard views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User whose dashboard is rendered.')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per view.')
+        parser.add_argument('--latency-ms', type=float, default=5, help='Delay added to every SQL statement.')
+
+    def handle(self, *args, **options):
+        user = benchmark.benchmark_user(options['username'])
+        results = benchmark.time_dashboards(user, requests=options['requests'], latency=options['latency_ms'] / 1000)
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<6} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  mean {result['mean_ms']:>9.2f} ms"
+            )
+        speedup = results['sync']['p50_ms'] / results['async']['p50_ms'] if results['async']['p50_ms'] else 0
+        self.stdout.write(self.style.SUCCESS(f'Async p50 is {speedup:.2f}x faster than sync.'))
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand
+from budget import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Times every URL of `budget/urls.py` at several dataset sizes and writes p50/p95 latency and
+    query counts to a JSON file, so runs can be compared. For each size the benchmark data is
+    cleared and reseeded, then every URL is requested as the heaviest benchmark user.
+
+    Meant for a dedicated benchmark database: it deletes and recreates the 'bench_' users.
+
+    Usage:
+        python manage.py benchmark_views --sizes 1000,10000,100000 --output bench.json
+        python manage.py benchmark_views --sizes 10000 --requests 50 --cold
+    """
+    help = 'Benchmarks the budget views at several data sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated total transaction counts.')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per URL and size.')
+        parser.add_argument('--users', type=int, default=50, help='Number of users seeded per size.')
+        parser.add_argument('--years', type=int, default=5, help='Years of history seeded per size.')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of the per-user distribution.')
+        parser.add_argument('--cold', action='store_true', help='Invalidate cached summaries before every request.')
+        parser.add_argument('--output', default='bench_output.json', help='JSON file the results are written to.')
+
+    def handle(self, *args, **options):
+        runs = []
+        for size in (int(size) for size in options['sizes'].split(',')):
+            benchmark.clear()
+            users = benchmark.seed(
+                users=options['users'],
+                transactions=size,
+                contributions=max(size // 50, 10),
+                years=options['years'],
+                skew=options['skew'],
+            )
+            heavy = users[0]
+            results = benchmark.time_urls(heavy, requests=options['requests'], cold=options['cold'])
+            runs.append({
+                'transactions': size,
+                'heavy_user_transactions': heavy.expense_set.count() + heavy.income_set.count(),
+                'urls': results,
+            })
+            self.stdout.write(f'{size} transactions:')
+            for name, result in results.items():
+                self.stdout.write(
+                    f"  {name:<20} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                    f"{result['queries']:>4} queries  [{result['status']}]"
+                )
+        benchmark.clear()
+
+        with open(options['output'], 'w') as output:
+            json.dump({
+                'generated_at': datetime.now(timezone.utc).isoformat(),
+                'requests': options['requests'],
+                'cold': options['cold'],
+                'runs': runs,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
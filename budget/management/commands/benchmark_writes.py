@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from budget import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Compares the write throughput of the `add_expense` form, one POST per transaction, with the
+    batch creation API. Both paths create `--count` expenses for the user, which are kept.
+
+    Without --username, the user is chosen by `benchmark.benchmark_user`.
+
+    Usage:
+        python manage.py benchmark_writes --count 500 --batch-size 100
+        python manage.py benchmark_writes --username alice --count 200
+    """
+    help = 'Compares transaction creation throughput of the form and the batch API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User the expenses are created for.')
+        parser.add_argument('--count', type=int, default=200, help='Expenses created through each path.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Expenses per API request.')
+
+    def handle(self, *args, **options):
+        user = benchmark.benchmark_user(options['username'])
+        results = benchmark.time_transaction_writes(user, count=options['count'], batch_size=options['batch_size'])
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<5} {result['rows']} rows in {result['requests']} request(s), "
+                f"{result['seconds']:.2f} s, {result['rows_per_s']:.1f} rows/s"
+            )
+        speedup = results['api']['rows_per_s'] / results['form']['rows_per_s']
+        self.stdout.write(self.style.SUCCESS(f'The batch API is {speedup:.1f}x faster than the form.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from budget.cache import cache_stats
+
+
+class Command(BaseCommand):
+    """
+    Prints the hit and miss counts of the per-user dashboard and budget caches.
+
+    Usage:
+        python manage.py cache_stats
+    """
+    help = 'Shows hit and miss counts of the per-user summary caches.'
+
+    def handle(self, *args, **options):
+        for name, counts in cache_stats().items():
+            lookups = counts['hits'] + counts['misses']
+            ratio = counts['hits'] / lookups * 100 if lookups else 0
+            self.stdout.write(f"{name}: {counts['hits']} hits, {counts['misses']} misses ({ratio:.1f}% hit ratio)")
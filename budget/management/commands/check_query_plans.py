@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from budget.query_plans import ALLOWED_SCANS, check_view_plans
+
+
+class Command(BaseCommand):
+    """
+    Explains the queries of the read views for one user and fails if any of them needs a sequential scan.
+    Run it against a seeded database to catch missing indexes before they reach production.
+
+    Usage:
+        python manage.py check_query_plans --username alice
+        python manage.py check_query_plans --username alice --allow-table budget_income
+    """
+    help = 'Fails if a query issued by a read view falls back to a sequential scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User whose views are requested.')
+        parser.add_argument('--allow-table', action='append', default=[], help='Table allowed to be scanned (repeatable).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        problems = check_view_plans(user, allowed=ALLOWED_SCANS | set(options['allow_table']))
+        for url, sql, tables in problems:
+            self.stderr.write(f"{url}: sequential scan on {', '.join(sorted(tables))}\n    {sql}")
+        if problems:
+            raise CommandError(f'{len(problems)} query(ies) fall back to a sequential scan.')
+        self.stdout.write(self.style.SUCCESS('All view queries use indexes.'))
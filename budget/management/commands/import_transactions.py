@@ -0,0 +1,117 @@
+import csv
+import sys
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from budget.bulk import create_transactions
+from budget.cache import bump_data_version
+from budget.forms import TransactionImportForm
+from budget.models import Category, DailyBalance, Expense, Income
+
+
+class Command(BaseCommand):
+    """
+    Imports expenses and incomes for one user from a CSV file with the columns
+    ``date,type,name,category,amount`` (the format produced by the CSV export).
+
+    Rows are read one at a time, validated with `TransactionImportForm` and inserted with
+    `bulk_create` in batches, each batch in its own transaction. Unknown categories are created.
+    Invalid rows are reported and skipped without aborting the rest of the file. The daily running
+    totals are rebuilt once, from the earliest imported date, after the last batch, so an unsorted
+    file does not rebuild most of the user's history for every batch.
+
+    Usage:
+        python manage.py import_transactions --username alice ledger.csv
+        python manage.py import_transactions --username alice --batch-size 5000 - < ledger.csv
+    """
+    help = 'Bulk imports expenses and incomes of a user from a CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import, or '-' to read standard input.")
+        parser.add_argument('--username', required=True, help='User the transactions belong to.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows inserted per transaction.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        try:
+            self.user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        self.categories = {}
+        for pk, name in Category.objects.order_by('pk').values_list('pk', 'name'):
+            self.categories.setdefault(name, pk)
+
+        started = time.monotonic()
+        imported = 0
+        rejected = []
+        batch = {'expense': [], 'income': []}
+        self.since = None
+
+        source = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            with source:
+                for line, row in enumerate(csv.DictReader(source), start=2):
+                    form = TransactionImportForm(row)
+                    if not form.is_valid():
+                        rejected.append((line, form.errors.get_json_data()))
+                        continue
+
+                    data = form.cleaned_data
+                    model = Expense if data['type'] == 'expense' else Income
+                    batch[data['type']].append(model(
+                        user=self.user,
+                        name=data['name'],
+                        category_id=self.resolve_category(data['category']),
+                        amount=data['amount'],
+                        date=data['date'],
+                    ))
+                    if len(batch['expense']) + len(batch['income']) >= options['batch_size']:
+                        imported += self.flush(batch, options['batch_size'])
+                        self.report(imported, started)
+                imported += self.flush(batch, options['batch_size'])
+        finally:
+            # Also after a failure, so the batches committed so far are in the running totals.
+            if self.since is not None:
+                DailyBalance.rebuild(self.user.pk, since=self.since)
+                bump_data_version(self.user.pk)
+
+        for line, errors in rejected:
+            messages = '; '.join(f"{field}: {error['message']}" for field, items in errors.items() for error in items)
+            self.stderr.write(f'Line {line} rejected: {messages}')
+        self.report(imported, started, final=True)
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'{len(rejected)} row(s) rejected.'))
+
+    def resolve_category(self, name):
+        """
+        Returns the id of the category with this name, creating it on first use.
+        """
+        if name not in self.categories:
+            self.categories[name] = Category.objects.create(name=name).pk
+        return self.categories[name]
+
+    def flush(self, batch, batch_size):
+        """
+        Inserts the buffered rows in one transaction with `create_transactions`, which keeps the
+        monthly rollup and the user's cached summaries in line, and remembers their earliest date
+        for the rebuild of the running totals. Returns the number of rows.
+        """
+        count = len(batch['expense']) + len(batch['income'])
+        if not count:
+            return 0
+        create_transactions(
+            self.user.pk, batch['expense'], batch['income'], batch_size=batch_size, rebuild_balances=False,
+        )
+        earliest = min(item.date for item in batch['expense'] + batch['income'])
+        self.since = earliest if self.since is None else min(self.since, earliest)
+        batch['expense'], batch['income'] = [], []
+        return count
+
+    def report(self, imported, started, final=False):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        message = f'{imported} row(s) imported in {elapsed:.1f}s ({imported / elapsed:.0f} rows/s)'
+        if final:
+            self.stdout.write(self.style.SUCCESS(message))
+        elif self.verbosity > 1:
+            self.stdout.write(message)
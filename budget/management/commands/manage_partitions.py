@@ -0,0 +1,55 @@
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from budget import partitions, recompute
+
+
+class Command(BaseCommand):
+    """
+    Creates the upcoming yearly partitions of the expense and income tables and detaches the
+    partitions of years past the retention period. Meant to run regularly, e.g. daily from cron;
+    rows dated outside every partition land in the default partition until theirs is created.
+
+    Detached partitions are kept as plain tables named like `budget_expense_y2015`, without
+    foreign keys. Archived years are excluded from the derived tables as well: after detaching,
+    the monthly rollup and the daily balances of every user are recomputed from the remaining rows.
+
+    Usage:
+        python manage.py manage_partitions                     # create partitions up to TRANSACTION_PARTITION_YEARS_AHEAD
+        python manage.py manage_partitions --retain-years 7    # also detach partitions older than 7 years
+    """
+    help = 'Creates upcoming partitions of the transaction tables and detaches expired ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--years-ahead', type=int, default=settings.TRANSACTION_PARTITION_YEARS_AHEAD,
+            help='Number of years after the current one to create partitions for.',
+        )
+        parser.add_argument(
+            '--retain-years', type=int, default=settings.TRANSACTION_RETAIN_YEARS,
+            help='Detach partitions of years older than this many years; 0 keeps every year.',
+        )
+
+    def handle(self, *args, **options):
+        if options['years_ahead'] < 0 or options['retain_years'] < 0:
+            raise CommandError('--years-ahead and --retain-years must not be negative.')
+        if not partitions.is_supported(connection):
+            self.stdout.write(self.style.WARNING(
+                f'Partitioning needs PostgreSQL; {", ".join(partitions.PARTITIONED_TABLES)} stay plain tables.'
+            ))
+            return
+
+        created = partitions.ensure_partitions(connection, years_ahead=options['years_ahead'])
+        detached = []
+        if options['retain_years']:
+            detached = partitions.detach_partitions(connection, before_year=date.today().year - options['retain_years'])
+        for name in created:
+            self.stdout.write(f'Created {name}')
+        for name in detached:
+            self.stdout.write(f'Detached {name}')
+        if detached:
+            for shard in recompute.user_shards(1000):
+                recompute.recompute_shard(*shard, tasks=('monthly_totals', 'daily_balances'))
+            self.stdout.write('Recomputed the monthly rollup and the daily balances without the detached years.')
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} and detached {len(detached)} partition(s).'))
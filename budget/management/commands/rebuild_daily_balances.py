@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from budget.models import DailyBalance
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the `DailyBalance` running totals from the raw expenses and incomes.
+
+    Usage:
+        python manage.py rebuild_daily_balances            # repair the totals of every user
+        python manage.py rebuild_daily_balances --user 42  # repair the totals of selected users
+    """
+    help = 'Rebuilds the daily running totals of incomes and expenses from raw transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild this user id (repeatable).')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or User.objects.order_by('pk').values_list('pk', flat=True)
+        rebuilt = 0
+        for user_id in user_ids:
+            DailyBalance.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily balances of {rebuilt} user(s).'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from budget.cache import bump_data_version, bump_goals_version
+from budget.models import Goal
+
+
+class Command(BaseCommand):
+    """
+    Recomputes `Goal.current_amount` and `Goal.contribution_count` from the raw contributions.
+
+    Usage:
+        python manage.py rebuild_goal_totals          # fix every goal whose stored totals drifted
+        python manage.py rebuild_goal_totals --check  # only report drifted goals, exit with an error if any
+    """
+    help = 'Rebuilds or checks the stored contribution totals of goals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report mismatching goals without fixing them.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of goals updated per query.')
+
+    def handle(self, *args, **options):
+        goals = Goal.objects.annotate(
+            actual_amount=Sum('contribution__amount'),
+            actual_count=Count('contribution'),
+        ).order_by('pk')
+
+        with transaction.atomic():
+            drifted = []
+            for goal in goals.iterator(chunk_size=options['batch_size']):
+                actual_amount = goal.actual_amount or 0
+                if goal.current_amount != actual_amount or goal.contribution_count != goal.actual_count:
+                    self.stdout.write(
+                        f'Goal {goal.pk}: stored {goal.current_amount} ({goal.contribution_count}), '
+                        f'actual {actual_amount} ({goal.actual_count})'
+                    )
+                    goal.current_amount = actual_amount
+                    goal.contribution_count = goal.actual_count
+                    drifted.append(goal)
+
+            if options['check']:
+                if drifted:
+                    raise CommandError(f'{len(drifted)} goal(s) have drifted totals.')
+                self.stdout.write(self.style.SUCCESS('All goal totals are consistent.'))
+                return
+
+            Goal.objects.bulk_update(drifted, ['current_amount', 'contribution_count'], batch_size=options['batch_size'])
+            if drifted:
+                owners = {goal.owner_id for goal in drifted}
+                transaction.on_commit(lambda: [bump_data_version(owner) for owner in owners])
+                transaction.on_commit(bump_goals_version)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt totals of {len(drifted)} goal(s).'))
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from budget.recompute import recompute_shard
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the `MonthlyCategoryTotal` rollup from the raw expenses and incomes.
+
+    Each user is rebuilt in a transaction of its own, with the user and their rollup rows locked
+    before the transactions are summed (see `budget.recompute`), so writes made meanwhile are
+    kept and only one user's rows are held in memory at a time.
+
+    Usage:
+        python manage.py rebuild_monthly_totals            # rebuild the rollup of every user
+        python manage.py rebuild_monthly_totals --user 42  # rebuild the rollup of selected users
+    """
+    help = 'Rebuilds the monthly per-category totals from raw transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rollup rows written per query.')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or User.objects.order_by('pk').values_list('pk', flat=True).iterator()
+        rows = 0
+        for user_id in user_ids:
+            rows += recompute_shard(user_id, user_id + 1, tasks=('monthly_totals',), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} monthly total(s).'))
@@ -0,0 +1,129 @@
+import django
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from budget.cache import bump_goals_version
+from budget.recompute import TASKS, recompute_shard, user_shards
+
+
+class Command(BaseCommand):
+    """
+    Recomputes derived numbers of every user, e.g. after a change to how they are computed:
+    the monthly category rollup, the daily running totals and the stored goal progress.
+
+    Users are split into shards of consecutive ids, which a pool of processes recomputes in
+    parallel, each with its own database connection, from grouped queries and chunked bulk writes.
+    Every finished shard is recorded in the checkpoint file, so an interrupted or failed run
+    resumes with the shards still missing when started again with the same options. The file is
+    removed once every shard is done.
+
+    Usage:
+        python manage.py recompute_totals                            # everything, one process per CPU
+        python manage.py recompute_totals --task goal_totals --workers 8
+        python manage.py recompute_totals --fresh                    # ignore an existing checkpoint
+        python manage.py recompute_totals --workers 0                # run in this process
+    """
+    help = 'Recomputes derived totals of every user in parallel shards, resumably.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--task', action='append', dest='tasks', choices=TASKS,
+            help='Only recompute these numbers (repeatable). Default: all of them.',
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes; 0 runs in this process.')
+        parser.add_argument('--shard-size', type=int, default=1000, help='Number of user ids per shard.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows written per query.')
+        parser.add_argument(
+            '--checkpoint', default='recompute_totals.checkpoint.json',
+            help='File recording the finished shards of the current run.',
+        )
+        parser.add_argument('--fresh', action='store_true', help='Start over instead of resuming from the checkpoint.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0 or options['shard_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers must not be negative, --shard-size and --batch-size must be positive.')
+        tasks = [task for task in TASKS if task in (options['tasks'] or TASKS)]
+        self.checkpoint_path = options['checkpoint']
+        self.state = {'tasks': tasks, 'shard_size': options['shard_size'], 'done': [], 'rows': 0}
+        self.resume(options['fresh'])
+
+        finished = {tuple(shard) for shard in self.state['done']}
+        shards = [shard for shard in user_shards(options['shard_size']) if shard not in finished]
+        if finished:
+            self.stdout.write(f'Resuming: {len(finished)} shard(s) done, {len(shards)} to go.')
+
+        self.started = time.monotonic()
+        self.rows = 0
+        self.finished = 0
+        self.total = len(shards)
+        try:
+            if options['workers'] == 0:
+                for shard in shards:
+                    self.finish(shard, recompute_shard(*shard, tasks, options['batch_size']))
+            else:
+                self.run_pool(shards, tasks, options['workers'], options['batch_size'])
+        except KeyboardInterrupt:
+            raise CommandError(f'Interrupted; run again to resume from {self.checkpoint_path}.')
+        except Exception as exc:
+            raise CommandError(f'{exc!r}; run again to resume from {self.checkpoint_path}.') from exc
+
+        if 'goal_totals' in tasks:
+            bump_goals_version()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(self.progress(final=True)))
+
+    def run_pool(self, shards, tasks, workers, batch_size):
+        # Workers are spawned rather than forked, so no connection of this process is shared with
+        # them: each sets Django up and opens its own.
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            pending = {pool.submit(recompute_shard, *shard, tasks, batch_size): shard for shard in shards}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.finish(pending.pop(future), future.result())
+            except BaseException:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+
+    def resume(self, fresh):
+        """
+        Loads the finished shards from the checkpoint, unless `fresh` is set. A checkpoint written
+        with other tasks or another shard size cannot be resumed.
+        """
+        if fresh or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as checkpoint:
+            saved = json.load(checkpoint)
+        if saved['tasks'] != self.state['tasks'] or saved['shard_size'] != self.state['shard_size']:
+            raise CommandError(
+                f'{self.checkpoint_path} was written with --task {" ".join(saved["tasks"])} and '
+                f'--shard-size {saved["shard_size"]}; use the same options to resume, or --fresh.'
+            )
+        self.state = saved
+
+    def finish(self, shard, rows):
+        """
+        Records a finished shard in the checkpoint, replacing the file atomically, and reports progress.
+        """
+        self.rows += rows
+        self.finished += 1
+        self.state['done'].append(list(shard))
+        self.state['rows'] += rows
+        partial = f'{self.checkpoint_path}.tmp'
+        with open(partial, 'w') as checkpoint:
+            json.dump(self.state, checkpoint)
+        os.replace(partial, self.checkpoint_path)
+        self.stdout.write(self.progress())
+
+    def progress(self, final=False):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        message = f'{self.finished}/{self.total} shard(s), {self.rows} row(s) in {elapsed:.1f}s ({self.rows / elapsed:.0f} rows/s)'
+        return f'Recomputed {message}.' if final else message
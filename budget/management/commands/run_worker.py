@@ -0,0 +1,110 @@
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from budget import jobs
+
+# Seconds between two deletions of expired export files.
+EXPIRY_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    """
+    Runs queued background jobs, such as exports and rebuilds of derived totals, on a pool of
+    threads. Any number of workers may run side by side, on one or several hosts; each job is
+    claimed by exactly one of them.
+
+    Jobs spend their time waiting on the database or on storage, so threads run them
+    concurrently without the start-up cost of processes. Each thread uses its own database
+    connection. The main thread claims jobs as threads become free and keeps the heartbeat of
+    running jobs fresh, also while it waits for the running jobs after SIGTERM or Ctrl-C, when it
+    stops claiming. Once an hour it deletes the files of exports older than `EXPORT_RETENTION_HOURS`.
+
+    Usage:
+        python manage.py run_worker                  # run jobs until stopped
+        python manage.py run_worker --concurrency 4  # run up to 4 jobs at a time
+        python manage.py run_worker --burst          # exit once no job is runnable
+    """
+    help = 'Runs queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=getattr(settings, 'JOB_WORKER_CONCURRENCY', 2),
+            help='Number of jobs run at the same time.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=getattr(settings, 'JOB_POLL_INTERVAL', 2),
+            help='Seconds between looks for new jobs while the queue is empty.',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is runnable.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        self.worker = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: self.stopping.set())
+
+        counts = {}
+        running = {}
+        next_expiry = time.monotonic()
+        self.stdout.write(f'Worker {self.worker} started with {options["concurrency"]} thread(s).')
+        with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='job') as pool:
+            try:
+                while not self.stopping.is_set():
+                    if time.monotonic() >= next_expiry:
+                        self.expire_exports()
+                        next_expiry = time.monotonic() + EXPIRY_INTERVAL
+                    free = options['concurrency'] - len(running)
+                    if free:
+                        for job in jobs.claim(self.worker, limit=free):
+                            running[pool.submit(self.run_job, job)] = job.pk
+                    if not running:
+                        if options['burst']:
+                            break
+                        self.stopping.wait(options['poll_interval'])
+                        continue
+                    finished, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self.count(counts, future.result())
+                        del running[future]
+                    jobs.heartbeat(self.worker, list(running.values()))
+            except KeyboardInterrupt:
+                self.stopping.set()
+            finally:
+                if running:
+                    self.stdout.write('Waiting for the running jobs to finish.')
+                while running:
+                    finished, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self.count(counts, future.result())
+                        del running[future]
+                    jobs.heartbeat(self.worker, list(running.values()))
+                connection.close()
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'no jobs'
+        self.stdout.write(self.style.SUCCESS(f'Worker {self.worker} stopped: {summary}.'))
+
+    def count(self, counts, status):
+        counts[status] = counts.get(status, 0) + 1
+
+    def expire_exports(self):
+        expired = jobs.expire_exports()
+        if expired:
+            self.stdout.write(f'Deleted the files of {expired} expired export(s).')
+
+    def run_job(self, job):
+        close_old_connections()
+        try:
+            status = jobs.run(job)
+            self.stdout.write(f'Job {job.pk} ({job.kind}) {status}.')
+            return status
+        finally:
+            connection.close()
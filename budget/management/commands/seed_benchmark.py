@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from budget import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Generates a synthetic dataset for benchmarking the budget views. Users, categories, goals,
+    contributions and years of transactions are inserted in bulk, with a skewed distribution so a
+    few heavy users own most of the transactions. Benchmark rows are prefixed with 'bench_' and can
+    be removed with --clear.
+
+    Usage:
+        python manage.py seed_benchmark --users 100 --transactions 1000000 --years 10
+        python manage.py seed_benchmark --clear
+    """
+    help = 'Seeds a synthetic dataset for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Number of users to create.')
+        parser.add_argument('--categories', type=int, default=12, help='Number of categories to create.')
+        parser.add_argument('--goals-per-user', type=int, default=3, help='Number of goals owned by each user.')
+        parser.add_argument('--contributions', type=int, default=2000, help='Total number of contributions.')
+        parser.add_argument('--transactions', type=int, default=100000, help='Total number of expenses and incomes.')
+        parser.add_argument('--years', type=int, default=5, help='Years of history to spread transactions over.')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of the per-user distribution; 0 is uniform.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per query.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible datasets.')
+        parser.add_argument('--clear', action='store_true', help='Delete existing benchmark data instead of seeding.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            benchmark.clear()
+            self.stdout.write(self.style.SUCCESS('Deleted benchmark data.'))
+            return
+
+        users = benchmark.seed(
+            users=options['users'],
+            categories=options['categories'],
+            goals_per_user=options['goals_per_user'],
+            contributions=options['contributions'],
+            transactions=options['transactions'],
+            years=options['years'],
+            skew=options['skew'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users; log in as {users[0].username} / {benchmark.PASSWORD} for the heaviest one.'
+        ))
@@ -0,0 +1,262 @@
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.db.models import Count
+from django.utils.timezone import now
+from .cache import cache_stats
+from .models import Job
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# HELP and TYPE of every metric, in the order they are exposed.
+DEFINITIONS = {
+    'budget_http_requests_total': ('counter', 'Requests handled, by view, method and status code.'),
+    'budget_http_request_duration_seconds': ('histogram', 'Time to produce the response, by view.'),
+    'budget_db_queries_per_request': ('histogram', 'SQL statements run while handling a request, by view.'),
+    'budget_cache_requests_total': ('counter', 'Lookups of the per-user summary caches, by cache and outcome.'),
+    'budget_cache_hit_ratio': ('gauge', 'Share of lookups of the per-user summary caches that were hits.'),
+    'budget_jobs': ('gauge', 'Background jobs waiting or running, by status.'),
+    'budget_job_queue_oldest_seconds': ('gauge', 'Age of the oldest due job still waiting for a worker.'),
+}
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', '') or os.path.join(tempfile.gettempdir(), 'cl-budget-metrics')
+
+
+class MetricsStore:
+    """
+    Counters and histograms of one process, kept in memory behind a lock, so recording a
+    request costs a few dictionary updates and no I/O.
+
+    Every `METRICS_FLUSH_SECONDS` the process writes its totals to its own file in `METRICS_DIR`,
+    replacing it atomically. `collect` adds up the files of all processes, so `/metrics`
+    reports the same totals whichever worker answers the scrape. The files of processes that
+    exited are folded into one archive file, so counters never go backwards while a scrape reads
+    one file per live process. A process forked after the store was used starts over with a
+    file of its own.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._name = f'metrics-{self._pid}-{time.time_ns()}.json'
+        self._counters = {}
+        self._histograms = {}
+        self._flushed = time.monotonic()
+
+    def _own(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._own()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._own()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0}
+            histogram['counts'][bisect_left(buckets, value)] += 1
+            histogram['sum'] += value
+
+    def _snapshot(self):
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+            'histograms': [
+                [name, list(labels), histogram['buckets'], list(histogram['counts']), histogram['sum']]
+                for (name, labels), histogram in self._histograms.items()
+            ],
+        }
+
+    def snapshot(self):
+        with self._lock:
+            self._own()
+            return self._snapshot()
+
+    def flush(self, force=False):
+        """
+        Writes this process's totals to its file if `METRICS_FLUSH_SECONDS` passed since the last
+        write. The check and the write happen under the lock, so threads never write at once.
+        """
+        with self._lock:
+            self._own()
+            if not force and time.monotonic() - self._flushed < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+                return
+            self._flushed = time.monotonic()
+            _write(metrics_dir(), self._name, self._snapshot())
+
+    def collect(self):
+        """
+        Returns the totals of every process as ``(counters, histograms)``, keyed by
+        ``(name, labels)``, with this process's current numbers in place of its last flush.
+        """
+        directory = metrics_dir()
+        if os.path.isdir(directory):
+            archive_dead_processes(directory)
+        snapshots = [self.snapshot()]
+        for filename in os.listdir(directory) if os.path.isdir(directory) else []:
+            if filename.startswith('metrics-') and filename != self._name:
+                snapshot = _read(os.path.join(directory, filename))
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return _merge(snapshots)
+
+
+ARCHIVE_NAME = 'metrics-archive.json'
+_PROCESS_FILE = re.compile(r'metrics-(\d+)-\d+\.json')
+
+
+def _write(directory, name, snapshot):
+    os.makedirs(directory, exist_ok=True)
+    partial = os.path.join(directory, f'.{name}.tmp')
+    with open(partial, 'w') as output:
+        json.dump(snapshot, output)
+    os.replace(partial, os.path.join(directory, name))
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, {'buckets': buckets, 'counts': [0] * len(counts), 'sum': 0})
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], counts)]
+            merged['sum'] += total
+    return counters, histograms
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def archive_dead_processes(directory):
+    """
+    Adds the files of processes that are no longer running to the archive file and removes them,
+    like `mark_process_dead` of prometheus_client. A lock file keeps concurrent scrapes from
+    archiving the same files twice. Relies on every process writing to `directory` running on
+    this host.
+    """
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = [
+            filename for filename in os.listdir(directory)
+            if (match := _PROCESS_FILE.fullmatch(filename)) and not _is_alive(int(match.group(1)))
+        ]
+        if not dead:
+            return
+        archive = _read(os.path.join(directory, ARCHIVE_NAME)) or {'counters': [], 'histograms': []}
+        snapshots = [archive] + [snapshot for filename in dead if (snapshot := _read(os.path.join(directory, filename)))]
+        counters, histograms = _merge(snapshots)
+        _write(directory, ARCHIVE_NAME, {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [
+                [name, list(labels), histogram['buckets'], histogram['counts'], histogram['sum']]
+                for (name, labels), histogram in histograms.items()
+            ],
+        })
+        for filename in dead:
+            os.remove(os.path.join(directory, filename))
+
+
+store = MetricsStore()
+
+
+def observe_request(view, method, status, seconds, queries):
+    """
+    Records one handled request. Called by `MetricsMiddleware`.
+    """
+    store.inc('budget_http_requests_total', {'view': view, 'method': method, 'status': str(status)})
+    store.observe('budget_http_request_duration_seconds', {'view': view}, seconds, LATENCY_BUCKETS)
+    store.observe('budget_db_queries_per_request', {'view': view}, queries, QUERY_BUCKETS)
+    store.flush()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{key}="{_escape(label)}"' for key, label in labels) + '}'
+    return f'{name} {value!r}'
+
+
+def _gauges():
+    """
+    Returns the samples read at scrape time from the shared cache and the job table, which every
+    process sees alike.
+    """
+    samples = []
+    for name, stats in cache_stats().items():
+        samples.append(('budget_cache_requests_total', (('cache', name), ('outcome', 'hit')), stats['hits']))
+        samples.append(('budget_cache_requests_total', (('cache', name), ('outcome', 'miss')), stats['misses']))
+        lookups = stats['hits'] + stats['misses']
+        samples.append(('budget_cache_hit_ratio', (('cache', name),), stats['hits'] / lookups if lookups else 0.0))
+
+    depth = dict.fromkeys((Job.QUEUED, Job.RUNNING), 0)
+    for row in Job.objects.filter(status__in=list(depth)).values('status').annotate(count=Count('pk')).order_by():
+        depth[row['status']] = row['count']
+    for status, count in depth.items():
+        samples.append(('budget_jobs', (('status', status),), count))
+    oldest = (
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now())
+        .order_by('run_after').values_list('run_after', flat=True).first()
+    )
+    samples.append(('budget_job_queue_oldest_seconds', (), (now() - oldest).total_seconds() if oldest else 0.0))
+    return samples
+
+
+def render():
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    counters, histograms = store.collect()
+    samples = {name: [] for name in DEFINITIONS}
+    for (name, labels), value in sorted(counters.items()):
+        samples[name].append(_sample(name, labels, value))
+    for (name, labels), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip([*histogram['buckets'], '+Inf'], histogram['counts']):
+            cumulative += count
+            samples[name].append(_sample(f'{name}_bucket', (*labels, ('le', bound)), cumulative))
+        samples[name].append(_sample(f'{name}_sum', labels, float(histogram['sum'])))
+        samples[name].append(_sample(f'{name}_count', labels, cumulative))
+    for name, labels, value in _gauges():
+        samples[name].append(_sample(name, labels, value))
+
+    lines = []
+    for name, (kind, description) in DEFINITIONS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', *samples[name]]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,210 @@
+import json
+import logging
+import time
+from contextlib import nullcontext
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseNotFound
+from django.urls import Resolver404, resolve
+from . import metrics, routers
+from .instrumentation import QueryCounter, QueryRecorder, install_context_wrapping
+from .profiling import profile_view
+
+logger = logging.getLogger('budget.sql')
+metrics_logger = logging.getLogger('budget.metrics')
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records the SQL issued while handling each request: the query count, the total SQL time,
+    the slowest statement and the fingerprints of statements repeated within the request,
+    which is how N+1 patterns show up.
+
+    The numbers are logged as one JSON line on the `budget.sql` logger and, when
+    `SQL_INSTRUMENTATION_HEADERS` is enabled, added to the response as `X-DB-*` headers.
+    The middleware is skipped entirely when `SQL_INSTRUMENTATION_ENABLED` is False.
+
+    Statements run while a `StreamingHttpResponse` is being consumed happen after the view
+    returns and are not included.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTATION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        slowest = recorder.slowest
+        duplicates = recorder.duplicates()
+        stats = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_time_ms': round(recorder.total_time * 1000, 2),
+            'slowest_ms': round(slowest['time'] * 1000, 2) if slowest else 0,
+            'slowest_sql': slowest['sql'] if slowest else None,
+            'duplicates': duplicates,
+        }
+        logger.info(json.dumps(stats), extra={'sql_stats': stats})
+
+        if getattr(settings, 'SQL_INSTRUMENTATION_HEADERS', False):
+            response['X-DB-Query-Count'] = str(stats['queries'])
+            response['X-DB-Query-Time-Ms'] = str(stats['sql_time_ms'])
+            response['X-DB-Slowest-Query-Ms'] = str(stats['slowest_ms'])
+            response['X-DB-Duplicate-Queries'] = str(sum(count - 1 for count in duplicates.values()))
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, status code and number of SQL statements of every request, labelled
+    with the name of the view that handled it, for the Prometheus endpoint at `/metrics`.
+
+    Recording is an update of in-memory counters; `metrics.store` shares them between worker
+    processes. It is placed first, so the latency includes every other middleware. The middleware
+    is skipped entirely when `METRICS_ENABLED` is False.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with counter.record():
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = getattr(request.resolver_match, 'view_name', None) or 'unresolved'
+        try:
+            metrics.observe_request(view, request.method, response.status_code, elapsed, counter.count)
+        except Exception:
+            # The response is ready; a failure to record it must not turn it into an error.
+            metrics_logger.exception('Could not record the metrics of %s', request.path)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serves GET requests of the read-heavy views from the read replica, while keeping a user on
+    the primary for `REPLICA_STICKY_SECONDS` after they changed data, so they always see their
+    own writes even if the replica lags behind.
+
+    Stickiness is carried by a signed, timestamped cookie set when a POST to one of the views
+    that write succeeded, i.e. redirected or answered 201; a form re-rendered with errors wrote
+    nothing and does not pin. It works across workers without a session write.
+
+    The view is resolved and routed in `__call__`, so `reads_from_replica` is entered and left
+    in the same context. Under ASGI Django runs `process_view` of a sync middleware in a context
+    of its own, which could not reset a context variable set there.
+    """
+    READ_VIEWS = {'dashboard', 'budgets', 'budget_series', 'transactions', 'goals'}
+    WRITE_VIEWS = {
+        'add_income', 'add_expense', 'edit_income', 'edit_expense', 'add_goal', 'donation',
+        'api_create_transactions', 'bulk_transactions',
+    }
+    COOKIE_NAME = 'pin_primary'
+    COOKIE_SALT = 'budget.replica'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            url_name = resolve(request.path_info, getattr(request, 'urlconf', None)).url_name
+        except Resolver404:
+            url_name = None
+
+        with self.routing(request, url_name):
+            response = self.get_response(request)
+
+        if request.method == 'POST' and url_name in self.WRITE_VIEWS and self.wrote(response):
+            response.set_signed_cookie(
+                self.COOKIE_NAME, '1', salt=self.COOKIE_SALT, max_age=self.sticky_seconds(),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def routing(self, request, url_name):
+        """
+        Returns `reads_from_replica` for GET requests of the read views by users who are not
+        pinned to the primary while a replica is configured, otherwise a context doing nothing.
+        """
+        if request.method not in ('GET', 'HEAD') or url_name not in self.READ_VIEWS:
+            return nullcontext()
+        if self.is_pinned(request) or routers.replica_alias() is None:
+            return nullcontext()
+        # Resolve the lazy user from the primary before any budget reads move to the replica.
+        request.user.is_authenticated
+        return routers.reads_from_replica()
+
+    def wrote(self, response):
+        return response.status_code == 201 or 300 <= response.status_code < 400
+
+    def sticky_seconds(self):
+        return getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+    def is_pinned(self, request):
+        """
+        Returns whether the request carries a valid pin cookie younger than the sticky window.
+        """
+        pin = request.get_signed_cookie(
+            self.COOKIE_NAME, default=None, salt=self.COOKIE_SALT, max_age=self.sticky_seconds()
+        )
+        return pin is not None
+
+
+class ProfilerMiddleware:
+    """
+    Lets staff users profile any GET view, e.g. `DashboardView`, `goals`, `transactions` or
+    `budgets`, on the production data: a request with ``?profile=1`` or an ``X-Profile: 1``
+    header runs the view under cProfile and is answered with a plain-text report instead of the
+    page, listing the functions with the highest cumulative time, every SQL statement with its
+    duration and the plans of the slowest SELECTs (`profiling.report`).
+
+    - ``profile=cold`` first bumps the user's data version, so cached summaries are recomputed.
+    - ``profile_user=<username>`` runs the view as another user; superusers only.
+
+    Conditional request headers are dropped, so the view runs instead of answering 304. For
+    everyone else the parameters are ignored. It is placed last, so the view runs with the
+    database routing of the other middleware. The middleware is skipped entirely when
+    `PROFILER_ENABLED` is False.
+    """
+    QUERY_PARAMETER = 'profile'
+    HEADER = 'X-Profile'
+    USER_PARAMETER = 'profile_user'
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_context_wrapping()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = request.GET.get(self.QUERY_PARAMETER) or request.headers.get(self.HEADER)
+        if not mode or request.method not in ('GET', 'HEAD') or not request.user.is_staff:
+            return None
+
+        username = request.GET.get(self.USER_PARAMETER)
+        if username and request.user.is_superuser:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                return HttpResponseNotFound(f'No user {username}.', content_type='text/plain; charset=utf-8')
+
+            async def auser():
+                return user
+            request.user, request.auser = user, auser
+
+        for header in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE'):
+            request.META.pop(header, None)
+        text = profile_view(view_func, request, view_args, view_kwargs, cold=mode == 'cold')
+        return HttpResponse(text, content_type='text/plain; charset=utf-8', headers={'Cache-Control': 'no-store'})
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:31
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_goal_totals(apps, schema_editor):
+    Goal = apps.get_model('budget', 'Goal')
+    goals = Goal.objects.annotate(total=Sum('contribution__amount'), count=Count('contribution'))
+    for goal in goals.iterator():
+        goal.current_amount = goal.total or 0
+        goal.contribution_count = goal.count
+        goal.save(update_fields=['current_amount', 'contribution_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0005_expense_user_income_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goal',
+            name='contribution_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='current_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=21),
+        ),
+        migrations.RunPython(backfill_goal_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_monthly_totals(apps, schema_editor):
+    MonthlyCategoryTotal = apps.get_model('budget', 'MonthlyCategoryTotal')
+    for model_name, kind in (('Expense', 'expense'), ('Income', 'income')):
+        grouped = (
+            apps.get_model('budget', model_name).objects
+            .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+            .order_by()
+            .values('user_id', 'category_id', 'year', 'month')
+            .annotate(total=Sum('amount'), total_count=Count('id'))
+        )
+        MonthlyCategoryTotal.objects.bulk_create(
+            (
+                MonthlyCategoryTotal(
+                    user_id=row['user_id'], category_id=row['category_id'], year=row['year'], month=row['month'],
+                    kind=kind, amount=row['total'], count=row['total_count'],
+                )
+                for row in grouped.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0006_goal_current_amount_contribution_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategoryTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('kind', models.CharField(choices=[('expense', 'Expense'), ('income', 'Income')], max_length=7)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=21)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='budget.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month', 'category', 'kind'), name='unique_monthly_category_total')],
+            },
+        ),
+        migrations.RunPython(backfill_monthly_totals, migrations.RunPython.noop),
+    ]
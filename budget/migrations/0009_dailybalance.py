@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:47
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_daily_balances(apps, schema_editor):
+    DailyBalance = apps.get_model('budget', 'DailyBalance')
+    daily = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for model_name, index in (('Income', 0), ('Expense', 1)):
+        rows = apps.get_model('budget', model_name).objects.order_by().values('user_id', 'date').annotate(total=Sum('amount'))
+        for row in rows.iterator():
+            daily[row['user_id']][row['date']][index] += row['total']
+
+    for user_id, days in daily.items():
+        income = expenses = 0
+        balances = []
+        for day in sorted(days):
+            income += days[day][0]
+            expenses += days[day][1]
+            balances.append(DailyBalance(user_id=user_id, date=day, cumulative_income=income, cumulative_expenses=expenses))
+        DailyBalance.objects.bulk_create(balances, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0008_transaction_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('cumulative_income', models.DecimalField(decimal_places=2, default=0, max_digits=21)),
+                ('cumulative_expenses', models.DecimalField(decimal_places=2, default=0, max_digits=21)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_balance')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_balances, migrations.RunPython.noop),
+    ]
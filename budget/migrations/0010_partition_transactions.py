@@ -0,0 +1,29 @@
+from django.db import migrations
+from budget import partitions
+
+
+def partition_transactions(apps, schema_editor):
+    if partitions.is_supported(schema_editor.connection):
+        for table in partitions.PARTITIONED_TABLES:
+            partitions.rebuild_table(schema_editor.connection, table, partitioned=True)
+
+
+def unpartition_transactions(apps, schema_editor):
+    if partitions.is_supported(schema_editor.connection):
+        for table in partitions.PARTITIONED_TABLES:
+            partitions.rebuild_table(schema_editor.connection, table, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    """
+    Partitions the expense and income tables by year of `date` on PostgreSQL. Other databases
+    keep plain tables.
+    """
+
+    dependencies = [
+        ('budget', '0009_dailybalance'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'goal_name_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON budget_goal USING gin (UPPER(name) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes the upper-cased goal names with pg_trgm trigrams on PostgreSQL, so the goal search,
+    an `icontains` filter that compiles to ``UPPER(name) LIKE UPPER('%...%')``, uses the index
+    instead of scanning every goal. Other databases scan, as before.
+    """
+
+    dependencies = [
+        ('budget', '0012_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
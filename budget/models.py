@@ -1,4 +1,7 @@
-from django.db import models
+from collections import defaultdict
+from datetime import date
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 
@@ -13,6 +16,28 @@ class Goal(models.Model):
     description = models.TextField(blank=True, null=True)
     contributor = models.ManyToManyField(User, through='Contribution', related_name='contributed_goals')
     target_amount = models.DecimalField(max_digits=21, decimal_places=2)
+    current_amount = models.DecimalField(max_digits=21, decimal_places=2, default=0, editable=False)
+    contribution_count = models.PositiveIntegerField(default=0, editable=False)
+
+    @property
+    def current_percentage(self):
+        """
+        Progress towards the target amount in percent, read from the stored contribution total.
+        """
+        if self.target_amount > 0:
+            return round((self.current_amount / self.target_amount) * 100, 2)
+        return 0
+
+    @classmethod
+    def adjust_totals(cls, goal_id, amount, count):
+        """
+        Atomically shifts the stored contribution total and count of a goal by the given deltas.
+        The update is expressed with F() so concurrent contributions never overwrite each other.
+        """
+        cls.objects.filter(pk=goal_id).update(
+            current_amount=F('current_amount') + amount,
+            contribution_count=F('contribution_count') + count,
+        )
 
 
 class Contribution(models.Model):
@@ -24,9 +49,22 @@ class Contribution(models.Model):
     amount = models.DecimalField(max_digits=21, decimal_places=2)
     date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['goal', 'contributor'], name='contribution_goal_contrib_idx'),
+            models.Index(fields=['contributor', 'goal'], name='contribution_contrib_goal_idx'),
+            # Serves the year filter and ordering of the admin changelist.
+            models.Index(fields=['date'], name='contribution_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.contributor} → {self.goal}: {self.amount}"
 
+    def save(self, *args, **kwargs):
+        # The goal totals are adjusted by signal handlers, keep them in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     """
@@ -41,6 +79,9 @@ class Category(models.Model):
 class Expense(models.Model):
     """
     Represents an expense made by a user. An expense is associated with a category and a specific amount.
+
+    On PostgreSQL the table is partitioned by year of `date` (see `budget.partitions`), so queries
+    filtering on a date range only read the partitions of the years in that range.
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=128)
@@ -48,13 +89,31 @@ class Expense(models.Model):
     category = models.ForeignKey(Category, related_name='expense', on_delete=models.CASCADE)
     date = models.DateField()
 
+    class Meta:
+        # Every read filters on the user and a date range or category; the amount is included
+        # so range sums can be answered by index-only scans on PostgreSQL. The id orders the rows
+        # of one day, so the keyset pages of the transactions view seek straight to their cursor.
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], include=['amount'], name='expense_user_date_id_idx'),
+            models.Index(fields=['user', 'category', 'date'], include=['amount'], name='expense_user_cat_date_idx'),
+            # Serves the year filter and ordering of the admin changelist.
+            models.Index(fields=['date'], name='expense_date_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name}: {self.amount}'
 
+    def save(self, *args, **kwargs):
+        # The monthly rollup is adjusted by signal handlers, keep it in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Income(models.Model):
     """
     Represents an income earned by a user. An income is associated with a category and a specific amount.
+
+    Partitioned by year of `date` on PostgreSQL, like `Expense`.
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=128)
@@ -62,5 +121,250 @@ class Income(models.Model):
     category = models.ForeignKey(Category, related_name='income', on_delete=models.CASCADE)
     date = models.DateField()
 
+    class Meta:
+        # Every read filters on the user and a date range or category; the amount is included
+        # so range sums can be answered by index-only scans on PostgreSQL. The id orders the rows
+        # of one day, so the keyset pages of the transactions view seek straight to their cursor.
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], include=['amount'], name='income_user_date_id_idx'),
+            models.Index(fields=['user', 'category', 'date'], include=['amount'], name='income_user_cat_date_idx'),
+            # Serves the year filter and ordering of the admin changelist.
+            models.Index(fields=['date'], name='income_date_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name}: {self.amount}'
+
+    def save(self, *args, **kwargs):
+        # The monthly rollup is adjusted by signal handlers, keep it in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class MonthlyCategoryTotal(models.Model):
+    """
+    Represents the sum of a user's expenses or incomes in one category for one calendar month.
+    Rows are maintained incrementally whenever an expense or income is written, so summaries over
+    whole months never have to scan raw transactions.
+    """
+    EXPENSE = 'expense'
+    INCOME = 'income'
+    KIND_CHOICES = [
+        (EXPENSE, 'Expense'),
+        (INCOME, 'Income'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=21, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'month', 'category', 'kind'], name='unique_monthly_category_total'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.year}-{self.month:02d} {self.category} {self.kind}: {self.amount}'
+
+    @classmethod
+    def adjust(cls, user_id, category_id, kind, day, amount, count):
+        """
+        Atomically shifts the total of the month containing `day` by the given deltas, creating
+        the row on the first transaction of that month.
+
+        A removal never creates a row: a missing row means it was already deleted together with
+        its user or category, and recreating it would point at a row that is going away.
+        """
+        lookup = {'user_id': user_id, 'category_id': category_id, 'kind': kind, 'year': day.year, 'month': day.month}
+        deltas = {'amount': F('amount') + amount, 'count': F('count') + count}
+        if cls.objects.filter(**lookup).update(**deltas) or count <= 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(amount=amount, count=count, **lookup)
+        except IntegrityError:
+            # Another transaction created the row first, add to it instead.
+            cls.objects.filter(**lookup).update(**deltas)
+
+    @classmethod
+    def add_transactions(cls, kind, transactions, sign=1):
+        """
+        Applies expenses or incomes written without signals, e.g. with `bulk_create`, to the rollup.
+        Issues one update per affected user, month and category rather than one per transaction;
+        pass ``sign=-1`` to take the transactions back out.
+        """
+        deltas = defaultdict(lambda: [0, 0])
+        for item in transactions:
+            key = (item.user_id, item.category_id, item.date.year, item.date.month)
+            deltas[key][0] += item.amount
+            deltas[key][1] += 1
+        for (user_id, category_id, year, month), (amount, count) in deltas.items():
+            cls.adjust(user_id, category_id, kind, date(year, month, 1), sign * amount, sign * count)
+
+
+def _lock_user(user_id):
+    """
+    Locks the row of the user until the current transaction ends, serializing the writes of the
+    user's derived rows. ``FOR NO KEY UPDATE`` does not conflict with the key share lock that
+    inserting a transaction of the user takes, so concurrent inserts cannot deadlock on it.
+    """
+    list(User.objects.filter(pk=user_id).select_for_update(no_key=True).values_list('pk', flat=True))
+
+
+class DailyBalance(models.Model):
+    """
+    Represents a user's running totals of incomes and expenses from their first transaction up to
+    and including `date`. A row exists for every day with transactions, so the totals of any date
+    range are the difference between two rows, found with two point lookups.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    cumulative_income = models.DecimalField(max_digits=21, decimal_places=2, default=0)
+    cumulative_expenses = models.DecimalField(max_digits=21, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_balance'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.date}: {self.cumulative_income} / {self.cumulative_expenses}'
+
+    @classmethod
+    def as_of(cls, user_id, day):
+        """
+        Returns ``(cumulative_income, cumulative_expenses)`` of the user at the end of the last day
+        before `day`, i.e. the totals of every transaction dated earlier than `day`, or of every
+        transaction if `day` is None.
+        """
+        rows = cls.objects.filter(user_id=user_id)
+        if day is not None:
+            rows = rows.filter(date__lt=day)
+        row = (
+            rows
+            .order_by('-date')
+            .values_list('cumulative_income', 'cumulative_expenses')
+            .first()
+        )
+        return row or (0, 0)
+
+    @classmethod
+    def adjust(cls, user_id, day, income, expenses):
+        """
+        Adds the given deltas to the running totals of `day` and every later day, creating the row
+        for `day` from the previous day's totals on its first transaction.
+
+        Writes dated in the past update one row per later day with transactions, while recent
+        writes only touch a few rows. As in `MonthlyCategoryTotal.adjust`, a removal never creates
+        a row. The user's row is locked until the surrounding transaction ends, so the writes of
+        one user apply their deltas one after the other and a new row's starting point read with
+        `as_of` cannot miss a concurrent write dated earlier.
+        """
+        deltas = {
+            'cumulative_income': F('cumulative_income') + income,
+            'cumulative_expenses': F('cumulative_expenses') + expenses,
+        }
+        with transaction.atomic():
+            _lock_user(user_id)
+            cls.objects.filter(user_id=user_id, date__gt=day).update(**deltas)
+            if cls.objects.filter(user_id=user_id, date=day).update(**deltas) or (income <= 0 and expenses <= 0):
+                return
+            base_income, base_expenses = cls.as_of(user_id, day)
+            cls.objects.create(
+                user_id=user_id, date=day,
+                cumulative_income=base_income + income, cumulative_expenses=base_expenses + expenses,
+            )
+
+    @classmethod
+    def rebuild(cls, user_id, since=None):
+        """
+        Recomputes the running totals of a user from the raw transactions, for every day or only
+        from `since` on, keeping the totals of earlier days as the starting point. Like `adjust`,
+        it locks the user's row before reading, so no write of the user is lost in between.
+        """
+        with transaction.atomic():
+            _lock_user(user_id)
+            daily = defaultdict(lambda: [0, 0])
+            for model, index in ((Income, 0), (Expense, 1)):
+                rows = model.objects.filter(user_id=user_id)
+                if since:
+                    rows = rows.filter(date__gte=since)
+                for row in rows.order_by().values('date').annotate(total=models.Sum('amount')):
+                    daily[row['date']][index] += row['total']
+
+            income, expenses = cls.as_of(user_id, since) if since else (0, 0)
+            balances = []
+            for day in sorted(daily):
+                income += daily[day][0]
+                expenses += daily[day][1]
+                balances.append(cls(user_id=user_id, date=day, cumulative_income=income, cumulative_expenses=expenses))
+
+            stale = cls.objects.filter(user_id=user_id)
+            if since:
+                stale = stale.filter(date__gte=since)
+            stale.delete()
+            cls.objects.bulk_create(balances, batch_size=1000)
+
+
+class Job(models.Model):
+    """
+    Represents a unit of background work, such as a large export or a rebuild of derived totals,
+    queued with `jobs.enqueue` and run by `manage.py run_worker`.
+
+    A failed job is queued again with an exponentially growing delay until it used up
+    `max_attempts`. While it runs, the worker records its progress and a heartbeat, which the
+    views poll and which tell other workers whether the job's worker is still alive.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=now)
+    progress_done = models.PositiveBigIntegerField(default=0)
+    progress_total = models.PositiveBigIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Workers look for due queued jobs and for running jobs whose heartbeat stopped.
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(fields=['status', 'heartbeat_at'], name='job_status_heartbeat_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk}: {self.status}'
+
+    @property
+    def percent(self):
+        """
+        Progress in percent, or None while the job has not reported how much work there is.
+        """
+        if self.status == self.SUCCEEDED:
+            return 100
+        if not self.progress_total:
+            return None
+        return min(100, round(self.progress_done * 100 / self.progress_total))
@@ -0,0 +1,164 @@
+import heapq
+from datetime import date
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    One page of rows ordered from newest to oldest, together with the cursors that lead to the
+    neighbouring pages. Iterating the page yields its items.
+    """
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_url = None
+        self.previous_url = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def set_urls(self, request, after_param, before_param):
+        """
+        Builds the next and previous links from the current query string, replacing only this page's cursor.
+        """
+        for attr, cursor, param, other in (
+            ('next_url', self.next_cursor, after_param, before_param),
+            ('previous_url', self.previous_cursor, before_param, after_param),
+        ):
+            if cursor is None:
+                continue
+            query = request.GET.copy()
+            query.pop(other, None)
+            query[param] = cursor
+            setattr(self, attr, f'?{query.urlencode()}')
+
+
+def encode_cursor(key):
+    day, kind, pk = key
+    return f'{day.isoformat()}_{kind}_{pk}'
+
+
+def decode_cursor(value):
+    """
+    Returns the ``(date, kind, id)`` key of a cursor, or None if it is missing or malformed.
+    """
+    try:
+        day, kind, pk = value.split('_')
+        return date.fromisoformat(day), kind, int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _item_key(kind, item):
+    return item.date, kind, item.pk
+
+
+def _before_q(kind, key):
+    """
+    Matches the rows of one source whose ``(date, kind, id)`` sorts strictly before `key`.
+    The kind is constant within a source, so it only decides how rows of the same date compare.
+
+    Within the cursor's own kind, the redundant ``date <= day`` bound lets the database start a
+    range scan of the ``(user, date, id)`` index at the cursor; the OR alone is only a filter.
+    """
+    day, key_kind, pk = key
+    if kind < key_kind:
+        return Q(date__lte=day)
+    if kind > key_kind:
+        return Q(date__lt=day)
+    return Q(date__lte=day) & (Q(date__lt=day) | Q(date=day, pk__lt=pk))
+
+
+def _after_q(kind, key):
+    day, key_kind, pk = key
+    if kind > key_kind:
+        return Q(date__gte=day)
+    if kind < key_kind:
+        return Q(date__gt=day)
+    return Q(date__gte=day) & (Q(date__gt=day) | Q(date=day, pk__gt=pk))
+
+
+def keyset_page(sources, after=None, before=None, page_size=50):
+    """
+    Returns a `KeysetPage` of the rows of `sources`, a list of ``(kind, queryset)`` pairs, merged
+    into a single stream ordered from newest to oldest by ``(date, kind, id)``.
+
+    `after` and `before` are cursors of a previous page; rows are selected by comparing keys
+    instead of using OFFSET, so every page costs the same however deep it is. Each source reads
+    at most ``page_size + 1`` rows, the extra row only telling whether another page exists.
+    Every item gets a `kind` attribute naming the source it came from.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    backwards = before is not None and after is None
+    limit = page_size + 1
+
+    streams = []
+    for kind, queryset in sources:
+        if backwards:
+            rows = queryset.filter(_after_q(kind, before)).order_by('date', 'pk')
+        else:
+            if after is not None:
+                queryset = queryset.filter(_before_q(kind, after))
+            rows = queryset.order_by('-date', '-pk')
+        streams.append([(_item_key(kind, item), item) for item in rows[:limit]])
+
+    merged = list(heapq.merge(*streams, key=lambda entry: entry[0], reverse=not backwards))[:limit]
+    has_more = len(merged) > page_size
+    merged = merged[:page_size]
+    if backwards:
+        merged.reverse()
+
+    items = []
+    for (_, kind, _), item in merged:
+        item.kind = kind
+        items.append(item)
+    if not merged:
+        return KeysetPage(items)
+
+    first, last = encode_cursor(merged[0][0]), encode_cursor(merged[-1][0])
+    if backwards:
+        return KeysetPage(items, next_cursor=last, previous_cursor=first if has_more else None)
+    return KeysetPage(items, next_cursor=last if has_more else None, previous_cursor=first if after else None)
+
+
+def id_keyset_page(queryset, after=None, before=None, page_size=20):
+    """
+    Returns a `KeysetPage` of `queryset` ordered from the newest to the oldest row by primary key.
+    Cursors are primary keys, so like `keyset_page` every page costs the same however deep it is.
+    """
+    try:
+        after = int(after) if after else None
+        before = int(before) if before else None
+    except ValueError:
+        after = before = None
+    backwards = before is not None and after is None
+
+    if backwards:
+        rows = list(queryset.filter(pk__gt=before).order_by('pk')[:page_size + 1])
+    else:
+        if after is not None:
+            queryset = queryset.filter(pk__lt=after)
+        rows = list(queryset.order_by('-pk')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    first, last = str(rows[0].pk), str(rows[-1].pk)
+    if backwards:
+        return KeysetPage(rows, next_cursor=last, previous_cursor=first if has_more else None)
+    return KeysetPage(rows, next_cursor=last if has_more else None, previous_cursor=first if after else None)
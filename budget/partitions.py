@@ -0,0 +1,201 @@
+import re
+from datetime import date
+from django.db import transaction
+
+# Tables partitioned by range of `date` on PostgreSQL, one partition per calendar year.
+PARTITIONED_TABLES = ('budget_expense', 'budget_income')
+
+
+def is_supported(connection):
+    """
+    Returns whether `connection` supports declarative partitioning. On every other database the
+    transaction tables stay plain tables and the functions below do nothing.
+    """
+    return connection.vendor == 'postgresql'
+
+
+def partition_name(table, year):
+    return f'{table}_y{year}'
+
+
+def default_partition_name(table):
+    return f'{table}_default'
+
+
+def year_bounds(year):
+    """
+    Returns the range of dates held by the partition of `year`, as the SQL literals of its
+    inclusive lower and exclusive upper bound.
+    """
+    return f"'{date(year, 1, 1).isoformat()}'", f"'{date(year + 1, 1, 1).isoformat()}'"
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))', [table])
+        return cursor.fetchone()[0]
+
+
+def year_partitions(connection, table):
+    """
+    Returns ``{year: partition name}`` for the yearly partitions attached to `table`.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)',
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    pattern = re.compile(re.escape(table) + r'_y(\d{4})')
+    return {int(match.group(1)): name for name in names if (match := pattern.fullmatch(name))}
+
+
+def _definition(cursor, table):
+    """
+    Returns the name of the primary key of `table`, the statements creating its other indexes and
+    ``(name, definition)`` of its foreign key and check constraints, so they can be recreated on
+    a rebuilt table under the same names.
+    """
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'", [table])
+    primary_key = cursor.fetchone()[0]
+    cursor.execute(
+        'SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = to_regclass(%s) AND NOT indisprimary',
+        [table],
+    )
+    # Indexes of a partitioned table are reported as created ON ONLY the parent.
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype IN ('f', 'c') ORDER BY conname",
+        [table],
+    )
+    return primary_key, indexes, cursor.fetchall()
+
+
+def rebuild_table(connection, table, partitioned, years_ahead=1, today=None):
+    """
+    Rebuilds `table` as a table partitioned by year of `date`, or back as a plain table when
+    `partitioned` is False, keeping its rows, indexes, constraints and id sequence.
+
+    A partitioned table gets a partition per year from its earliest row to `years_ahead` years
+    after `today`, and a default partition for rows outside of them. PostgreSQL requires the
+    partition key in every unique index, so its primary key is ``(id, date)``; ids still come
+    from a single sequence and stay unique.
+
+    The rows are copied in one statement while the table is locked, so on a large table this
+    belongs in a maintenance window. Partitions detached earlier are left alone.
+    """
+    qn = connection.ops.quote_name
+    staging = f'{table}_rebuild'
+    sequence = f'{staging}_id_seq'
+    today = today or date.today()
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE')
+        primary_key, indexes, constraints = _definition(cursor, table)
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) + 1, MIN("date") FROM {qn(table)}')
+        next_id, first_day = cursor.fetchone()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        current_sequence = cursor.fetchone()[0]
+        if current_sequence:
+            # Ids of deleted rows past MAX(id) must not be handed out again.
+            cursor.execute(f'SELECT last_value + 1 FROM {current_sequence}')
+            next_id = max(next_id, cursor.fetchone()[0])
+
+        cursor.execute(
+            f'CREATE TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING STORAGE)'
+            + (' PARTITION BY RANGE ("date")' if partitioned else '')
+        )
+        cursor.execute(f'CREATE SEQUENCE {qn(sequence)} START WITH {int(next_id)}')
+        cursor.execute(f"ALTER TABLE {qn(staging)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        if partitioned:
+            first_year = first_day.year if first_day else today.year
+            for year in range(min(first_year, today.year), today.year + years_ahead + 1):
+                lower, upper = year_bounds(year)
+                cursor.execute(
+                    f'CREATE TABLE {qn(partition_name(table, year))} PARTITION OF {qn(staging)} '
+                    f'FOR VALUES FROM ({lower}) TO ({upper})'
+                )
+            cursor.execute(f'CREATE TABLE {qn(default_partition_name(table))} PARTITION OF {qn(staging)} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {qn(staging)} SELECT * FROM {qn(table)}')
+        cursor.execute(f'DROP TABLE {qn(table)}')
+        cursor.execute(f'ALTER TABLE {qn(staging)} RENAME TO {qn(table)}')
+        cursor.execute(f'ALTER SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id')
+        cursor.execute(f'ALTER SEQUENCE {qn(sequence)} RENAME TO {qn(table + "_id_seq")}')
+
+        key = '(id, "date")' if partitioned else '(id)'
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(primary_key)} PRIMARY KEY {key}')
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+        for statement in indexes:
+            cursor.execute(statement)
+
+
+def create_partition(connection, table, year):
+    """
+    Adds the partition of `year` to `table`. Rows of that year already stored in the default
+    partition are moved into it first, since PostgreSQL refuses to attach a partition whose range
+    overlaps rows of the default one.
+    """
+    qn = connection.ops.quote_name
+    name = partition_name(table, year)
+    lower, upper = year_bounds(year)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING STORAGE)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {qn(default_partition_name(table))} '
+            f'WHERE "date" >= {lower} AND "date" < {upper} RETURNING *) '
+            f'INSERT INTO {qn(name)} SELECT * FROM moved'
+        )
+        cursor.execute(f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM ({lower}) TO ({upper})')
+    return name
+
+
+def ensure_partitions(connection, years_ahead=1, today=None):
+    """
+    Creates the missing partitions of the transaction tables up to `years_ahead` years after
+    `today` and returns their names. Does nothing on databases without partitioning.
+    """
+    if not is_supported(connection):
+        return []
+    today = today or date.today()
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(connection, table):
+            continue
+        existing = year_partitions(connection, table)
+        for year in range(today.year, today.year + years_ahead + 1):
+            if year not in existing:
+                created.append(create_partition(connection, table, year))
+    return created
+
+
+def detach_partitions(connection, before_year):
+    """
+    Detaches the partitions of the transaction tables holding years before `before_year` and
+    returns their names. Does nothing on databases without partitioning.
+
+    Detached partitions are kept as plain tables, so old years can be archived or dropped
+    separately. Their foreign keys are dropped: Django only cascades deletes of users and
+    categories into the partitioned table, so the archived rows must not block them. The rows
+    vanish from every query of the transactions and, once the derived tables are recomputed
+    (`manage_partitions` does so after detaching), from the monthly rollup and the daily balances.
+    """
+    if not is_supported(connection):
+        return []
+    qn = connection.ops.quote_name
+    detached = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(connection, table):
+            continue
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for year, name in sorted(year_partitions(connection, table).items()):
+                if year < before_year:
+                    cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+                    cursor.execute(
+                        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'", [name]
+                    )
+                    for (constraint,) in cursor.fetchall():
+                        cursor.execute(f'ALTER TABLE {qn(name)} DROP CONSTRAINT {qn(constraint)}')
+                    detached.append(name)
+    return detached
@@ -0,0 +1,116 @@
+import cProfile
+import io
+import pstats
+import time
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from .cache import bump_data_version
+from .instrumentation import QueryRecorder, wrapping_context
+
+
+def run_profiled(view_func, request, args, kwargs):
+    """
+    Runs the view under cProfile and records every SQL statement it issues, rendering a
+    `TemplateResponse` and consuming a streamed body inside the profile, so template and
+    streaming work are included. Returns ``(response, profiler, recorder, seconds)``.
+
+    Statements run in other threads on behalf of the request, like the sections of
+    `AsyncDashboardView`, are recorded too. Their Python functions are not profiled: cProfile
+    only follows the thread it was enabled on.
+    """
+    profiler = cProfile.Profile()
+    recorder = QueryRecorder()
+    start = time.perf_counter()
+    with wrapping_context(recorder):
+        profiler.enable()
+        try:
+            if iscoroutinefunction(view_func):
+                response = async_to_sync(view_func)(request, *args, **kwargs)
+            else:
+                response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if response.streaming:
+                response.content = b''.join(response.streaming_content)
+        finally:
+            profiler.disable()
+    return response, profiler, recorder, time.perf_counter() - start
+
+
+def explain(query):
+    """
+    Returns the plan of a recorded SELECT as text. On PostgreSQL the statement is run again with
+    ``EXPLAIN (ANALYZE, BUFFERS)`` inside a transaction that is rolled back, so the plan shows
+    actual row counts and timings; SQLite only offers ``EXPLAIN QUERY PLAN``.
+    """
+    connection = connections[query['alias']]
+    with transaction.atomic(using=query['alias']), connection.cursor() as cursor:
+        try:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query['sql'], query['params'])
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'], query['params'])
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            return f'Plans are not available on {connection.vendor}.'
+        finally:
+            transaction.set_rollback(True, using=query['alias'])
+
+
+def _is_select(query):
+    return query['sql'].lstrip().upper().startswith('SELECT')
+
+
+def report(request, response, profiler, recorder, seconds):
+    """
+    Returns the plain-text profile of a request: the functions with the highest cumulative time,
+    every SQL statement in the order it ran with its duration, and the plans of the slowest
+    SELECT statements.
+    """
+    top = getattr(settings, 'PROFILER_TOP_FUNCTIONS', 40)
+    explained = getattr(settings, 'PROFILER_EXPLAIN_QUERIES', 3)
+    view = getattr(request.resolver_match, 'view_name', None) or request.path
+    lines = [
+        f'Profile of {request.method} {request.get_full_path()} ({view}) as {request.user.get_username()}',
+        f'Status {response.status_code} in {seconds * 1000:.1f} ms, '
+        f'{recorder.count} SQL statement(s) in {recorder.total_time * 1000:.1f} ms',
+        '',
+        f'== Top {top} functions by cumulative time ==',
+    ]
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(top)
+    lines.append(output.getvalue().strip())
+
+    lines += ['', '== SQL statements ==']
+    for number, query in enumerate(recorder.queries, 1):
+        lines.append(f'#{number} {query["time"] * 1000:.2f} ms on {query["alias"]}')
+        lines.append(f'    {query["sql"]}')
+        if query['params']:
+            lines.append(f'    params: {query["params"]!r}')
+
+    slowest = sorted(
+        (number for number, query in enumerate(recorder.queries, 1) if _is_select(query)),
+        key=lambda number: recorder.queries[number - 1]['time'], reverse=True,
+    )[:explained]
+    lines += ['', f'== Plans of the {len(slowest)} slowest SELECT statement(s) ==']
+    for number in slowest:
+        query = recorder.queries[number - 1]
+        lines.append(f'#{number} {query["time"] * 1000:.2f} ms')
+        try:
+            lines.append(explain(query))
+        except DatabaseError as exc:
+            lines.append(f'EXPLAIN failed: {exc}')
+        lines.append('')
+    return '\n'.join(lines).rstrip() + '\n'
+
+
+def profile_view(view_func, request, args, kwargs, cold=False):
+    """
+    Runs the view for `request` under the profiler and returns the text report. With `cold`, the
+    user's data version is bumped first, so cached summaries do not hide the view's queries.
+    """
+    if cold:
+        bump_data_version(request.user.pk)
+    response, profiler, recorder, seconds = run_profiled(view_func, request, args, kwargs)
+    return report(request, response, profiler, recorder, seconds)
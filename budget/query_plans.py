@@ -0,0 +1,126 @@
+import json
+import re
+from datetime import date, timedelta
+from django.db import connection, connections, transaction
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from .cache import bump_data_version
+from .instrumentation import QueryRecorder
+from .pagination import encode_cursor
+
+# Tables that are listed in full by design, so a sequential scan of them is expected.
+ALLOWED_SCANS = {'budget_category', 'budget_goal'}
+
+
+def estimated_rows(queryset):
+    """
+    Returns the number of rows the PostgreSQL planner expects `queryset` to return, taken from
+    the table statistics kept up to date by autovacuum, without running the query.
+    Returns None on other databases.
+    """
+    db = connections[queryset.db]
+    if db.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with db.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def checked_urls(today=None):
+    """
+    Returns the URLs of the read views whose queries are checked, including a budget
+    range that spans both whole and partial months and transaction pages deep in the history.
+    """
+    today = today or date.today()
+    long_range = f'?start_date={(today - timedelta(days=400)).isoformat()}&end_date={today.isoformat()}'
+    return [
+        reverse('dashboard'),
+        reverse('budgets'),
+        reverse('budgets') + long_range,
+        reverse('goals'),
+        reverse('transactions'),
+        reverse('transactions') + deep_transaction_pages(today),
+        reverse('transactions') + deep_transaction_pages(today, combined=True),
+    ]
+
+
+def deep_transaction_pages(today, combined=False):
+    """
+    Returns the query string of a transactions page whose cursors lie 250 days back.
+    """
+    day = today - timedelta(days=250)
+    expenses, incomes = (encode_cursor((day, kind, 2 ** 31 - 1)) for kind in ('expense', 'income'))
+    if combined:
+        return f'?combined=1&after={expenses}'
+    return f'?expenses_after={expenses}&incomes_after={incomes}'
+
+
+def plan_lines(sql, params):
+    """
+    Returns the lines of the plan the database picks for `sql`. On PostgreSQL sequential scans
+    are disabled for the EXPLAIN, so the planner picks an index whenever one can serve the query,
+    however small the tables are. On SQLite the lines are those of ``EXPLAIN QUERY PLAN``.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def sequential_scans(sql, params):
+    """
+    Returns the names of the tables that the database would read with a full scan to run `sql`.
+
+    On PostgreSQL a remaining ``Seq Scan`` in `plan_lines` means no index fits. On SQLite
+    ``EXPLAIN QUERY PLAN`` reports full scans as ``SCAN <table>``.
+    """
+    details = plan_lines(sql, params)
+    if connection.vendor == 'postgresql':
+        return set(re.findall(r'Seq Scan on "?(\w+)"?', '\n'.join(details)))
+
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+    scans = set()
+    for detail in details:
+        match = re.match(r'SCAN (\w+)', detail)
+        if match and match.group(1) in tables:
+            scans.add(match.group(1))
+    return scans
+
+
+def check_view_plans(user, urls=None, allowed=ALLOWED_SCANS):
+    """
+    Requests every URL as `user`, explains each SELECT the view runs and returns a list of
+    ``(url, sql, tables)`` for the queries that fall back to a sequential scan.
+
+    The user's data version is bumped before each request, so cached summaries do not hide
+    the view's queries.
+    """
+    factory = RequestFactory()
+    problems = []
+    for url in urls or checked_urls():
+        request = factory.get(url)
+        request.user = user
+        match = resolve(request.path_info)
+        bump_data_version(user.pk)
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+
+        for query in recorder.queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            tables = sequential_scans(query['sql'], query['params']) - set(allowed)
+            if tables:
+                problems.append((url, query['sql'], tables))
+    return problems
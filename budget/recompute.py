@@ -0,0 +1,175 @@
+import operator
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from .cache import bump_data_version
+from .models import Contribution, DailyBalance, Expense, Goal, Income, MonthlyCategoryTotal
+
+# Derived numbers `recompute_shard` can recompute, in the order they are recomputed.
+TASKS = ('monthly_totals', 'daily_balances', 'goal_totals')
+
+
+def user_shards(shard_size):
+    """
+    Splits the user ids into consecutive ``(first, end)`` ranges of `shard_size` ids, `end`
+    excluded. Ranges are contiguous, so a shard is one index range scan of every per-user table,
+    and aligned to multiples of `shard_size`, so they stay the same when users come and go.
+    """
+    bounds = User.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    start = bounds['first'] // shard_size * shard_size
+    return [(first, first + shard_size) for first in range(start, bounds['last'] + 1, shard_size)]
+
+
+def _lock_users(first, end):
+    """
+    Locks the user rows of ``[first, end)`` until the transaction ends. Inserting a transaction
+    for a user, or moving one to them, checks the foreign key with a lock on the user row that
+    conflicts with this one, so no such write can commit between the reads and the writes of a
+    recompute. Other writes are serialized by the locks on the derived rows, see `_sync`.
+    """
+    list(User.objects.filter(pk__gte=first, pk__lt=end).select_for_update().values_list('pk', flat=True))
+
+
+def _sync(model, current, wanted, fields, batch_size):
+    """
+    Makes the derived rows `current` (``{key: row}``, locked with ``SELECT FOR UPDATE`` before the
+    raw transactions were read) match the recomputed rows `wanted` (``{key: unsaved row}``).
+
+    Rows are updated in place rather than deleted and recreated: a concurrent write that changed
+    a transaction after it was read is blocked on the locked row, and applies its delta to the
+    recomputed value once this transaction commits, instead of being overwritten. Only rows that
+    differ are written.
+    """
+    changed = []
+    for key, row in wanted.items():
+        existing = current.get(key)
+        if existing is not None and any(getattr(existing, field) != getattr(row, field) for field in fields):
+            for field in fields:
+                setattr(existing, field, getattr(row, field))
+            changed.append(existing)
+    obsolete = [row.pk for key, row in current.items() if key not in wanted]
+    for index in range(0, len(obsolete), batch_size):
+        model.objects.filter(pk__in=obsolete[index:index + batch_size]).delete()
+    model.objects.bulk_update(changed, fields, batch_size=batch_size)
+    model.objects.bulk_create([row for key, row in wanted.items() if key not in current], batch_size=batch_size)
+
+
+def recompute_monthly_totals(first, end, batch_size=1000):
+    """
+    Recomputes the monthly rollup of the users with ids in ``[first, end)`` from one grouped query
+    per transaction table and returns the number of rollup rows of the range. Runs in one
+    transaction with the users and their rollup rows locked, so writes made meanwhile are kept.
+    """
+    key = operator.attrgetter('user_id', 'category_id', 'kind', 'year', 'month')
+    with transaction.atomic():
+        _lock_users(first, end)
+        current = {
+            key(row): row
+            for row in MonthlyCategoryTotal.objects.filter(user_id__gte=first, user_id__lt=end).select_for_update()
+        }
+        wanted = {}
+        for model, kind in ((Expense, MonthlyCategoryTotal.EXPENSE), (Income, MonthlyCategoryTotal.INCOME)):
+            grouped = (
+                model.objects.filter(user_id__gte=first, user_id__lt=end)
+                .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+                .order_by()
+                .values('user_id', 'category_id', 'year', 'month')
+                .annotate(total=Sum('amount'), total_count=Count('id'))
+            )
+            for row in grouped.iterator():
+                total = MonthlyCategoryTotal(
+                    user_id=row['user_id'], category_id=row['category_id'], year=row['year'], month=row['month'],
+                    kind=kind, amount=row['total'], count=row['total_count'],
+                )
+                wanted[key(total)] = total
+        _sync(MonthlyCategoryTotal, current, wanted, ['amount', 'count'], batch_size)
+    return len(wanted)
+
+
+def recompute_daily_balances(first, end, batch_size=1000):
+    """
+    Recomputes the daily running totals of the users with ids in ``[first, end)`` and returns the
+    number of rows of the range. Unlike `DailyBalance.rebuild`, the day sums of all users of the
+    range are read with one grouped query per transaction table. Runs in one transaction with the
+    users and their balance rows locked, so writes made meanwhile are kept.
+    """
+    key = operator.attrgetter('user_id', 'date')
+    with transaction.atomic():
+        _lock_users(first, end)
+        current = {
+            key(row): row
+            for row in DailyBalance.objects.filter(user_id__gte=first, user_id__lt=end).select_for_update()
+        }
+        daily = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        for model, index in ((Income, 0), (Expense, 1)):
+            grouped = (
+                model.objects.filter(user_id__gte=first, user_id__lt=end)
+                .order_by()
+                .values('user_id', 'date')
+                .annotate(total=Sum('amount'))
+            )
+            for row in grouped.iterator():
+                daily[row['user_id']][row['date']][index] += row['total']
+
+        wanted = {}
+        for user_id, days in daily.items():
+            income = expenses = 0
+            for day in sorted(days):
+                income += days[day][0]
+                expenses += days[day][1]
+                balance = DailyBalance(user_id=user_id, date=day, cumulative_income=income, cumulative_expenses=expenses)
+                wanted[key(balance)] = balance
+        _sync(DailyBalance, current, wanted, ['cumulative_income', 'cumulative_expenses'], batch_size)
+    return len(wanted)
+
+
+def recompute_goal_totals(first, end, batch_size=1000):
+    """
+    Recomputes the stored contribution totals of the goals owned by the users with ids in
+    ``[first, end)``, writes the ones that drifted with chunked `bulk_update` calls and returns
+    the number of goals read. The goals are locked before the contributions are summed, so
+    `Goal.adjust_totals` of a concurrent write applies its delta after the recomputed value.
+    """
+    with transaction.atomic():
+        goals = list(
+            Goal.objects.filter(owner_id__gte=first, owner_id__lt=end)
+            .select_for_update()
+            .only('pk', 'current_amount', 'contribution_count')
+        )
+        totals = {
+            row['goal_id']: row
+            for row in Contribution.objects.filter(goal__owner_id__gte=first, goal__owner_id__lt=end)
+            .order_by()
+            .values('goal_id')
+            .annotate(amount=Sum('amount'), count=Count('id'))
+        }
+        drifted = []
+        for goal in goals:
+            row = totals.get(goal.pk, {'amount': 0, 'count': 0})
+            if goal.current_amount != row['amount'] or goal.contribution_count != row['count']:
+                goal.current_amount, goal.contribution_count = row['amount'], row['count']
+                drifted.append(goal)
+        Goal.objects.bulk_update(drifted, ['current_amount', 'contribution_count'], batch_size=batch_size)
+    return len(goals)
+
+
+RECOMPUTE = {
+    'monthly_totals': recompute_monthly_totals,
+    'daily_balances': recompute_daily_balances,
+    'goal_totals': recompute_goal_totals,
+}
+
+
+def recompute_shard(first, end, tasks=TASKS, batch_size=1000):
+    """
+    Recomputes the derived numbers of `tasks` for the users with ids in ``[first, end)`` and
+    invalidates their cached summaries. Returns the number of rows written or checked.
+    """
+    rows = sum(RECOMPUTE[task](first, end, batch_size) for task in tasks)
+    for user_id in User.objects.filter(pk__gte=first, pk__lt=end).values_list('pk', flat=True).iterator():
+        bump_data_version(user_id)
+    return rows
@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+_use_replica = ContextVar('budget_use_replica', default=False)
+
+
+def replica_alias():
+    """
+    Returns the alias of the read replica, or None when `REPLICA_DATABASE` is not one of `DATABASES`.
+    """
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def reads_from_replica():
+    """
+    Routes the reads made inside the block to the replica, if one is configured.
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to the replica only inside `reads_from_replica`, which `ReplicaRoutingMiddleware`
+    enters for the read-heavy views. Only models of the budget app are routed there: sessions and
+    users are always read from the primary, so a fresh login is never lost to replication lag.
+    Everything else, including every write, goes to 'default'.
+
+    To try it locally, configure two SQLite databases, e.g.:
+
+        DATABASES = {
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'primary.sqlite3'},
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3',
+                        'TEST': {'MIRROR': 'default'}},
+        }
+    """
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label == 'budget':
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary, so objects from both may be related.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == replica_alias():
+            return False
+        return None
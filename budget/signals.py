@@ -0,0 +1,211 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .cache import bump_data_version, bump_goals_version
+from .categories import bump_category_version
+from .models import Category, Goal, Contribution, Expense, Income, MonthlyCategoryTotal, DailyBalance
+
+
+def _amount(sender, instance):
+    # Instances written in code may still hold the amount as a string, an int or a float.
+    return sender._meta.get_field('amount').to_python(instance.amount)
+
+
+@receiver(pre_save, sender=Contribution)
+def remember_contribution(sender, instance, **kwargs):
+    """
+    Stores the goal and amount of an edited contribution as they are in the database,
+    so that `update_goal_totals` can take them back from the previous goal.
+    """
+    instance._previous = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous = sender.objects.filter(pk=instance.pk).values('goal_id', 'amount').first()
+
+
+@receiver(post_save, sender=Contribution)
+def update_goal_totals(sender, instance, created, **kwargs):
+    """
+    Keeps `Goal.current_amount` and `Goal.contribution_count` in sync when a contribution
+    is created or edited, including moving a contribution to another goal.
+    """
+    amount = _amount(sender, instance)
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        Goal.adjust_totals(instance.goal_id, amount, 1)
+    elif previous['goal_id'] == instance.goal_id:
+        if previous['amount'] != amount:
+            Goal.adjust_totals(instance.goal_id, amount - previous['amount'], 0)
+    else:
+        Goal.adjust_totals(previous['goal_id'], -previous['amount'], -1)
+        Goal.adjust_totals(instance.goal_id, amount, 1)
+
+
+@receiver(post_delete, sender=Contribution)
+def revert_goal_totals(sender, instance, **kwargs):
+    """
+    Takes a deleted contribution back from its goal's stored totals.
+    """
+    Goal.adjust_totals(instance.goal_id, -_amount(sender, instance), -1)
+
+
+def _rollup_kind(sender):
+    return MonthlyCategoryTotal.EXPENSE if sender is Expense else MonthlyCategoryTotal.INCOME
+
+
+def _transaction_date(sender, instance):
+    # Instances created in code may still hold the date as a string or a datetime.
+    return sender._meta.get_field('date').to_python(instance.date)
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+def remember_transaction(sender, instance, **kwargs):
+    """
+    Stores the user, category, date and amount of an edited transaction as they are in the database,
+    so that `update_monthly_totals` can take them back from the month and category they left.
+    """
+    instance._previous = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous = (
+            sender.objects.filter(pk=instance.pk)
+            .values('user_id', 'category_id', 'date', 'amount')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+def update_monthly_totals(sender, instance, created, **kwargs):
+    """
+    Keeps `MonthlyCategoryTotal` in sync when an expense or income is created or edited,
+    including moves between months, categories or users.
+    """
+    kind = _rollup_kind(sender)
+    day = _transaction_date(sender, instance)
+    amount = _amount(sender, instance)
+    previous = getattr(instance, '_previous', None)
+    current = (instance.user_id, instance.category_id, day.year, day.month)
+    if previous is None:
+        MonthlyCategoryTotal.adjust(instance.user_id, instance.category_id, kind, day, amount, 1)
+    elif (previous['user_id'], previous['category_id'], previous['date'].year, previous['date'].month) == current:
+        if previous['amount'] != amount:
+            MonthlyCategoryTotal.adjust(instance.user_id, instance.category_id, kind, day, amount - previous['amount'], 0)
+    else:
+        MonthlyCategoryTotal.adjust(
+            previous['user_id'], previous['category_id'], kind, previous['date'], -previous['amount'], -1
+        )
+        MonthlyCategoryTotal.adjust(instance.user_id, instance.category_id, kind, day, amount, 1)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def revert_monthly_totals(sender, instance, **kwargs):
+    """
+    Takes a deleted expense or income back from its monthly category total.
+    """
+    MonthlyCategoryTotal.adjust(
+        instance.user_id, instance.category_id, _rollup_kind(sender), _transaction_date(sender, instance),
+        -_amount(sender, instance), -1,
+    )
+
+
+def _bump_after_commit(*user_ids):
+    """
+    Bumps the data version of the given users once the current transaction commits, so a
+    concurrent request cannot cache data from before the write under the new version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    transaction.on_commit(lambda: [bump_data_version(user_id) for user_id in user_ids])
+
+
+def _goal_owner(goal_id):
+    return Goal.objects.filter(pk=goal_id).values_list('owner_id', flat=True).first()
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def invalidate_transaction_owner(sender, instance, **kwargs):
+    """
+    Invalidates the cached summaries of the user owning a written transaction, and of its
+    previous owner if it was moved to another user.
+    """
+    previous = getattr(instance, '_previous', None) or {}
+    _bump_after_commit(instance.user_id, previous.get('user_id'))
+
+
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+def invalidate_goal_users(sender, instance, created=False, **kwargs):
+    """
+    Invalidates the cached summaries of a goal's owner and, when an existing goal is edited,
+    of every user who contributed to it, since their dashboards list the goal too. Every user's
+    goals page lists the goal, so the goals version moves as well.
+    """
+    contributors = []
+    if kwargs['signal'] is post_save and not created:
+        contributors = Contribution.objects.filter(goal_id=instance.pk).values_list('contributor_id', flat=True).distinct()
+    _bump_after_commit(instance.owner_id, *contributors)
+    transaction.on_commit(bump_goals_version)
+
+
+@receiver(post_save, sender=Contribution)
+@receiver(post_delete, sender=Contribution)
+def invalidate_contribution_users(sender, instance, **kwargs):
+    """
+    Invalidates the cached summaries of a contributor and of the owner of the goal they
+    contributed to, including the previous goal when a contribution was moved. The goal's
+    progress changes on every user's goals page, so the goals version moves as well.
+    """
+    previous = getattr(instance, '_previous', None) or {}
+    owners = [_goal_owner(instance.goal_id)]
+    if previous.get('goal_id') not in (None, instance.goal_id):
+        owners.append(_goal_owner(previous['goal_id']))
+    _bump_after_commit(instance.contributor_id, *owners)
+    transaction.on_commit(bump_goals_version)
+
+
+def _balance_deltas(sender, amount):
+    return (amount, 0) if sender is Income else (0, amount)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+def update_daily_balances(sender, instance, created, **kwargs):
+    """
+    Keeps `DailyBalance` in sync when an expense or income is created or edited. A change of
+    category does not affect the running totals; any other change moves the amount.
+    """
+    day = _transaction_date(sender, instance)
+    amount = _amount(sender, instance)
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        if (previous['user_id'], previous['date'], previous['amount']) == (instance.user_id, day, amount):
+            return
+        DailyBalance.adjust(previous['user_id'], previous['date'], *_balance_deltas(sender, -previous['amount']))
+    DailyBalance.adjust(instance.user_id, day, *_balance_deltas(sender, amount))
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def revert_daily_balances(sender, instance, **kwargs):
+    """
+    Takes a deleted expense or income back from the running totals.
+    """
+    DailyBalance.adjust(
+        instance.user_id, _transaction_date(sender, instance), *_balance_deltas(sender, -_amount(sender, instance))
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, instance, **kwargs):
+    """
+    Makes every process reload the category registry. The version is bumped right away, so the
+    change is visible to the rest of the current transaction, and again once it commits, so no
+    process keeps a copy loaded in between. The category version is also part of the dashboard
+    cache key, so renamed categories show up there.
+    """
+    bump_category_version()
+    transaction.on_commit(bump_category_version)
@@ -0,0 +1,237 @@
+import operator
+from functools import reduce
+from datetime import date, timedelta
+from django.db.models import Sum, Q, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncDay, TruncWeek, TruncMonth, TruncYear
+from .models import Category, Expense, Income, MonthlyCategoryTotal, DailyBalance
+
+AMOUNT_FIELD = DecimalField(max_digits=21, decimal_places=2)
+
+SERIES_INTERVALS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+# Largest number of buckets a single time series may span.
+MAX_SERIES_BUCKETS = 5000
+
+
+def previous_month_range(today=None):
+    """
+    Returns a half-open ``(start, end)`` date range covering the whole previous month,
+    i.e. ``start <= date < end``. Unlike ``date__month`` lookups, the range is bound to
+    a single year and can be served by an index on the date column.
+    """
+    today = today or date.today()
+    end = today.replace(day=1)
+    start = (end - timedelta(days=1)).replace(day=1)
+    return start, end
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def split_range(start, end):
+    """
+    Splits the half-open date range ``[start, end)`` into the whole calendar months it covers
+    and the partial months at its edges.
+
+    Returns:
+        months (tuple | None): ``(first, last)`` first days of the first and last whole month.
+        edges (list): half-open ``(start, end)`` ranges that must be read from raw transactions.
+    """
+    first_whole = start if start.day == 1 else _next_month(start)
+    whole_end = end.replace(day=1)
+    if first_whole >= whole_end:
+        return None, [(start, end)] if start < end else []
+
+    edges = []
+    if start < first_whole:
+        edges.append((start, first_whole))
+    if whole_end < end:
+        edges.append((whole_end, end))
+    last_whole = (whole_end - timedelta(days=1)).replace(day=1)
+    return (first_whole, last_whole), edges
+
+
+def _months_q(first, last):
+    """
+    Builds a filter on `MonthlyCategoryTotal.year`/`month` matching every month from `first` to `last`.
+    """
+    if first.year == last.year:
+        return Q(year=first.year, month__gte=first.month, month__lte=last.month)
+    return (
+        Q(year=first.year, month__gte=first.month)
+        | Q(year__gt=first.year, year__lt=last.year)
+        | Q(year=last.year, month__lte=last.month)
+    )
+
+
+def _edges_q(edges):
+    return reduce(operator.or_, (Q(date__gte=edge_start, date__lt=edge_end) for edge_start, edge_end in edges))
+
+
+def _rollup_subquery(user, kind, months):
+    totals = (
+        MonthlyCategoryTotal.objects
+        .filter(_months_q(*months), user=user, kind=kind, category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=AMOUNT_FIELD), Value(0, output_field=AMOUNT_FIELD))
+
+
+def _raw_subquery(model, user, edges):
+    totals = (
+        model.objects
+        .filter(_edges_q(edges), user=user, category=OuterRef('pk'))
+        .order_by()
+        .values('category')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=AMOUNT_FIELD), Value(0, output_field=AMOUNT_FIELD))
+
+
+def category_totals(user, start, end):
+    """
+    Returns every category annotated with `total_expenses` and `total_incomes` of `user`
+    in the half-open date range ``[start, end)``, computed in a single query.
+
+    Whole months are summed from `MonthlyCategoryTotal`; raw transactions are only read for
+    the partial months at the edges of the range. Each source is a separate correlated subquery
+    rather than a join, which would multiply each amount by the row count of the other side.
+    """
+    months, edges = split_range(start, end)
+    annotations = {}
+    for name, model, kind in (
+        ('total_expenses', Expense, MonthlyCategoryTotal.EXPENSE),
+        ('total_incomes', Income, MonthlyCategoryTotal.INCOME),
+    ):
+        total = Value(0, output_field=AMOUNT_FIELD)
+        if months:
+            total = total + _rollup_subquery(user, kind, months)
+        if edges:
+            total = total + _raw_subquery(model, user, edges)
+        annotations[name] = total
+    return Category.objects.annotate(**annotations).order_by('pk')
+
+
+def balance_totals(user, start, end):
+    """
+    Returns the total income and expenses of `user` in the half-open date range ``[start, end)``
+    as ``(total_income, total_expenses)``, from two point lookups in `DailyBalance` whatever the
+    length of the range. An `end` of None leaves the range open, for ranges ending on the last
+    representable date. An empty or reversed range totals zero.
+    """
+    if end is not None and start >= end:
+        return 0, 0
+    end_income, end_expenses = DailyBalance.as_of(user.pk, end)
+    start_income, start_expenses = DailyBalance.as_of(user.pk, start)
+    return end_income - start_income, end_expenses - start_expenses
+
+
+def _bucket_start(day, interval):
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    if interval == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def _next_bucket(day, interval):
+    if interval == 'week':
+        return day + timedelta(days=7)
+    if interval == 'month':
+        return _next_month(day)
+    if interval == 'year':
+        return day.replace(year=day.year + 1)
+    return day + timedelta(days=1)
+
+
+def series_buckets(start, end, interval):
+    """
+    Returns the first days of every `interval` bucket overlapping the half-open range ``[start, end)``,
+    matching the values produced by the database truncation functions. An `end` of None leaves the
+    range open up to the last representable date.
+    """
+    buckets = []
+    bucket = _bucket_start(start, interval)
+    while end is None or bucket < end:
+        buckets.append(bucket)
+        try:
+            bucket = _next_bucket(bucket, interval)
+        except (OverflowError, ValueError):
+            # The bucket holds the last representable date.
+            break
+    return buckets
+
+
+def series_bucket_count(start, end, interval):
+    """
+    Returns the number of buckets `series_buckets` would return, computed without building them,
+    so a range that is too long for its interval is refused at constant cost.
+    """
+    if end is not None and start >= end:
+        return 0
+    last = date.max if end is None else end - timedelta(days=1)
+    first, final = _bucket_start(start, interval), _bucket_start(last, interval)
+    if interval == 'week':
+        return (final - first).days // 7 + 1
+    if interval == 'month':
+        return (final.year - first.year) * 12 + final.month - first.month + 1
+    if interval == 'year':
+        return final.year - first.year + 1
+    return (last - start).days + 1
+
+
+def time_series(user, start, end, interval='month', by_category=False):
+    """
+    Returns the income, expense and net series of `user` in the half-open range ``[start, end)``,
+    one value per `interval` bucket, optionally split by category. An `end` of None leaves the
+    range open.
+
+    Incomes and expenses are bucketed with database date truncation and summed in one grouped
+    UNION query; Python only places the returned totals, one per non-empty bucket, into series
+    that are pre-filled with zeros.
+
+    Returns:
+        buckets (list): First day of every bucket.
+        series (dict): ``{key: {'income': [...], 'expense': [...], 'net': [...]}}``, keyed by
+            category id when `by_category` is set and by None otherwise.
+    """
+    buckets = series_buckets(start, end, interval)
+    trunc = SERIES_INTERVALS[interval]
+    fields = ['bucket', 'category_id'] if by_category else ['bucket']
+
+    bounds = {'date__gte': start} if end is None else {'date__gte': start, 'date__lt': end}
+
+    def grouped(model, kind):
+        return (
+            model.objects
+            .filter(user=user, **bounds)
+            .annotate(bucket=trunc('date'))
+            .order_by()
+            .values(*fields)
+            .annotate(kind=Value(kind), total=Sum('amount'))
+        )
+
+    position = {bucket: index for index, bucket in enumerate(buckets)}
+    series = {}
+    for row in grouped(Income, 'income').union(grouped(Expense, 'expense'), all=True):
+        key = row['category_id'] if by_category else None
+        if key not in series:
+            series[key] = {kind: [0] * len(buckets) for kind in ('income', 'expense')}
+        series[key][row['kind']][position[row['bucket']]] += row['total']
+    if not by_category and None not in series:
+        series[None] = {kind: [0] * len(buckets) for kind in ('income', 'expense')}
+
+    for values in series.values():
+        values['net'] = [income - expense for income, expense in zip(values['income'], values['expense'])]
+    return buckets, series
@@ -0,0 +1,23 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    """
+    Clears the cache around every test, so cached summaries and data versions never leak between tests.
+    The tests run in one process, so they use a local-memory cache rather than the shared database
+    cache of the settings, which tests without database access could not reach.
+    """
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budget-tests'}}
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(settings, tmp_path_factory):
+    """
+    Points the metrics files of the test run at a temporary directory instead of the shared default one.
+    """
+    settings.METRICS_DIR = str(tmp_path_factory.getbasetemp() / 'metrics')
@@ -0,0 +1,124 @@
+import json
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from budget.benchmark import benchmark_user, clear, percentile, seed, skewed_weights, time_dashboards, time_transaction_writes
+from budget.models import Category, Expense, Goal, Income, MonthlyCategoryTotal
+
+
+# tests - benchmark.seed
+@pytest.mark.django_db
+def test_seed_creates_skewed_dataset():
+    """
+    Test that the benchmark seed creates the requested rows with the heaviest user first.
+    This test checks the transaction count, the skew and that derived totals are rebuilt.
+    """
+    users = seed(users=5, categories=3, goals_per_user=2, contributions=20, transactions=500, years=2, stdout=StringIO())
+
+    counts = [Expense.objects.filter(user=user).count() + Income.objects.filter(user=user).count() for user in users]
+    assert sum(counts) >= 500
+    assert counts[0] == max(counts)
+    assert counts[0] > counts[-1]
+    assert Goal.objects.count() == 10
+    assert sum(goal.contribution_count for goal in Goal.objects.all()) == 20
+    assert MonthlyCategoryTotal.objects.exists()
+
+
+def test_percentile_and_weights():
+    """
+    Test the nearest-rank percentile and that skewed weights sum to one.
+    """
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert sum(skewed_weights(10, 1.1)) == pytest.approx(1)
+    assert skewed_weights(3, 0) == pytest.approx([1 / 3] * 3)
+
+
+# tests - commands.benchmark_views
+@pytest.mark.django_db
+def test_benchmark_views_writes_results(tmp_path):
+    """
+    Test that the 'benchmark_views' command times every named URL and writes the results as JSON.
+    """
+    output = tmp_path / 'bench.json'
+
+    call_command('benchmark_views', sizes='100', requests=2, users=3, output=str(output), stdout=StringIO())
+
+    results = json.loads(output.read_text())
+    urls = results['runs'][0]['urls']
+    assert results['runs'][0]['transactions'] == 100
+    assert urls['dashboard']['status'] == 200
+    assert urls['transactions']['queries'] > 0
+    assert urls['dashboard']['p95_ms'] >= urls['dashboard']['p50_ms']
+
+
+# tests - benchmark.clear
+@pytest.mark.django_db
+def test_clear_removes_only_benchmark_data(django_user_model):
+    """
+    Test that clearing the benchmark data keeps other users and their transactions.
+    """
+    user = django_user_model.objects.create_user(username='testuser', password='password')
+    seed(users=3, categories=2, transactions=50, contributions=5, stdout=StringIO())
+    category = Category.objects.create(name='Food')
+    Expense.objects.create(user=user, name='Lunch', amount=10, category=category, date='2024-11-01')
+
+    clear()
+
+    assert list(django_user_model.objects.values_list('username', flat=True)) == ['testuser']
+    assert Expense.objects.count() == 1
+    assert Goal.objects.count() == 0
+    assert MonthlyCategoryTotal.objects.count() == 1
+
+
+
+# tests - benchmark.benchmark_user
+@pytest.mark.django_db
+def test_benchmark_user_defaults_to_the_heaviest_seeded_user(django_user_model):
+    """
+    Test that the benchmark user is the named user if given, otherwise the heaviest seeded user.
+    This test checks that a missing user is reported as a command error.
+    """
+    with pytest.raises(CommandError):
+        benchmark_user()
+    django_user_model.objects.create_user(username='alice', password='password')
+    users = seed(users=3, categories=2, transactions=50, contributions=5, stdout=StringIO())
+
+    assert benchmark_user() == users[0]
+    assert benchmark_user('alice').username == 'alice'
+    with pytest.raises(CommandError):
+        benchmark_user('nobody')
+
+
+# tests - benchmark.time_dashboards
+@pytest.mark.django_db(transaction=True)
+def test_time_dashboards_compares_sync_and_async(django_user_model):
+    """
+    Test that the dashboard benchmark times both views under simulated latency.
+    This test checks that both views take at least the latency of one query per request.
+    """
+    user = django_user_model.objects.create_user(username='testuser', password='password')
+
+    results = time_dashboards(user, requests=2, latency=0.01)
+
+    assert set(results) == {'sync', 'async'}
+    assert results['sync']['p50_ms'] >= 40
+    assert results['async']['p50_ms'] >= 10
+
+
+# tests - benchmark.time_transaction_writes
+@pytest.mark.django_db
+def test_time_transaction_writes_uses_both_paths(django_user_model):
+    """
+    Test that the write benchmark creates the requested expenses through the form and the batch API.
+    """
+    user = django_user_model.objects.create_user(username='testuser', password='password')
+    Category.objects.create(name='Food')
+
+    results = time_transaction_writes(user, count=6, batch_size=4)
+
+    assert results['form']['requests'] == 6
+    assert results['api']['requests'] == 2
+    assert Expense.objects.filter(user=user).count() == 12
+    assert results['api']['rows_per_s'] > 0
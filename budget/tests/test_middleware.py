@@ -0,0 +1,334 @@
+import json
+import logging
+import subprocess
+import sys
+import threading
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, RequestFactory
+from django.urls import resolve, reverse
+from django.contrib.auth.models import User
+from budget import metrics, routers
+from budget.instrumentation import QueryRecorder, fingerprint
+from budget.middleware import ProfilerMiddleware, ReplicaRoutingMiddleware
+from budget.models import Category, Expense, Goal
+from budget.views import AsyncDashboardView
+
+
+# tests - middleware.QueryInstrumentationMiddleware
+@pytest.mark.django_db
+def test_query_instrumentation_headers_and_log(client, settings, caplog):
+    """
+    Test that the instrumentation middleware reports the queries of a request in headers and a log line.
+    This test checks that the header count matches the logged count and that the log line is valid JSON.
+    """
+    settings.SQL_INSTRUMENTATION_HEADERS = True
+    User.objects.create_user(username='testuser', password='password')
+    client.login(username='testuser', password='password')
+
+    with caplog.at_level(logging.INFO, logger='budget.sql'):
+        response = client.get(reverse('goals'))
+
+    stats = json.loads(caplog.records[-1].getMessage())
+    assert stats['path'] == reverse('goals')
+    assert stats['queries'] > 0
+    assert response['X-DB-Query-Count'] == str(stats['queries'])
+    assert float(response['X-DB-Query-Time-Ms']) >= 0
+
+
+@pytest.mark.django_db
+def test_query_recorder_reports_duplicates():
+    """
+    Test that statements repeated with different parameters are reported as one duplicate fingerprint.
+    This test checks the recorder on an N+1 pattern of per-goal lookups.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    goals = [Goal.objects.create(owner=user, name=f'Goal {i}', target_amount=100) for i in range(3)]
+
+    recorder = QueryRecorder()
+    with recorder.record():
+        for goal in goals:
+            Goal.objects.get(pk=goal.pk)
+
+    assert recorder.count == 3
+    assert list(recorder.duplicates().values()) == [3]
+    assert recorder.slowest in recorder.queries
+    assert fingerprint("SELECT 1 FROM t WHERE id IN (%s, %s) AND name = 'x'") == fingerprint(
+        "SELECT 1 FROM t WHERE id IN (%s)  AND name = 'y'"
+    )
+
+
+# tests - routers.PrimaryReplicaRouter and middleware.ReplicaRoutingMiddleware
+def test_router_reads_from_replica_only_when_asked(settings):
+    """
+    Test that the router sends reads to the replica only inside `reads_from_replica`.
+    This test checks that writes and migrations never go to the replica and that a missing replica falls back to the default routing.
+    """
+    settings.DATABASES = {**settings.DATABASES, 'replica': {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}}}
+    router = routers.PrimaryReplicaRouter()
+
+    assert router.db_for_read(Expense) is None
+    with routers.reads_from_replica():
+        assert router.db_for_read(Expense) == 'replica'
+        assert router.db_for_write(Expense) == 'default'
+    assert router.db_for_read(Expense) is None
+    assert router.allow_migrate('replica', 'budget') is False
+    assert router.allow_migrate('default', 'budget') is None
+
+    settings.REPLICA_DATABASE = 'missing'
+    with routers.reads_from_replica():
+        assert router.db_for_read(Expense) is None
+
+
+@pytest.mark.django_db
+def test_replica_routing_sticks_to_primary_after_write(client, monkeypatch):
+    """
+    Test that read views use the replica until the user writes, and then stay on the primary.
+    This test checks that a form re-rendered with errors does not pin, that a successful POST to add_expense sets the pin cookie
+    and that the next dashboard request does not read from the replica.
+    """
+    replica_reads = []
+
+    def spy_alias():
+        replica_reads.append(True)
+        # The test database stands in for the replica.
+        return 'default'
+    monkeypatch.setattr(routers, 'replica_alias', spy_alias)
+
+    User.objects.create_user(username='testuser', password='password')
+    client.login(username='testuser', password='password')
+    category = Category.objects.create(name='Food')
+
+    client.get(reverse('dashboard'))
+    assert replica_reads
+
+    response = client.post(reverse('add_expense'), data={'name': 'Lunch', 'amount': '', 'category': category.id, 'date': '2024-11-19'})
+    assert response.status_code == 200
+    assert ReplicaRoutingMiddleware.COOKIE_NAME not in response.cookies
+
+    response = client.post(reverse('add_expense'), data={'name': 'Lunch', 'amount': 10, 'category': category.id, 'date': '2024-11-19'})
+    assert response.status_code == 302
+    assert ReplicaRoutingMiddleware.COOKIE_NAME in response.cookies
+
+    replica_reads.clear()
+    client.get(reverse('dashboard'))
+    assert not replica_reads
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('url_name', ['goals', 'transactions', 'budgets'])
+def test_replica_routing_under_asgi(monkeypatch, url_name):
+    """
+    Test that the read views answer under ASGI, where Django runs the hooks of sync middleware in separate contexts.
+    This test checks the views both with and without a replica configured.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    client = AsyncClient()
+    async_to_sync(client.aforce_login)(user)
+
+    assert async_to_sync(client.get)(reverse(url_name)).status_code == 200
+    monkeypatch.setattr(routers, 'replica_alias', lambda: 'default')
+    assert async_to_sync(client.get)(reverse(url_name)).status_code == 200
+
+
+# tests - middleware.MetricsMiddleware and views.metrics
+@pytest.fixture
+def metrics_store(settings, tmp_path, monkeypatch):
+    # Every test gets its own directory, so only its own flushed numbers are collected.
+    settings.METRICS_DIR = str(tmp_path)
+    settings.METRICS_PUBLIC = True
+    store = metrics.MetricsStore()
+    monkeypatch.setattr(metrics, 'store', store)
+    return store
+
+
+@pytest.mark.django_db
+def test_metrics_report_requests_per_view(client, metrics_store):
+    """
+    Test that handled requests show up in the Prometheus output labelled with their view name.
+    This test checks the request counter, the latency histogram and the query count histogram.
+    """
+    User.objects.create_user(username='testuser', password='password')
+    client.login(username='testuser', password='password')
+    client.get(reverse('goals'))
+    client.get(reverse('goals'))
+
+    response = client.get(reverse('metrics'))
+
+    body = response.content.decode()
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'budget_http_requests_total{method="GET",status="200",view="goals"} 2' in body
+    assert 'budget_http_request_duration_seconds_bucket{view="goals",le="+Inf"} 2' in body
+    assert 'budget_db_queries_per_request_count{view="goals"} 2' in body
+    assert '# TYPE budget_http_request_duration_seconds histogram' in body
+    assert 'budget_jobs{status="queued"} 0' in body
+
+
+@pytest.mark.django_db
+def test_metrics_add_up_worker_processes(client, metrics_store, tmp_path):
+    """
+    Test that the numbers flushed by other worker processes are added to the ones of the
+    process answering the scrape, and that a forked process starts with numbers of its own.
+    """
+    other = metrics.MetricsStore()
+    other.inc('budget_http_requests_total', {'view': 'budgets', 'method': 'GET', 'status': '200'}, 3)
+    other.observe('budget_http_request_duration_seconds', {'view': 'budgets'}, 0.2, metrics.LATENCY_BUCKETS)
+    other.flush(force=True)
+    metrics_store.inc('budget_http_requests_total', {'view': 'budgets', 'method': 'GET', 'status': '200'}, 2)
+    metrics_store.observe('budget_http_request_duration_seconds', {'view': 'budgets'}, 0.02, metrics.LATENCY_BUCKETS)
+
+    body = client.get(reverse('metrics')).content.decode()
+
+    assert 'budget_http_requests_total{method="GET",status="200",view="budgets"} 5' in body
+    assert 'budget_http_request_duration_seconds_bucket{view="budgets",le="0.025"} 1' in body
+    assert 'budget_http_request_duration_seconds_bucket{view="budgets",le="0.25"} 2' in body
+
+    other._pid = -1
+    assert other.snapshot() == {'counters': [], 'histograms': []}
+
+
+def test_metrics_archive_files_of_exited_processes(metrics_store, tmp_path):
+    """
+    Test that the file of a process that exited is folded into the archive file without changing the totals.
+    """
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    dead_pid = int(exited.stdout)
+    snapshot = {'counters': [['budget_http_requests_total', [['view', 'goals']], 4]], 'histograms': []}
+    (tmp_path / f'metrics-{dead_pid}-1.json').write_text(json.dumps(snapshot))
+    (tmp_path / metrics.ARCHIVE_NAME).write_text(json.dumps(snapshot))
+    key = ('budget_http_requests_total', (('view', 'goals'),))
+
+    assert metrics_store.collect()[0][key] == 8
+    assert metrics_store.collect()[0][key] == 8
+    assert sorted(path.name for path in tmp_path.glob('metrics-*')) == [metrics.ARCHIVE_NAME]
+
+
+def test_metrics_flush_from_concurrent_threads(metrics_store):
+    """
+    Test that threads of one process flushing at the same time do not fail on the shared temporary file.
+    """
+    errors = []
+
+    def flush():
+        try:
+            for _ in range(50):
+                metrics_store.inc('budget_http_requests_total', {'view': 'goals'})
+                metrics_store.flush(force=True)
+        except Exception as exc:
+            errors.append(exc)
+    threads = [threading.Thread(target=flush) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+@pytest.mark.django_db
+def test_metrics_failures_do_not_fail_the_request(client, metrics_store, monkeypatch):
+    """
+    Test that a request whose metrics cannot be recorded is still answered normally.
+    """
+    def broken(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(metrics, 'observe_request', broken)
+
+    assert client.get(reverse('login')).status_code == 200
+
+
+@pytest.mark.django_db
+def test_metrics_require_the_configured_token(client, settings, metrics_store):
+    """
+    Test that scrapes without the configured bearer token are refused unless metrics are public.
+    This test checks that staff users may read the metrics without the token.
+    """
+    settings.METRICS_PUBLIC = False
+    assert client.get(reverse('metrics')).status_code == 401
+
+    settings.METRICS_TOKEN = 'secret'
+    assert client.get(reverse('metrics')).status_code == 401
+    assert client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code == 401
+    assert client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code == 200
+
+    User.objects.create_user(username='staff', password='password', is_staff=True)
+    client.login(username='staff', password='password')
+    assert client.get(reverse('metrics')).status_code == 200
+
+
+# tests - middleware.ProfilerMiddleware
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name', ['dashboard', 'goals', 'transactions', 'budgets'])
+def test_profiler_reports_instead_of_the_page_for_staff(client, url_name):
+    """
+    Test that a staff user adding ?profile=1 to a read view gets the profile report instead of the page.
+    This test checks the function table, the recorded statements and the plans of the slowest ones.
+    """
+    user = User.objects.create_user(username='staff', password='password', is_staff=True)
+    Goal.objects.create(owner=user, name='Goal', target_amount=100)
+    client.login(username='staff', password='password')
+    etag = client.get(reverse(url_name)).get('ETag')
+
+    response = client.get(reverse(url_name), {'profile': 'cold'}, HTTP_IF_NONE_MATCH=etag or '')
+
+    body = response.content.decode()
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'text/plain; charset=utf-8'
+    assert response['Cache-Control'] == 'no-store'
+    assert f'Profile of GET {reverse(url_name)}?profile=cold ({url_name}) as staff' in body
+    assert 'Status 200' in body
+    assert 'cumulative' in body and 'function calls' in body
+    assert '#1 ' in body and 'SELECT' in body
+    assert '== Plans of the' in body
+
+
+@pytest.mark.django_db
+def test_profiler_is_ignored_for_other_users(client):
+    """
+    Test that the profile parameter and header are ignored for users who are not staff.
+    """
+    User.objects.create_user(username='testuser', password='password')
+    client.login(username='testuser', password='password')
+
+    response = client.get(reverse('goals'), {'profile': '1'}, HTTP_X_PROFILE='1')
+
+    assert response['Content-Type'].startswith('text/html')
+    assert b'Profile of' not in response.content
+
+
+@pytest.mark.django_db
+def test_profiler_runs_as_another_user_for_superusers(client):
+    """
+    Test that superusers can profile a view as another user, while other staff users cannot.
+    """
+    User.objects.create_user(username='admin', password='password', is_staff=True, is_superuser=True)
+    User.objects.create_user(username='staff', password='password', is_staff=True)
+    User.objects.create_user(username='slow', password='password')
+
+    client.login(username='admin', password='password')
+    assert 'as slow' in client.get(reverse('goals'), {'profile': '1', 'profile_user': 'slow'}).content.decode()
+    assert client.get(reverse('goals'), {'profile': '1', 'profile_user': 'nobody'}).status_code == 404
+
+    client.login(username='staff', password='password')
+    assert 'as staff' in client.get(reverse('goals'), {'profile': '1', 'profile_user': 'slow'}).content.decode()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_profiler_records_statements_of_async_dashboard_sections():
+    """
+    Test that the statements the async dashboard runs in its section threads are in the report.
+    """
+    user = User.objects.create_user(username='staff', password='password', is_staff=True)
+    Goal.objects.create(owner=user, name='Goal', target_amount=100)
+    request = RequestFactory().get(reverse('dashboard'), HTTP_X_PROFILE='1')
+    request.resolver_match = resolve(request.path)
+    request.user = user
+
+    async def auser():
+        return user
+    request.auser = auser
+
+    response = ProfilerMiddleware(lambda request: None).process_view(request, AsyncDashboardView.as_view(), (), {})
+
+    assert 'FROM "budget_goal"' in response.content.decode()
@@ -0,0 +1,782 @@
+import json
+import os
+import pytest
+import signal
+import time
+from io import StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from budget import jobs, partitions
+from budget.bulk import delete_transactions, update_transactions
+from budget.categories import CategoryRegistry, bump_category_version
+from budget.checks import check_shared_cache
+from budget.models import Goal, Contribution, Category, Expense, Income, MonthlyCategoryTotal, DailyBalance, Job
+from budget.recompute import recompute_shard
+from budget.summaries import split_range, category_totals, balance_totals, series_buckets, series_bucket_count
+
+
+# tests - models.Goal totals
+@pytest.mark.django_db
+def test_goal_totals_follow_contribution_changes():
+    """
+    Test that the stored goal totals are kept in sync when contributions are created, edited and deleted.
+    This test checks the amount and count after each kind of write, including moving a contribution to another goal.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    goal = Goal.objects.create(owner=user, name='Bike', target_amount=1000)
+    other_goal = Goal.objects.create(owner=user, name='Car', target_amount=5000)
+
+    contribution = Contribution.objects.create(goal=goal, contributor=user, amount=100)
+    Contribution.objects.create(goal=goal, contributor=user, amount=50)
+    goal.refresh_from_db()
+    assert goal.current_amount == 150
+    assert goal.contribution_count == 2
+    assert goal.current_percentage == 15.0
+
+    contribution.amount = 300
+    contribution.save()
+    goal.refresh_from_db()
+    assert goal.current_amount == 350
+
+    contribution.goal = other_goal
+    contribution.save()
+    goal.refresh_from_db()
+    other_goal.refresh_from_db()
+    assert (goal.current_amount, goal.contribution_count) == (50, 1)
+    assert (other_goal.current_amount, other_goal.contribution_count) == (300, 1)
+
+    contribution.delete()
+    other_goal.refresh_from_db()
+    assert (other_goal.current_amount, other_goal.contribution_count) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_rebuild_goal_totals_command():
+    """
+    Test that the 'rebuild_goal_totals' command detects and repairs drifted goal totals.
+    This test checks that '--check' fails on drift and that a plain run restores the correct values.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    goal = Goal.objects.create(owner=user, name='Bike', target_amount=1000)
+    Contribution.objects.create(goal=goal, contributor=user, amount=100)
+    Goal.objects.filter(pk=goal.pk).update(current_amount=0, contribution_count=0)
+
+    with pytest.raises(CommandError):
+        call_command('rebuild_goal_totals', '--check', stdout=StringIO())
+
+    call_command('rebuild_goal_totals', stdout=StringIO())
+    goal.refresh_from_db()
+    assert goal.current_amount == 100
+    assert goal.contribution_count == 1
+
+    call_command('rebuild_goal_totals', '--check', stdout=StringIO())
+
+
+# tests - models.MonthlyCategoryTotal
+@pytest.mark.django_db
+def test_monthly_totals_follow_transaction_changes():
+    """
+    Test that the monthly rollup is kept in sync when transactions are created, edited and deleted.
+    This test checks moves between months and categories as well as amount changes within a month.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    food = Category.objects.create(name='Food')
+    rent = Category.objects.create(name='Rent')
+
+    def total(category, year, month):
+        row = MonthlyCategoryTotal.objects.filter(
+            user=user, category=category, kind=MonthlyCategoryTotal.EXPENSE, year=year, month=month
+        ).first()
+        return (row.amount, row.count) if row else None
+
+    expense = Expense.objects.create(user=user, name='Lunch', amount=20, category=food, date=date(2024, 11, 5))
+    Expense.objects.create(user=user, name='Dinner', amount=30, category=food, date=date(2024, 11, 6))
+    assert total(food, 2024, 11) == (50, 2)
+
+    expense.amount = 25
+    expense.save()
+    assert total(food, 2024, 11) == (55, 2)
+
+    expense.date = date(2024, 12, 1)
+    expense.category = rent
+    expense.save()
+    assert total(food, 2024, 11) == (30, 1)
+    assert total(rent, 2024, 12) == (25, 1)
+
+    expense.delete()
+    assert total(rent, 2024, 12) == (0, 0)
+    assert not MonthlyCategoryTotal.objects.filter(kind=MonthlyCategoryTotal.INCOME).exists()
+
+
+@pytest.mark.django_db
+def test_derived_totals_follow_edits_with_string_amounts():
+    """
+    Test that editing a transaction or a contribution with an amount given as a string keeps the rollup and the
+    goal totals in sync.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    food = Category.objects.create(name='Food')
+    expense = Expense.objects.create(user=user, name='Lunch', amount=20, category=food, date=date(2024, 11, 5))
+    goal = Goal.objects.create(owner=user, name='Bike', target_amount=1000)
+    contribution = Contribution.objects.create(goal=goal, contributor=user, amount=100)
+
+    expense.amount = '7'
+    expense.save()
+    contribution.amount = '7.50'
+    contribution.save()
+
+    row = MonthlyCategoryTotal.objects.get(user=user, category=food, year=2024, month=11)
+    assert (row.amount, row.count) == (7, 1)
+    goal.refresh_from_db()
+    assert goal.current_amount == Decimal('7.50')
+
+@pytest.mark.django_db
+def test_rebuild_monthly_totals_command():
+    """
+    Test that the 'rebuild_monthly_totals' command recreates the rollup from raw transactions.
+    This test checks that a wiped rollup is restored with the correct amounts and counts.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    category = Category.objects.create(name='Salary')
+    Income.objects.create(user=user, name='Salary', amount=2000, category=category, date=date(2024, 10, 1))
+    Income.objects.create(user=user, name='Bonus', amount=500, category=category, date=date(2024, 10, 20))
+    MonthlyCategoryTotal.objects.all().delete()
+
+    call_command('rebuild_monthly_totals', stdout=StringIO())
+
+    row = MonthlyCategoryTotal.objects.get(user=user, category=category, year=2024, month=10)
+    assert row.kind == MonthlyCategoryTotal.INCOME
+    assert row.amount == 2500
+    assert row.count == 2
+
+
+
+@pytest.mark.django_db
+def test_rebuild_monthly_totals_updates_rows_in_place():
+    """
+    Test that the 'rebuild_monthly_totals' command repairs drifted rollup rows in place, one user at a time.
+    This test checks that the repaired row keeps its id, so a concurrent delta waiting on its lock is applied on
+    top of the rebuilt value, and that users not selected are left alone.
+    """
+    users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(2)]
+    food = Category.objects.create(name='Food')
+    for user in users:
+        Expense.objects.create(user=user, name='Lunch', amount=10, category=food, date=date(2024, 1, 5))
+    MonthlyCategoryTotal.objects.update(amount=0)
+    row = MonthlyCategoryTotal.objects.get(user=users[0])
+
+    out = StringIO()
+    call_command('rebuild_monthly_totals', users=[users[0].pk], stdout=out)
+
+    assert MonthlyCategoryTotal.objects.get(user=users[0]).pk == row.pk
+    assert MonthlyCategoryTotal.objects.get(user=users[0]).amount == 10
+    assert MonthlyCategoryTotal.objects.get(user=users[1]).amount == 0
+    assert 'Rebuilt 1 monthly total(s).' in out.getvalue()
+
+
+# tests - summaries.category_totals
+@pytest.mark.django_db
+def test_category_totals_combine_rollup_and_partial_months():
+    """
+    Test that category totals read whole months from the rollup and partial months from raw rows.
+    This test checks a range that starts and ends in the middle of a month.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    category = Category.objects.create(name='Food')
+    for day, amount in ((date(2024, 1, 10), 1), (date(2024, 1, 20), 2), (date(2024, 2, 15), 4), (date(2024, 3, 5), 8), (date(2024, 3, 25), 16)):
+        Expense.objects.create(user=user, name='Expense', amount=amount, category=category, date=day)
+    Income.objects.create(user=user, name='Income', amount=100, category=category, date=date(2024, 2, 1))
+
+    assert split_range(date(2024, 1, 15), date(2024, 3, 10)) == (
+        (date(2024, 2, 1), date(2024, 2, 1)),
+        [(date(2024, 1, 15), date(2024, 2, 1)), (date(2024, 3, 1), date(2024, 3, 10))],
+    )
+    summary = category_totals(user, date(2024, 1, 15), date(2024, 3, 10)).get()
+    assert summary.total_expenses == 14
+    assert summary.total_incomes == 100
+
+
+# tests - commands.import_transactions
+@pytest.mark.django_db
+def test_import_transactions_command(tmp_path):
+    """
+    Test that the 'import_transactions' command imports valid rows and reports rejected ones.
+    This test checks created categories, the rejected lines and that the monthly rollup includes the imported rows.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    Category.objects.create(name='Food')
+    path = tmp_path / 'ledger.csv'
+    path.write_text(
+        'date,type,name,category,amount\n'
+        '2024-11-01,expense,Lunch,Food,20.50\n'
+        '2024-11-02,income,Salary,Salary,3000\n'
+        '2024-11-03,expense,Refund,Food,-5\n'
+        'not-a-date,expense,Dinner,Food,10\n'
+        '2024-11-04,expense,Dinner,Food,10\n'
+    )
+    stdout, stderr = StringIO(), StringIO()
+
+    call_command('import_transactions', str(path), username='testuser', batch_size=2, stdout=stdout, stderr=stderr)
+
+    assert Expense.objects.filter(user=user).count() == 2
+    assert Income.objects.get(user=user).category.name == 'Salary'
+    assert Category.objects.filter(name='Food').count() == 1
+    assert 'Line 4 rejected: amount: Amount must be a positive number.' in stderr.getvalue()
+    assert 'Line 5 rejected: date:' in stderr.getvalue()
+    assert '3 row(s) imported' in stdout.getvalue()
+    food = MonthlyCategoryTotal.objects.get(user=user, kind=MonthlyCategoryTotal.EXPENSE, year=2024, month=11)
+    assert (food.amount, food.count) == (Decimal('30.50'), 2)
+
+
+
+@pytest.mark.django_db
+def test_import_transactions_rebuilds_running_totals_once(tmp_path, monkeypatch):
+    """
+    Test that importing an unsorted file in several batches rebuilds the running totals once, from the earliest
+    imported date, and that they match the imported rows.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    path = tmp_path / 'ledger.csv'
+    path.write_text(
+        'date,type,name,category,amount\n'
+        '2024-11-03,expense,Lunch,Food,20\n'
+        '2024-01-02,income,Salary,Salary,3000\n'
+        '2024-06-01,expense,Dinner,Food,10\n'
+        '2023-12-31,expense,Party,Food,5\n'
+        '2024-11-04,expense,Coffee,Food,2\n'
+    )
+    rebuilds = []
+    rebuild = DailyBalance.rebuild
+    monkeypatch.setattr(DailyBalance, 'rebuild', lambda user_id, since=None: rebuilds.append(since) or rebuild(user_id, since))
+
+    call_command('import_transactions', str(path), username='testuser', batch_size=2, stdout=StringIO())
+
+    assert rebuilds == [date(2023, 12, 31)]
+    assert balance_totals(user, date(2023, 1, 1), date(2025, 1, 1)) == (3000, 37)
+    assert balance_totals(user, date(2024, 1, 1), date(2024, 7, 1)) == (3000, 10)
+
+
+# tests - summaries.series_bucket_count
+@pytest.mark.parametrize('interval', ['day', 'week', 'month', 'year'])
+def test_series_bucket_count_matches_series_buckets(interval):
+    """
+    Test that the computed bucket count equals the number of buckets built for non-empty ranges, including ranges
+    ending on the last date and open ranges.
+    """
+    days = [date(2023, 12, 29), date(2024, 1, 1), date(2024, 1, 2), date(2024, 2, 29), date(2025, 1, 1), date(2025, 3, 17)]
+    # Open ranges, up to the last date, are only built for years: other intervals take too many buckets.
+    ends = days + [date(9999, 12, 31)] + ([None] if interval == 'year' else [])
+    for start in days:
+        for end in ends:
+            if end is None or start < end and (end.year - start.year < 100 or interval == 'year'):
+                assert series_bucket_count(start, end, interval) == len(series_buckets(start, end, interval))
+
+
+# tests - models.DailyBalance
+@pytest.mark.django_db
+def test_daily_balances_answer_arbitrary_ranges():
+    """
+    Test that the running totals stay consistent with raw transactions through creates, edits and deletes.
+    This test compares every range total, reversed ones included, with a direct aggregation and with a full rebuild.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    category = Category.objects.create(name='Food')
+    expenses = [
+        Expense.objects.create(user=user, name='Expense', amount=amount, category=category, date=day)
+        for day, amount in ((date(2024, 1, 10), 10), (date(2024, 1, 5), 20), (date(2024, 2, 1), 40))
+    ]
+    Income.objects.create(user=user, name='Salary', amount=1000, category=category, date=date(2024, 1, 7))
+
+    expenses[0].date = date(2024, 1, 1)
+    expenses[0].amount = 15
+    expenses[0].save()
+    expenses[2].delete()
+
+    days = [date(2023, 12, 31)] + [date(2024, 1, 1) + timedelta(days=i) for i in range(40)]
+    # Reversed ranges are included: like the aggregation, they total zero.
+    for start in days[::3]:
+        for end in days[::4]:
+            expected = tuple(
+                model.objects.filter(user=user, date__gte=start, date__lt=end).aggregate(Sum('amount'))['amount__sum'] or 0
+                for model in (Income, Expense)
+            )
+            assert balance_totals(user, start, end) == expected
+
+    balances = list(DailyBalance.objects.filter(user=user).order_by('date').values_list('date', 'cumulative_income', 'cumulative_expenses'))
+    call_command('rebuild_daily_balances', stdout=StringIO())
+    rebuilt = list(DailyBalance.objects.filter(user=user).order_by('date').values_list('date', 'cumulative_income', 'cumulative_expenses'))
+    assert [row for row in balances if row[0] in {r[0] for r in rebuilt}] == rebuilt
+
+
+
+@pytest.mark.django_db
+def test_daily_balances_accept_string_and_float_amounts():
+    """
+    Test that transactions created and edited with amounts given as strings or floats move the running totals.
+    This test checks a float amount dated after an existing balance, which adds to that balance.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    category = Category.objects.create(name='Food')
+    expense = Expense.objects.create(user=user, name='Lunch', amount='10.50', category=category, date=date(2024, 1, 5))
+    Income.objects.create(user=user, name='Salary', amount='100', category=category, date=date(2024, 1, 1))
+    Expense.objects.create(user=user, name='Dinner', amount=2.25, category=category, date=date(2024, 2, 1))
+
+    expense.amount = '7'
+    expense.save()
+
+    assert balance_totals(user, date(2024, 1, 1), date(2024, 3, 1)) == (100, Decimal('9.25'))
+    assert DailyBalance.as_of(user.pk, date(2024, 3, 1)) == (100, Decimal('9.25'))
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='SQLite serializes every write.')
+def test_daily_balances_lock_the_user_before_reading():
+    """
+    Test that adjusting and rebuilding the running totals lock the user's row before reading the earlier totals.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    category = Category.objects.create(name='Food')
+
+    with CaptureQueriesContext(connection) as queries:
+        Expense.objects.create(user=user, name='Lunch', amount=10, category=category, date=date(2024, 1, 5))
+        DailyBalance.rebuild(user.pk)
+
+    statements = [query['sql'] for query in queries.captured_queries]
+    locks = [index for index, sql in enumerate(statements) if 'auth_user' in sql and 'FOR NO KEY UPDATE' in sql]
+    reads = [index for index, sql in enumerate(statements) if 'budget_dailybalance' in sql and sql.startswith('SELECT')]
+    assert len(locks) == 2 and locks[0] < reads[0]
+
+# tests - categories.CategoryRegistry
+@pytest.mark.django_db
+def test_category_registry_loads_once_until_categories_change(django_assert_num_queries):
+    """
+    Test that the registry serves categories from memory and reloads them after a change.
+    This test checks that repeated lookups run no query and that new and renamed categories are picked up.
+    """
+    food = Category.objects.create(name='Food')
+    registry = CategoryRegistry()
+
+    with django_assert_num_queries(1):
+        assert registry.get(food.pk).name == 'Food'
+        assert registry.choices() == [(food.pk, 'Food')]
+        assert registry.get(food.pk + 1) is None
+
+    health = Category.objects.create(name='Health')
+    food.name = 'Groceries'
+    food.save()
+    with django_assert_num_queries(1):
+        assert registry.choices() == [(food.pk, 'Groceries'), (health.pk, 'Health')]
+
+
+@pytest.mark.django_db
+def test_category_registry_reloads_when_another_process_bumps_the_version(django_assert_num_queries):
+    """
+    Test that a registry reloads when the shared category version changes without a signal in this process.
+    This test stands in for a category change made by another worker sharing the cache.
+    """
+    registry = CategoryRegistry()
+    assert registry.all() == []
+    Category.objects.bulk_create([Category(name='Food')])
+
+    with django_assert_num_queries(0):
+        assert registry.all() == []
+    bump_category_version()
+    with django_assert_num_queries(1):
+        assert [category.name for category in registry.all()] == ['Food']
+
+
+# tests - bulk.update_transactions and bulk.delete_transactions
+def derived_totals(user):
+    rollup = sorted(
+        MonthlyCategoryTotal.objects.filter(user=user, count__gt=0)
+        .values_list('category_id', 'kind', 'year', 'month', 'amount', 'count')
+    )
+    balances = list(
+        DailyBalance.objects.filter(user=user).order_by('date').values_list('date', 'cumulative_income', 'cumulative_expenses')
+    )
+    return rollup, balances
+
+
+@pytest.mark.django_db
+def test_bulk_updates_and_deletes_keep_derived_totals():
+    """
+    Test that set-based recategorize, redate and delete leave the same derived totals as a full rebuild.
+    This test also checks that rows of other users are left alone.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    other = User.objects.create_user(username='other', password='password')
+    food = Category.objects.create(name='Food')
+    rent = Category.objects.create(name='Rent')
+    expenses = [
+        Expense.objects.create(user=user, name='Expense', amount=amount, category=food, date=day)
+        for day, amount in ((date(2024, 1, 10), 10), (date(2024, 1, 20), 20), (date(2024, 2, 1), 40), (date(2024, 3, 3), 80))
+    ]
+    income = Income.objects.create(user=user, name='Salary', amount=1000, category=food, date=date(2024, 1, 7))
+    foreign = Expense.objects.create(user=other, name='Other', amount=5, category=food, date=date(2024, 1, 10))
+
+    ids = [expenses[0].pk, expenses[2].pk, foreign.pk]
+    assert update_transactions(user.pk, Expense, ids, category_id=rent.pk) == 2
+    assert update_transactions(user.pk, Expense, [expenses[1].pk, expenses[2].pk], day=date(2023, 12, 24)) == 2
+    assert update_transactions(user.pk, Income, [income.pk], category_id=rent.pk, day=date(2024, 2, 2)) == 1
+    assert delete_transactions(user.pk, Expense, [expenses[3].pk, foreign.pk]) == 1
+
+    assert Expense.objects.get(pk=foreign.pk).category == food
+    assert Expense.objects.get(pk=expenses[2].pk).category == rent
+    assert Expense.objects.get(pk=expenses[2].pk).date == date(2023, 12, 24)
+    assert not Expense.objects.filter(pk=expenses[3].pk).exists()
+
+    incremental = derived_totals(user)
+    call_command('rebuild_monthly_totals', stdout=StringIO())
+    call_command('rebuild_daily_balances', stdout=StringIO())
+    assert incremental == derived_totals(user)
+
+
+# tests - partitions
+postgresql_only = pytest.mark.skipif(connection.vendor != 'postgresql', reason='Partitioning needs PostgreSQL.')
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor == 'postgresql', reason='PostgreSQL tables are partitioned.')
+def test_manage_partitions_keeps_plain_tables_without_postgresql():
+    """
+    Test that the partition maintenance is a no-op on databases without partitioning.
+    This test checks that the command reports it and that the helpers change nothing.
+    """
+    out = StringIO()
+    call_command('manage_partitions', '--retain-years', '3', stdout=out)
+
+    assert 'stay plain tables' in out.getvalue()
+    assert partitions.ensure_partitions(connection, years_ahead=5) == []
+    assert partitions.detach_partitions(connection, before_year=2100) == []
+
+
+@pytest.mark.django_db
+def test_manage_partitions_rejects_negative_years():
+    """
+    Test that the partition maintenance command refuses negative year counts.
+    """
+    with pytest.raises(CommandError):
+        call_command('manage_partitions', '--years-ahead', '-1', stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_manage_partitions_leaves_detached_years_out_of_derived_tables(monkeypatch):
+    """
+    Test that after detaching partitions the monthly rollup and the daily balances no longer count the archived years.
+    This test stands in for the PostgreSQL detach by removing the old rows behind the ORM's back, as a detach does.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    food = Category.objects.create(name='Food')
+    year = date.today().year
+    Expense.objects.create(user=user, name='Old', amount=10, category=food, date=date(year - 5, 3, 1))
+    Expense.objects.create(user=user, name='New', amount=20, category=food, date=date(year, 1, 1))
+
+    def detach(connection, before_year):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM budget_expense WHERE "date" < %s', [date(before_year, 1, 1)])
+        return [partitions.partition_name('budget_expense', year - 5)]
+    monkeypatch.setattr(partitions, 'is_supported', lambda connection: True)
+    monkeypatch.setattr(partitions, 'ensure_partitions', lambda connection, years_ahead: [])
+    monkeypatch.setattr(partitions, 'detach_partitions', detach)
+
+    out = StringIO()
+    call_command('manage_partitions', '--retain-years', '3', stdout=out)
+
+    assert 'Recomputed the monthly rollup' in out.getvalue()
+    assert list(MonthlyCategoryTotal.objects.filter(user=user).values_list('year', 'amount')) == [(year, 20)]
+    assert balance_totals(user, date(year - 10, 1, 1), date(year + 1, 1, 1)) == (0, 20)
+    assert DailyBalance.as_of(user.pk, date(year, 1, 1)) == (0, 0)
+
+
+@postgresql_only
+@pytest.mark.django_db
+def test_partitions_are_created_and_detached():
+    """
+    Test that the transaction tables are partitioned by year after migrating.
+    This test checks that rows of a year without a partition move into it once it is created
+    and that detached years disappear from the table.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    food = Category.objects.create(name='Food')
+    year = date.today().year
+    assert partitions.is_partitioned(connection, 'budget_expense')
+    assert year in partitions.year_partitions(connection, 'budget_expense')
+
+    future = Expense.objects.create(user=user, name='Later', amount=10, category=food, date=date(year + 3, 6, 1))
+    current = Expense.objects.create(user=user, name='Now', amount=20, category=food, date=date(year, 1, 1))
+    created = partitions.ensure_partitions(connection, years_ahead=3)
+
+    assert partitions.partition_name('budget_expense', year + 3) in created
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id FROM {partitions.partition_name("budget_expense", year + 3)}')
+        assert cursor.fetchall() == [(future.pk,)]
+
+    detached = partitions.detach_partitions(connection, before_year=year + 1)
+    assert partitions.partition_name('budget_expense', year) in detached
+    assert list(Expense.objects.values_list('pk', flat=True)) == [future.pk]
+
+    # The archived row keeps no foreign key, so its user can still be deleted.
+    user.delete()
+    connection.check_constraints()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id FROM {partitions.partition_name("budget_expense", year)}')
+        assert cursor.fetchall() == [(current.pk,)]
+
+
+@postgresql_only
+@pytest.mark.django_db
+def test_date_range_queries_prune_partitions():
+    """
+    Test that a query on a date range only reads the partitions of the years in that range.
+    """
+    year = date.today().year
+    rows = Expense.objects.filter(date__gte=date(year, 3, 1), date__lt=date(year, 4, 1)).values('amount')
+    sql, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ' + sql, params)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+    assert partitions.partition_name('budget_expense', year) in plan
+    assert partitions.partition_name('budget_expense', year + 1) not in plan
+    assert partitions.default_partition_name('budget_expense') not in plan
+
+
+# tests - jobs
+@pytest.fixture
+def failing_job_kind():
+    calls = []
+
+    @jobs.register('test_failing')
+    def fail(job, progress):
+        calls.append(job.attempts)
+        raise RuntimeError('boom')
+
+    yield calls
+    del jobs._handlers['test_failing']
+
+
+@pytest.mark.django_db
+def test_jobs_claim_each_job_once():
+    """
+    Test that a claimed job is running and not claimed again by another worker.
+    This test checks that jobs scheduled for later are not claimed early.
+    """
+    first = jobs.enqueue('rebuild_monthly_totals')
+    jobs.enqueue('rebuild_daily_balances', run_after=timezone.now() + timedelta(hours=1))
+
+    claimed = jobs.claim('worker-a', limit=5)
+
+    assert [job.pk for job in claimed] == [first.pk]
+    assert claimed[0].status == Job.RUNNING and claimed[0].attempts == 1
+    assert jobs.claim('worker-b', limit=5) == []
+
+
+@pytest.mark.django_db
+def test_jobs_failures_are_retried_with_backoff(settings, failing_job_kind):
+    """
+    Test that a failing job is queued again with a doubling delay and fails after its last attempt.
+    """
+    settings.JOB_RETRY_DELAY = 10
+    settings.JOB_MAX_ATTEMPTS = 3
+    job = jobs.enqueue('test_failing')
+
+    delays = []
+    for _ in range(3):
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        claimed, = jobs.claim('worker')
+        started = timezone.now()
+        status = jobs.run(claimed)
+        job.refresh_from_db()
+        if status == Job.QUEUED:
+            delays.append(round((job.run_after - started).total_seconds()))
+
+    assert failing_job_kind == [1, 2, 3]
+    assert delays == [10, 20]
+    assert job.status == Job.FAILED
+    assert 'RuntimeError: boom' in job.error
+
+
+@pytest.mark.django_db
+def test_jobs_of_dead_workers_are_claimed_again(settings):
+    """
+    Test that a running job whose heartbeat stopped is claimed by another worker,
+    while a job with a fresh heartbeat is left to its worker.
+    """
+    settings.JOB_STALE_SECONDS = 60
+    stale = jobs.enqueue('rebuild_monthly_totals')
+    alive = jobs.enqueue('rebuild_daily_balances')
+    jobs.claim('dead', limit=2)
+    Job.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+    jobs.heartbeat('dead', [alive.pk])
+
+    claimed = jobs.claim('worker', limit=2)
+
+    assert [job.pk for job in claimed] == [stale.pk]
+    assert claimed[0].attempts == 2
+
+
+@pytest.mark.django_db
+def test_rebuild_job_rebuilds_the_users_totals():
+    """
+    Test that a rebuild job runs the rebuild command for the job's user and records its output.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    food = Category.objects.create(name='Food')
+    Expense.objects.create(user=user, name='Lunch', amount=10, category=food, date=date(2024, 1, 5))
+    MonthlyCategoryTotal.objects.all().delete()
+    job = jobs.enqueue('rebuild_monthly_totals', user=user)
+
+    assert jobs.run(jobs.claim('worker')[0]) == Job.SUCCEEDED
+
+    job.refresh_from_db()
+    assert job.percent == 100
+    assert job.result['output']
+    assert MonthlyCategoryTotal.objects.get(user=user).amount == 10
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_worker_runs_queued_jobs():
+    """
+    Test that `run_worker --burst` runs every runnable job on its thread pool and then exits.
+    """
+    for kind in ('rebuild_monthly_totals', 'rebuild_daily_balances', 'rebuild_monthly_totals'):
+        jobs.enqueue(kind)
+    out = StringIO()
+
+    # One thread: writers on the in-memory SQLite test database fail instead of waiting on each other.
+    call_command('run_worker', '--burst', '--concurrency', '1', '--poll-interval', '0.05', stdout=out)
+
+    assert set(Job.objects.values_list('status', flat=True)) == {Job.SUCCEEDED}
+    assert '3 succeeded' in out.getvalue()
+
+
+
+@pytest.fixture
+def stopping_job_kind():
+    @jobs.register('test_stopping')
+    def stop_worker(job, progress):
+        os.kill(os.getpid(), signal.SIGTERM)
+        time.sleep(0.2)
+        stopped = timezone.now()
+        time.sleep(0.3)
+        return {'stopped': stopped.isoformat(), 'heartbeat': Job.objects.get(pk=job.pk).heartbeat_at.isoformat()}
+
+    previous = signal.getsignal(signal.SIGTERM)
+    yield
+    signal.signal(signal.SIGTERM, previous)
+    del jobs._handlers['test_stopping']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_worker_keeps_heartbeating_while_stopping(stopping_job_kind):
+    """
+    Test that after SIGTERM, `run_worker` waits for the running job and keeps its heartbeat fresh
+    meanwhile, so other workers do not claim it again.
+    """
+    job = jobs.enqueue('test_stopping')
+    out = StringIO()
+
+    call_command('run_worker', '--concurrency', '1', '--poll-interval', '0.05', stdout=out)
+
+    job.refresh_from_db()
+    assert job.status == Job.SUCCEEDED
+    assert job.result['heartbeat'] > job.result['stopped']
+    assert 'Waiting for the running jobs to finish.' in out.getvalue()
+
+# tests - commands.recompute_totals
+def drifted_users():
+    users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(2)]
+    food = Category.objects.create(name='Food')
+    for user in users:
+        Expense.objects.create(user=user, name='Lunch', amount=10, category=food, date=date(2024, 1, 5))
+        Income.objects.create(user=user, name='Salary', amount=100, category=food, date=date(2024, 1, 1))
+        goal = Goal.objects.create(owner=user, name='Goal', target_amount=100)
+        Contribution.objects.create(goal=goal, contributor=user, amount=25)
+    MonthlyCategoryTotal.objects.update(amount=0)
+    DailyBalance.objects.update(cumulative_income=0)
+    Goal.objects.update(current_amount=0)
+    return users
+
+
+@pytest.mark.django_db
+def test_recompute_totals_restores_derived_numbers(tmp_path):
+    """
+    Test that recomputing in shards leaves the same derived numbers as the rebuild commands.
+    This test checks the rollup, the daily balances and the goal totals, and that the checkpoint is removed.
+    """
+    users = drifted_users()
+    checkpoint = tmp_path / 'checkpoint.json'
+    out = StringIO()
+
+    call_command('recompute_totals', '--workers', '0', '--shard-size', '1', '--checkpoint', str(checkpoint), stdout=out)
+
+    recomputed = [derived_totals(user) for user in users]
+    call_command('rebuild_monthly_totals', stdout=StringIO())
+    call_command('rebuild_daily_balances', stdout=StringIO())
+    assert recomputed == [derived_totals(user) for user in users]
+    assert set(Goal.objects.values_list('current_amount', flat=True)) == {25}
+    assert 'rows/s' in out.getvalue()
+    assert not checkpoint.exists()
+
+
+@pytest.mark.django_db
+def test_recompute_updates_derived_rows_in_place():
+    """
+    Test that recomputing updates the existing derived rows instead of replacing them, and removes rows without transactions.
+    Concurrent writes blocked on a locked row rely on it to apply their delta to the recomputed value.
+    """
+    first, second = drifted_users()
+    rollup_ids = set(MonthlyCategoryTotal.objects.values_list('pk', flat=True))
+    balance_ids = set(DailyBalance.objects.values_list('pk', flat=True))
+    DailyBalance.objects.create(user=first, date=date(2023, 6, 1), cumulative_income=5, cumulative_expenses=0)
+
+    recompute_shard(first.pk, second.pk + 1)
+
+    assert set(MonthlyCategoryTotal.objects.values_list('pk', flat=True)) == rollup_ids
+    assert set(DailyBalance.objects.values_list('pk', flat=True)) == balance_ids
+    assert DailyBalance.as_of(first.pk, date(2024, 1, 2)) == (100, 0)
+
+
+@pytest.mark.django_db
+def test_recompute_totals_resumes_from_checkpoint(tmp_path):
+    """
+    Test that shards recorded in the checkpoint are skipped when the command runs again.
+    This test also checks that a checkpoint of other options is refused.
+    """
+    first, second = drifted_users()
+    checkpoint = tmp_path / 'checkpoint.json'
+    checkpoint.write_text(json.dumps({
+        'tasks': ['goal_totals'], 'shard_size': 1, 'done': [[first.pk, first.pk + 1]], 'rows': 1,
+    }))
+
+    with pytest.raises(CommandError):
+        call_command('recompute_totals', '--workers', '0', '--shard-size', '1', '--checkpoint', str(checkpoint), stdout=StringIO())
+
+    out = StringIO()
+    call_command(
+        'recompute_totals', '--workers', '0', '--shard-size', '1', '--task', 'goal_totals',
+        '--checkpoint', str(checkpoint), stdout=out,
+    )
+    assert 'Resuming: 1 shard(s) done' in out.getvalue()
+    assert Goal.objects.get(owner=first).current_amount == 0
+    assert Goal.objects.get(owner=second).current_amount == 25
+
+
+# tests - checks.check_shared_cache
+def test_shared_cache_check_warns_about_process_local_caches(settings):
+    """
+    Test that a local-memory cache, which workers cannot share, is reported by the system checks.
+    This test checks that the shared database cache of the settings passes.
+    """
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'budget_cache'}}
+    assert check_shared_cache(None) == []
+
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert [warning.id for warning in check_shared_cache(None)] == ['budget.W001']
@@ -0,0 +1,67 @@
+import pytest
+import re
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from budget.instrumentation import QueryRecorder
+from budget.models import Goal, Contribution, Category, Income, Expense
+from budget.query_plans import check_view_plans, deep_transaction_pages, plan_lines
+from budget.views import transactions
+
+
+# tests - query plans of the read views
+@pytest.mark.django_db
+def test_read_views_do_not_scan_transaction_tables():
+    """
+    Test that every query of the read views is served by an index on a seeded dataset.
+    This test fails when a view starts filtering on columns that no index covers.
+    """
+    users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(3)]
+    categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(5)])
+    goals = [Goal.objects.create(owner=user, name='Goal', target_amount=1000) for user in users]
+    for goal in goals:
+        for user in users:
+            Contribution.objects.create(goal=goal, contributor=user, amount=10)
+
+    start = date.today() - timedelta(days=500)
+    for model in (Expense, Income):
+        model.objects.bulk_create([
+            model(user=users[i % 3], name='Row', amount=i, category=categories[i % 5], date=start + timedelta(days=i % 500))
+            for i in range(1500)
+        ])
+
+    assert check_view_plans(users[0]) == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('combined', [False, True])
+def test_deep_transaction_pages_seek_to_their_cursor(combined):
+    """
+    Test that a transactions page deep in the history reads the index from its cursor on, instead of filtering
+    every newer row, and needs no sort.
+    """
+    user = User.objects.create_user(username='testuser', password='password')
+    category = Category.objects.create(name='Food')
+    start = date.today() - timedelta(days=500)
+    for model in (Expense, Income):
+        model.objects.bulk_create([
+            model(user=user, name='Row', amount=1, category=category, date=start + timedelta(days=i % 500))
+            for i in range(1000)
+        ])
+    request = RequestFactory().get('/transactions' + deep_transaction_pages(date.today(), combined))
+    request.user = user
+
+    recorder = QueryRecorder()
+    with recorder.record():
+        transactions(request)
+
+    pages = [query for query in recorder.queries if re.search(r'FROM "budget_(expense|income)".*LIMIT', query['sql'])]
+    assert len(pages) == 2
+    for query in pages:
+        plan = '\n'.join(plan_lines(query['sql'], query['params']))
+        if connection.vendor == 'postgresql':
+            assert re.search(r'Index Cond: .*date', plan) and 'Sort' not in plan, plan
+        else:
+            assert re.search(r'SEARCH budget_\w+ USING (COVERING )?INDEX \w+ \(user_id=\? AND date[<>]', plan), plan
+            assert 'TEMP B-TREE' not in plan, plan
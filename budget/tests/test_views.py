@@ -2,9 +2,23 @@ import pytest
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
-from django.test import Client
-from budget.models import Goal, Contribution, Category, Income, Expense
-from datetime import datetime
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from asgiref.sync import async_to_sync, sync_to_async
+from budget import jobs
+from budget.models import Goal, Contribution, Category, Income, Expense, MonthlyCategoryTotal, DailyBalance, Job
+from budget.summaries import previous_month_range
+from budget.cache import cache_stats
+from budget.categories import category_version
+from budget.etags import conditional_view
+from budget.views import AsyncDashboardView
+from datetime import date, datetime, timedelta
+import json
+import time
 
 # tests - views.base
 @pytest.mark.django_db
@@ -178,6 +192,203 @@ def test_dashboard_view_context_data(client):
     assert response.context['total_balance'] == 100
 
 
+@pytest.mark.django_db
+def test_dashboard_view_ignores_previous_month_of_other_years(client):
+    """
+    Test that the category summary only covers the previous calendar month.
+    This test checks that transactions from the same month of an earlier year are not counted.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+
+    start, end = previous_month_range()
+    Expense.objects.create(user=user, name='Lunch', category=category, amount=40, date=start)
+    Expense.objects.create(user=user, name='Old lunch', category=category, amount=15, date=start.replace(year=start.year - 1))
+    Expense.objects.create(user=user, name='Dinner', category=category, amount=25, date=end)
+
+    response = client.get(reverse('dashboard'))
+
+    assert response.context['category_summary'][0]['total_expenses_in_category'] == 40
+    assert response.context['total_expenses'] == 40
+
+@pytest.mark.django_db
+def test_dashboard_view_query_count_independent_of_categories(client, django_assert_max_num_queries):
+    """
+    Test that the category summary is computed without a query per category.
+    This test checks that adding categories does not increase the number of queries issued by the dashboard.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(20)])
+
+    with django_assert_max_num_queries(8):
+        response = client.get(reverse('dashboard'))
+
+    assert len(response.context['category_summary']) == 20
+
+
+@pytest.mark.django_db
+def test_dashboard_view_cached_until_data_changes(client, django_capture_on_commit_callbacks):
+    """
+    Test that the dashboard data is served from the cache until the user's data changes.
+    This test checks the hit and miss counters and that a new expense is visible right after it is committed.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+    start, end = previous_month_range()
+
+    client.get(reverse('dashboard'))
+    response = client.get(reverse('dashboard'))
+    assert response.context['total_expenses'] == 0
+    assert cache_stats()['dashboard'] == {'hits': 1, 'misses': 1}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Expense.objects.create(user=user, name='Lunch', category=category, amount=40, date=start)
+
+    response = client.get(reverse('dashboard'))
+    assert response.context['total_expenses'] == 40
+    assert cache_stats()['dashboard'] == {'hits': 1, 'misses': 2}
+
+
+
+# tests - views.AsyncDashboardView
+def render_async_dashboard(user):
+    request = RequestFactory().get(reverse('dashboard'))
+    request.user = user
+    request.auser = sync_to_async(lambda: user)
+    response = async_to_sync(AsyncDashboardView.as_view())(request)
+    response.render()
+    return response
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_dashboard_matches_sync_dashboard(client):
+    """
+    Test that the async dashboard computes the same data as the sync one.
+    This test runs against committed data, since the sections query from their own threads and connections.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    other = User.objects.create_user(username='other', password='Test123!')
+    category = Category.objects.create(name='Food')
+    goal = Goal.objects.create(owner=user, name='Car', target_amount=500)
+    Contribution.objects.create(goal=goal, contributor=other, amount=100)
+    start, end = previous_month_range()
+    Expense.objects.create(user=user, name='Lunch', category=category, amount=40, date=start)
+    Income.objects.create(user=user, name='Salary', category=category, amount=100, date=start)
+
+    client.login(username='testuser', password='Test123!')
+    expected = client.get(reverse('dashboard')).context
+    cache.clear()
+    context = render_async_dashboard(user).context_data
+
+    assert context['unavailable_sections'] == []
+    assert context['user_goals'][0]['progress'] == expected['user_goals'][0]['progress'] == 20.0
+    assert context['other_contribution'] == expected['other_contribution']
+    assert context['user_contribution'] == []
+    assert context['total_balance'] == expected['total_balance'] == 60
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_dashboard_section_timeout(settings, monkeypatch):
+    """
+    Test that a section that exceeds its timeout is shown as unavailable while the others render.
+    This test checks that the incomplete result is not cached.
+    """
+    settings.DASHBOARD_SECTION_TIMEOUT = 0.05
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    Goal.objects.create(owner=user, name='Car', target_amount=500)
+    get_goals = AsyncDashboardView.get_goals
+
+    def slow_goals(self, user):
+        time.sleep(0.2)
+        return get_goals(self, user)
+    monkeypatch.setattr(AsyncDashboardView, 'get_goals', slow_goals)
+
+    response = render_async_dashboard(user)
+    assert response.context_data['unavailable_sections'] == ['user_goals']
+    assert response.context_data['user_goals'] == []
+    assert 'This section is temporarily unavailable.' in response.content.decode()
+    assert 'total_balance' in response.context_data
+
+    monkeypatch.setattr(AsyncDashboardView, 'get_goals', get_goals)
+    response = render_async_dashboard(user)
+    assert response.context_data['unavailable_sections'] == []
+    assert response.context_data['user_goals'][0]['goal'].name == 'Car'
+
+
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_dashboard_conditional_get():
+    """
+    Test that `conditional_view` also answers the async dashboard with 304 when the ETag matches.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    view = async_to_sync(conditional_view(category_version)(AsyncDashboardView.as_view()))
+    factory = RequestFactory()
+
+    request = factory.get(reverse('dashboard'))
+    request.user = user
+    request.auser = sync_to_async(lambda: user)
+    etag = view(request)['ETag']
+
+    request = factory.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=etag)
+    request.user = user
+    assert view(request).status_code == 304
+
+
+# tests - etags.conditional_view
+@pytest.mark.django_db
+def test_read_views_answer_unchanged_reloads_with_304(client, django_capture_on_commit_callbacks):
+    """
+    Test that the read views return a strong ETag and answer a matching If-None-Match with 304.
+    This test checks that the 304 runs none of the view's queries and that a new expense changes the ETag.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+
+    for name in ('dashboard', 'transactions', 'budgets', 'goals'):
+        # The first render of a page with a form sets the CSRF cookie, which is part of the ETag.
+        client.get(reverse(name))
+        response = client.get(reverse(name))
+        etag = response['ETag']
+        assert response.status_code == 200
+        assert etag.startswith('"')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert not any('budget_' in query['sql'] for query in queries.captured_queries)
+
+    etag = client.get(reverse('transactions'))['ETag']
+    assert client.get(reverse('transactions') + '?page_size=5', HTTP_IF_NONE_MATCH=etag).status_code == 200
+    with django_capture_on_commit_callbacks(execute=True):
+        Expense.objects.create(user=user, name='Lunch', category=category, amount=40, date='2024-11-19')
+    assert client.get(reverse('transactions'), HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_goals_etag_changes_with_other_users_goals(client, django_capture_on_commit_callbacks):
+    """
+    Test that the goals page is revalidated when another user's goal changes.
+    This test checks that the goals ETag covers the other users' goals listed on the page.
+    """
+    User.objects.create_user(username='testuser', password='Test123!')
+    other = User.objects.create_user(username='other', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    etag = client.get(reverse('goals'))['ETag']
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Goal.objects.create(owner=other, name='Bike', target_amount=300)
+
+    response = client.get(reverse('goals'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert 'Bike' in response.content.decode()
+
+
 # tests - views.goals
 @pytest.mark.django_db
 def test_goals_view(client):
@@ -219,6 +430,47 @@ def test_goals_view_no_goals(client):
     assert 'No record yet.' in response.content.decode()
 
 
+@pytest.mark.django_db
+def test_goals_view_others_paginated_and_searchable(client, settings, django_assert_max_num_queries):
+    """
+    Test that other users' goals are paginated, searchable by name and listed with a constant number of queries.
+    This test checks the first and second page and a search that matches a single goal.
+    """
+    settings.GOALS_PAGE_SIZE = 2
+    user = User.objects.create_user(username='testuser', password='password')
+    other = User.objects.create_user(username='other', password='password')
+    for name in ('Bike', 'Car', 'House', 'Boat'):
+        Goal.objects.create(owner=other, name=name, target_amount=1000)
+    client.login(username='testuser', password='password')
+
+    with django_assert_max_num_queries(6):
+        first = client.get(reverse('goals'))
+    second = client.get(reverse('goals') + first.context['others_goals'].next_url)
+    search = client.get(reverse('goals') + '?q=hou')
+
+    assert [goal.name for goal in first.context['others_goals']] == ['Boat', 'House']
+    assert [goal.name for goal in second.context['others_goals']] == ['Car', 'Bike']
+    assert not second.context['others_goals'].has_next
+    assert [goal.name for goal in search.context['others_goals']] == ['House']
+    assert '(other)' in first.content.decode()
+
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='Trigram indexes need PostgreSQL.')
+def test_goals_search_uses_the_trigram_index():
+    """
+    Test that the goal search by name can use the trigram index instead of scanning every goal.
+    """
+    owner = User.objects.create_user(username='other', password='password')
+    Goal.objects.create(owner=owner, name='House', target_amount=1000)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+    plan = Goal.objects.filter(name__icontains='hou').explain()
+
+    assert 'goal_name_trgm_idx' in plan
+
 # tests - views.add_goal
 @pytest.mark.django_db
 def test_add_goal_form_render():
@@ -353,6 +605,85 @@ def test_transactions_no_records():
     assert "No record yet." in response.content.decode()
 
 
+@pytest.mark.django_db
+def test_transactions_keyset_pagination(client):
+    """
+    Test that the transactions view pages through expenses with stable next and previous links.
+    This test checks that walking forward visits every expense exactly once, newest first, and that going back returns the same page.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name="Food")
+    for day in (1, 1, 2, 3, 3):
+        Expense.objects.create(user=user, name=f"Expense {day}", amount=10, date=f"2024-11-0{day}", category=category)
+    client.login(username='testuser', password='Testpassword1!')
+
+    first = client.get(reverse('transactions') + '?page_size=2')
+    second = client.get(reverse('transactions') + first.context['expenses'].next_url)
+    third = client.get(reverse('transactions') + second.context['expenses'].next_url)
+    back = client.get(reverse('transactions') + second.context['expenses'].previous_url)
+
+    pages = [first, second, third]
+    seen = [expense.id for response in pages for expense in response.context['expenses']]
+    assert seen == list(Expense.objects.order_by('-date', '-id').values_list('id', flat=True))
+    assert not first.context['expenses'].has_previous
+    assert not third.context['expenses'].has_next
+    assert [e.id for e in back.context['expenses']] == [e.id for e in first.context['expenses']]
+
+@pytest.mark.django_db
+def test_transactions_combined_stream(client):
+    """
+    Test that the combined mode interleaves incomes and expenses into a single stream ordered by date.
+    This test checks the order and kind of the items on the first page.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name="Housing")
+    Expense.objects.create(user=user, name="Rent", amount=800, date="2024-11-01", category=category)
+    Income.objects.create(user=user, name="Salary", amount=2000, date="2024-11-10", category=category)
+    Expense.objects.create(user=user, name="Repair", amount=50, date="2024-11-20", category=category)
+    client.login(username='testuser', password='Testpassword1!')
+
+    response = client.get(reverse('transactions') + '?combined=1')
+
+    assert response.status_code == 200
+    assert [(t.kind, t.name) for t in response.context['transactions']] == [
+        ('expense', 'Repair'), ('income', 'Salary'), ('expense', 'Rent'),
+    ]
+    assert not response.context['transactions'].has_next
+
+
+# tests - views.export_transactions
+@pytest.mark.django_db
+def test_export_transactions_streams_merged_ledger(client):
+    """
+    Test that the export streams the user's expenses and incomes as one CSV ledger ordered by date.
+    This test checks the header, the merged order, the category names and the date and category filters.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    other = User.objects.create_user(username='other', password='Testpassword1!')
+    housing = Category.objects.create(name="Housing")
+    salary = Category.objects.create(name="Salary")
+    Expense.objects.create(user=user, name="Rent", amount=800, date="2024-11-01", category=housing)
+    Income.objects.create(user=user, name="Pay", amount=2000, date="2024-10-28", category=salary)
+    Expense.objects.create(user=user, name="Repair", amount=50, date="2024-12-02", category=housing)
+    Expense.objects.create(user=other, name="Not mine", amount=1, date="2024-11-01", category=housing)
+    client.login(username='testuser', password='Testpassword1!')
+
+    response = client.get(reverse('export_transactions'))
+    lines = b''.join(response.streaming_content).decode().splitlines()
+
+    assert response['Content-Type'] == 'text/csv'
+    assert lines == [
+        'date,type,name,category,amount',
+        '2024-10-28,income,Pay,Salary,2000.00',
+        '2024-11-01,expense,Rent,Housing,800.00',
+        '2024-12-02,expense,Repair,Housing,50.00',
+    ]
+
+    response = client.get(reverse('export_transactions') + f'?start_date=2024-11-01&end_date=2024-11-30&category={housing.id}')
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[1:] == ['2024-11-01,expense,Rent,Housing,800.00']
+
+
 # tests - views.add_income
 @pytest.mark.django_db
 def test_add_income_form_render():
@@ -441,6 +772,172 @@ def test_add_expense_form_submission():
     assert Expense.objects.filter(name='Test Expense', amount=100).exists()
 
 
+@pytest.mark.django_db
+def test_expense_form_categories_come_from_registry(client):
+    """
+    Test that rendering the expense form does not query the categories once the registry is loaded.
+    This test checks that the options are listed and that an unknown category id is rejected.
+    """
+    User.objects.create_user(username='testuser', password='Testpassword1!')
+    client.login(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name='Housing')
+    client.get(reverse('add_expense'))
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('add_expense'))
+    assert f'<option value="{category.id}">Housing</option>' in response.content.decode()
+    assert not any('budget_category' in query['sql'] for query in queries.captured_queries)
+
+    response = client.post(reverse('add_expense'), {'name': 'Rent', 'amount': 100, 'date': '2024-11-19', 'category': category.id + 1})
+    assert response.status_code == 200
+    assert 'category' in response.context['form'].errors
+
+
+@pytest.mark.django_db
+def test_expense_form_rejects_a_category_deleted_behind_the_registry(client):
+    """
+    Test that the HTML form re-renders with an error, instead of failing on insert, when the registry still lists
+    a category that another worker deleted.
+    """
+    User.objects.create_user(username='testuser', password='Testpassword1!')
+    client.login(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name='Housing')
+    client.get(reverse('add_expense'))
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM budget_category WHERE id = %s', [category.id])
+
+    response = client.post(reverse('add_expense'), {'name': 'Rent', 'amount': 100, 'date': '2024-11-19', 'category': category.id})
+
+    assert response.status_code == 200
+    assert 'category' in response.context['form'].errors
+    assert not Expense.objects.exists()
+    assert not Expense.objects.exists()
+
+
+
+# tests - views.bulk_transactions
+@pytest.mark.django_db
+def test_bulk_transactions_recategorize_and_delete(client):
+    """
+    Test that the bulk action recategorizes and deletes the selected transactions of the user.
+    This test checks that the delete runs a single DELETE per type and that the outcome is shown as a message.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    food = Category.objects.create(name='Food')
+    rent = Category.objects.create(name='Rent')
+    expenses = [Expense.objects.create(user=user, name=f'Expense {i}', amount=10, category=food, date='2024-11-19') for i in range(3)]
+    income = Income.objects.create(user=user, name='Salary', amount=100, category=food, date='2024-11-01')
+
+    response = client.post(reverse('bulk_transactions'), {
+        'action': 'recategorize', 'category': rent.id,
+        'expenses': [expenses[0].id, expenses[1].id], 'incomes': [income.id],
+    }, follow=True)
+    assert 'Updated 3 transaction(s).' in response.content.decode()
+    assert Expense.objects.filter(category=rent).count() == 2
+    assert Income.objects.get(pk=income.pk).category == rent
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(reverse('bulk_transactions'), {
+            'action': 'delete', 'expenses': [expense.id for expense in expenses], 'next': reverse('transactions') + '?combined=1',
+        })
+    assert response.url == reverse('transactions') + '?combined=1'
+    assert not Expense.objects.exists()
+    assert sum(query['sql'].startswith('DELETE FROM "budget_expense"') for query in queries.captured_queries) == 1
+
+
+@pytest.mark.django_db
+def test_bulk_transactions_rejects_incomplete_actions(client):
+    """
+    Test that a bulk action without a selection or without its value changes nothing and reports the error.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+    expense = Expense.objects.create(user=user, name='Lunch', amount=10, category=category, date='2024-11-19')
+
+    response = client.post(reverse('bulk_transactions'), {'action': 'delete'}, follow=True)
+    assert 'Select at least one transaction.' in response.content.decode()
+
+    response = client.post(reverse('bulk_transactions'), {'action': 'redate', 'expenses': [expense.id]}, follow=True)
+    assert 'Choose the new date.' in response.content.decode()
+    assert Expense.objects.get(pk=expense.pk).date == date(2024, 11, 19)
+
+
+# tests - views.export_transactions_job, views.job_status and views.job_download
+@pytest.mark.django_db
+def test_export_job_can_be_polled_and_downloaded(client, settings, tmp_path):
+    """
+    Test that a queued export reports its progress and serves the same CSV as the streamed export
+    once a worker ran it.
+    This test also checks that other users can neither poll nor download the job.
+    """
+    settings.MEDIA_ROOT = str(tmp_path)
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+    Expense.objects.create(user=user, name='Lunch', amount=12, category=category, date=date(2024, 1, 5))
+    Income.objects.create(user=user, name='Salary', amount=100, category=category, date=date(2024, 1, 1))
+    client.login(username='testuser', password='Test123!')
+
+    response = client.post(reverse('export_transactions_job'), {'start_date': '2024-01-01'})
+    assert response.status_code == 202
+    status_url = response.json()['status_url']
+    assert client.get(status_url).json()['status'] == 'queued'
+
+    assert jobs.run(jobs.claim('worker')[0]) == Job.SUCCEEDED
+    data = client.get(status_url).json()
+    assert data['status'] == 'succeeded'
+    assert data['progress'] == {'done': 2, 'total': 2, 'percent': 100}
+
+    download = client.get(data['download_url'])
+    streamed = client.get(reverse('export_transactions'), {'start_date': '2024-01-01'})
+    assert b''.join(download.streaming_content) == b''.join(streamed.streaming_content)
+
+    User.objects.create_user(username='other', password='Test123!')
+    client.login(username='other', password='Test123!')
+    assert client.get(status_url).status_code == 404
+    assert client.get(data['download_url']).status_code == 404
+
+
+@pytest.mark.django_db
+def test_expired_export_files_are_deleted(client, settings, tmp_path):
+    """
+    Test that the files of exports older than EXPORT_RETENTION_HOURS are deleted and their download
+    answers 404, while recent exports keep their files.
+    """
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.EXPORT_RETENTION_HOURS = 24
+    User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    for _ in range(2):
+        client.post(reverse('export_transactions_job'))
+        assert jobs.run(jobs.claim('worker')[0]) == Job.SUCCEEDED
+    old, recent = Job.objects.order_by('pk')
+    Job.objects.filter(pk=old.pk).update(finished_at=timezone.now() - timedelta(hours=25))
+    old_file, recent_file = old.result['file'], recent.result['file']
+
+    assert jobs.expire_exports() == 1
+
+    assert not default_storage.exists(old_file) and default_storage.exists(recent_file)
+    data = client.get(reverse('job_status', args=[old.pk])).json()
+    assert 'download_url' not in data
+    assert client.get(reverse('job_download', args=[old.pk])).status_code == 404
+    assert client.get(reverse('job_download', args=[recent.pk])).status_code == 200
+    assert jobs.expire_exports() == 0
+
+@pytest.mark.django_db
+def test_export_job_rejects_invalid_parameters(client):
+    """
+    Test that an export job with an invalid date is rejected with 400 and nothing is queued.
+    """
+    User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+
+    response = client.post(reverse('export_transactions_job'), {'start_date': 'yesterday'})
+
+    assert response.status_code == 400
+    assert not Job.objects.exists()
+
 # tests - views.edit_income
 @pytest.mark.django_db
 def test_edit_income_form_submission(client):
@@ -593,6 +1090,24 @@ def test_budgets_view(client):
     assert response.context['total_expenses'] == 800
     assert response.context['net_budget'] == 1200
 
+@pytest.mark.django_db
+def test_budgets_view_accepts_the_last_date(client):
+    """
+    Test that an end date whose following day cannot be represented includes the transactions up to and on that date.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name='Food')
+    Expense.objects.create(user=user, name='Lunch', amount=10, category=category, date=date(2024, 6, 1))
+    Expense.objects.create(user=user, name='Someday', amount=5, category=category, date=date.max)
+    client.login(username='testuser', password='Testpassword1!')
+
+    last = client.get(reverse('budgets') + '?start_date=2024-01-01&end_date=9999-12-31')
+    before = client.get(reverse('budgets') + '?start_date=2024-01-01&end_date=9999-12-30')
+
+    assert last.status_code == 200 and last.context['total_expenses'] == 15
+    assert before.status_code == 200 and before.context['total_expenses'] == 10
+
+
 @pytest.mark.django_db
 def test_budgets_view_default_dates(client):
     """
@@ -620,3 +1135,227 @@ def test_budgets_view_default_dates(client):
     assert response.context['total_income'] == 2000
     assert response.context['total_expenses'] == 800
     assert response.context['net_budget'] == 1200
+
+
+# tests - views.budget_series
+@pytest.mark.django_db
+def test_budget_series_monthly(client):
+    """
+    Test that the 'budget_series' view returns zero-filled monthly income, expense and net series.
+    This test checks the buckets and the values of a range with an empty month in the middle.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name='Salary')
+    Income.objects.create(user=user, name='Salary', amount=2000, category=category, date='2024-01-10')
+    Expense.objects.create(user=user, name='Rent', amount=800, category=category, date='2024-01-02')
+    Expense.objects.create(user=user, name='Rent', amount=800, category=category, date='2024-03-31')
+    Expense.objects.create(user=user, name='Outside', amount=5, category=category, date='2024-04-01')
+    client.login(username='testuser', password='Testpassword1!')
+
+    response = client.get(reverse('budget_series') + '?start_date=2024-01-01&end_date=2024-03-31&interval=month')
+
+    data = response.json()
+    assert data['buckets'] == ['2024-01-01', '2024-02-01', '2024-03-01']
+    assert data['series'] == {
+        'income': [2000.0, 0.0, 0.0],
+        'expense': [800.0, 0.0, 800.0],
+        'net': [1200.0, 0.0, -800.0],
+    }
+
+@pytest.mark.django_db
+def test_budget_series_weekly_by_category(client):
+    """
+    Test that the 'budget_series' view splits weekly series by category and rejects unknown intervals.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    food = Category.objects.create(name='Food')
+    rent = Category.objects.create(name='Rent')
+    Expense.objects.create(user=user, name='Lunch', amount=10, category=food, date='2024-11-05')
+    Expense.objects.create(user=user, name='Rent', amount=800, category=rent, date='2024-11-12')
+    client.login(username='testuser', password='Testpassword1!')
+
+    response = client.get(reverse('budget_series') + '?start_date=2024-11-04&end_date=2024-11-17&interval=week&by_category=1')
+
+    data = response.json()
+    assert data['buckets'] == ['2024-11-04', '2024-11-11']
+    assert [(c['name'], c['expense']) for c in data['categories']] == [('Food', [10.0, 0.0]), ('Rent', [0.0, 800.0])]
+    assert client.get(reverse('budget_series') + '?interval=hour').status_code == 400
+
+
+@pytest.mark.django_db
+def test_budget_series_refuses_oversized_ranges(client):
+    """
+    Test that the 'budget_series' view answers ranges that are too long for their interval with 400, and serves a
+    long range with a coarser interval, up to and including the last representable date.
+    """
+    user = User.objects.create_user(username='testuser', password='Testpassword1!')
+    category = Category.objects.create(name='Food')
+    Expense.objects.create(user=user, name='Someday', amount=5, category=category, date=date.max)
+    client.login(username='testuser', password='Testpassword1!')
+    url = reverse('budget_series')
+
+    assert client.get(url + '?start_date=0001-01-01&end_date=9999-12-30&interval=day').status_code == 400
+    assert client.get(url + '?start_date=2024-01-01&end_date=9999-12-31').status_code == 400
+    response = client.get(url + '?start_date=9000-01-01&end_date=9999-12-31&interval=year')
+    assert response.status_code == 200
+    assert response.json()['end_date'] == '9999-12-31'
+    assert response.json()['buckets'][-1] == '9999-01-01'
+    assert response.json()['series']['expense'][-1] == 5.0
+    days = client.get(url + '?start_date=9999-12-30&end_date=9999-12-31&interval=day').json()
+    assert days['buckets'] == ['9999-12-30', '9999-12-31'] and days['series']['expense'] == [0.0, 5.0]
+
+
+
+# tests - views.api_create_transactions
+def post_batch(client, items):
+    return client.post(reverse('api_create_transactions'), json.dumps({'transactions': items}), content_type='application/json')
+
+
+@pytest.mark.django_db
+def test_api_create_transactions_inserts_batch(client, django_capture_on_commit_callbacks):
+    """
+    Test that a valid batch is inserted and the derived totals include it.
+    This test checks the returned ids, the monthly rollup and the daily running totals.
+    """
+    user = User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = post_batch(client, [
+            {'type': 'expense', 'name': 'Lunch', 'category': category.id, 'amount': '12.50', 'date': '2024-11-19'},
+            {'type': 'income', 'name': 'Salary', 'category': category.id, 'amount': 100, 'date': '2024-11-01'},
+            {'type': 'expense', 'name': 'Dinner', 'category': category.id, 'amount': '7.50', 'date': '2024-11-20'},
+        ])
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data['created'] == 3
+    assert [item['type'] for item in data['ids']] == ['expense', 'income', 'expense']
+    assert Expense.objects.get(pk=data['ids'][0]['id']).name == 'Lunch'
+    assert MonthlyCategoryTotal.objects.get(user=user, kind='expense').amount == 20
+    assert DailyBalance.as_of(user.pk, date(2024, 11, 21)) == (100, 20)
+
+
+@pytest.mark.django_db
+def test_api_create_transactions_reports_item_errors(client):
+    """
+    Test that invalid items are reported by index with the form errors and nothing is inserted.
+    This test checks an unknown type, a negative amount and an unknown category.
+    """
+    User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    category = Category.objects.create(name='Food')
+
+    response = post_batch(client, [
+        {'type': 'expense', 'name': 'Lunch', 'category': category.id, 'amount': 10, 'date': '2024-11-19'},
+        {'type': 'gift', 'name': 'Flowers', 'category': category.id, 'amount': 10, 'date': '2024-11-19'},
+        {'type': 'income', 'name': 'Refund', 'category': category.id, 'amount': -5, 'date': '2024-11-19'},
+        {'type': 'expense', 'name': 'Taxi', 'category': category.id + 1, 'amount': 10, 'date': '2024-11-19'},
+    ])
+
+    assert response.status_code == 400
+    errors = response.json()['errors']
+    assert [error['index'] for error in errors] == [1, 2, 3]
+    assert 'type' in errors[0]['errors']
+    assert errors[1]['errors']['amount'][0]['message'] == 'Amount must be a positive number.'
+    assert 'category' in errors[2]['errors']
+    assert not Expense.objects.exists() and not Income.objects.exists()
+
+
+@pytest.mark.django_db
+def test_api_create_transactions_limits(client, settings):
+    """
+    Test the authentication, body and batch size checks of the batch API.
+    This test also checks that validating and inserting a batch does not issue queries per item.
+    """
+    settings.API_MAX_BATCH_SIZE = 50
+    category = Category.objects.create(name='Food')
+    item = {'type': 'expense', 'name': 'Lunch', 'category': category.id, 'amount': 10, 'date': '2024-11-19'}
+
+    assert post_batch(client, [item]).status_code == 401
+    User.objects.create_user(username='testuser', password='Test123!')
+    client.login(username='testuser', password='Test123!')
+    assert post_batch(client, [item] * 51).status_code == 400
+    assert post_batch(client, []).status_code == 400
+    assert client.post(reverse('api_create_transactions'), 'not json', content_type='application/json').status_code == 400
+    assert client.get(reverse('api_create_transactions')).status_code == 405
+
+    # The first batch also loads the category registry and creates the rollup rows.
+    assert post_batch(client, [item]).status_code == 201
+    with CaptureQueriesContext(connection) as small:
+        assert post_batch(client, [item] * 2).status_code == 201
+    with CaptureQueriesContext(connection) as large:
+        assert post_batch(client, [item] * 50).status_code == 201
+    assert len(large) == len(small)
+    assert Expense.objects.count() == 53
+
+# tests - admin
+@pytest.mark.django_db
+def test_admin_expense_changelist_queries_do_not_grow_with_rows(client):
+    """
+    Test that the expense changelist joins the user and category of the listed rows.
+    This test checks that listing many rows of many users takes as many queries as listing one.
+    """
+    admin_user = User.objects.create_superuser(username='admin', password='Test123!')
+    client.login(username='admin', password='Test123!')
+    categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(3)])
+    users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(10)]
+    Expense.objects.create(user=admin_user, name='First', amount=1, category=categories[0], date=date(2024, 1, 1))
+    url = reverse('admin:budget_expense_changelist')
+
+    with CaptureQueriesContext(connection) as one:
+        assert client.get(url).status_code == 200
+    Expense.objects.bulk_create([
+        Expense(user=users[i % 10], name='Row', amount=i, category=categories[i % 3], date=date(2024, 1 + i % 12, 1))
+        for i in range(40)
+    ])
+    with CaptureQueriesContext(connection) as many:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(many) == len(one)
+
+
+@pytest.mark.django_db
+def test_admin_expense_changelist_filters_by_year_without_listing_distinct_dates(client):
+    """
+    Test that the expense changelist offers the years between the first and the last expense and filters by year.
+    This test checks that no query lists the distinct dates of the table.
+    """
+    admin_user = User.objects.create_superuser(username='admin', password='Test123!')
+    client.login(username='admin', password='Test123!')
+    category = Category.objects.create(name='Food')
+    for day in (date(2022, 5, 1), date(2024, 1, 1), date(2024, 12, 31)):
+        Expense.objects.create(user=admin_user, name=f'Expense {day.year}', amount=1, category=category, date=day)
+    url = reverse('admin:budget_expense_changelist')
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    filtered = client.get(url + '?year=2024')
+
+    assert [choice['display'] for choice in response.context['cl'].filter_specs[0].choices(response.context['cl'])] == [
+        'All', '2024', '2023', '2022',
+    ]
+    assert not any('DISTINCT' in query['sql'] for query in queries.captured_queries)
+    assert sorted(expense.date for expense in filtered.context['cl'].result_list) == [date(2024, 1, 1), date(2024, 12, 31)]
+
+@pytest.mark.django_db
+def test_admin_expense_change_form_does_not_list_users(client):
+    """
+    Test that the expense change form picks the user by autocompletion.
+    This test checks that usernames are not rendered as options of a select.
+    """
+    User.objects.create_superuser(username='admin', password='Test123!')
+    client.login(username='admin', password='Test123!')
+    User.objects.create_user(username='someoneelse', password='password')
+    category = Category.objects.create(name='Food')
+    user = User.objects.create_user(username='owner', password='password')
+    expense = Expense.objects.create(user=user, name='Lunch', amount=10, category=category, date=date(2024, 1, 1))
+
+    response = client.get(reverse('admin:budget_expense_change', args=[expense.pk]))
+
+    content = response.content.decode()
+    assert response.status_code == 200
+    assert 'admin-autocomplete' in content
+    assert 'someoneelse' not in content
@@ -1,20 +1,38 @@
+from datetime import date
+from django.conf import settings
 from django.urls import path
 from . import views
-from .views import DashboardView
+from .categories import category_version
+from .etags import conditional_view
+from .views import AsyncDashboardView, DashboardView
 
 urlpatterns = [
     path('', views.base, name='base'),
     path('login/', views.user_login, name='login'),
     path('register/', views.user_register, name='register'),
     path('logout/', views.user_logout, name='logout'),
-    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path(
+        'dashboard/',
+        conditional_view(category_version, date.today)(
+            (AsyncDashboardView if settings.ASYNC_DASHBOARD else DashboardView).as_view()
+        ),
+        name='dashboard',
+    ),
     path('budgets/', views.budgets ,name='budgets'),
+    path('budgets/series', views.budget_series, name='budget_series'),
     path('goals/', views.goals, name='goals'),
     path('goals/add-goal', views.add_goal ,name='add_goal'),
     path('goals/donate/<int:goal_id>', views.donation, name='donation'),
     path('transactions/', views.transactions ,name='transactions'),
+    path('transactions/export', views.export_transactions, name='export_transactions'),
+    path('transactions/export/jobs', views.export_transactions_job, name='export_transactions_job'),
+    path('transactions/bulk', views.bulk_transactions, name='bulk_transactions'),
     path('transactions/add-income', views.add_income, name='add_income'),
     path('transactions/add-expense', views.add_expense, name='add_expense'),
     path('transactions/edit-income/<int:transaction_id>', views.edit_income, name='edit_income'),
     path('transactions/edit-expense/<int:transaction_id>', views.edit_expense, name='edit_expense'),
+    path('api/transactions', views.api_create_transactions, name='api_create_transactions'),
+    path('jobs/<int:job_id>', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download', views.job_download, name='job_download'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,13 +1,42 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import StreamingHttpResponse, HttpResponse, HttpResponseBadRequest, JsonResponse, FileResponse, Http404
 from django.contrib import messages
-from .forms import UserRegisterForm, UserLoginForm, IncomeForm, ExpenseForm, GoalForm, ContributionForm
+from .forms import (
+    UserRegisterForm, UserLoginForm, IncomeForm, ExpenseForm, BatchIncomeForm, BatchExpenseForm, GoalForm,
+    ContributionForm, TransactionBulkForm,
+)
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from .models import Income, Expense, Goal, Contribution, Category
-from django.db.models import Sum
-from datetime import datetime
+from .models import Income, Expense, Goal, Contribution, Job
+from .summaries import (
+    previous_month_range, category_totals, balance_totals, time_series, series_bucket_count,
+    SERIES_INTERVALS, MAX_SERIES_BUCKETS,
+)
+from .cache import get_or_compute, aget_or_compute, goals_version
+from .categories import categories, category_version
+from .etags import conditional_view
+from .bulk import create_transactions, update_transactions, delete_transactions
+from .exports import ledger_rows
+from .metrics import render as render_metrics
+from . import jobs
+from .pagination import keyset_page, id_keyset_page
+from datetime import datetime, date, timedelta
+import asyncio
+import csv
+import itertools
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, close_old_connections
+from django.views.decorators.http import require_POST
+from django.utils.crypto import constant_time_compare
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.generic import TemplateView
-from django.db import models
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 def base(request):
@@ -76,11 +105,16 @@ class DashboardView(TemplateView):
     and financial summaries by category for the previous month.
 
     GET - Retrieves the user's dashboard with details including:
-        - User's goals with progress (total contributions vs target amount)
+        - User's goals with progress (stored contribution total vs target amount)
         - User's contributions to goals and contributions from others
-        - Monthly expenses and incomes for each category
+        - Monthly expenses and incomes for each category, read from the `MonthlyCategoryTotal` rollup
         - Total expenses, incomes, and balance for the previous month
 
+    The computed data is cached under the user's data version, which is bumped whenever one of
+    their expenses, incomes, goals or contributions changes.
+    In `urls.py` the view is wrapped with `conditional_view`, so a reload is answered with
+    304 Not Modified until that version, the categories or the date change.
+
     Context data:
         - 'user_goals': List of goals with progress details
         - 'user_contribution': Contributions made by the logged-in user
@@ -94,57 +128,154 @@ class DashboardView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        user_goals = Goal.objects.filter(owner=self.request.user)
+        start, end = previous_month_range()
+        context.update(get_or_compute(
+            self.request.user.pk, 'dashboard', lambda: self.get_summary(start, end), start.isoformat(), category_version()
+        ))
+        return context
+
+    def get_summary(self, start, end):
+        """
+        Computes the dashboard data for the half-open date range ``[start, end)``. The result is
+        cached per user and data version, so it only runs after the user's data has changed.
+        """
+        user = self.request.user
+        return {
+            'user_goals': self.get_goals(user),
+            'user_contribution': self.get_user_contribution(user),
+            'other_contribution': self.get_other_contribution(user),
+            **self.get_category_summary(user, start, end),
+        }
+
+    def get_goals(self, user):
+        """
+        Returns the user's goals with their stored contribution totals and progress.
+        """
         goals_with_progress = []
-        for goal in user_goals:
-            total_contributions = Contribution.objects.filter(goal=goal).aggregate(total=Sum('amount'))['total'] or 0
-            progress = (total_contributions / goal.target_amount) * 100 if goal.target_amount > 0 else 0
+        for goal in Goal.objects.filter(owner=user):
             goals_with_progress.append({
                 'goal': goal,
-                'total_contributions': total_contributions,
-                'progress': progress,
+                'total_contributions': goal.current_amount,
+                'progress': goal.current_percentage,
             })
-        
-        user_contribution = Contribution.objects.filter(contributor=self.request.user)
-        other_contribution = Contribution.objects.exclude(contributor=self.request.user).filter(goal__in=user_goals)
-        
-        last_month = datetime.now().month - 1 if datetime.now().month > 1 else 12
+        return goals_with_progress
+
+    def get_user_contribution(self, user):
+        return list(Contribution.objects.filter(contributor=user).select_related('goal'))
+
+    def get_other_contribution(self, user):
+        return list(
+            Contribution.objects.exclude(contributor=user)
+            .filter(goal__owner=user)
+            .select_related('goal', 'contributor')
+        )
+
+    def get_category_summary(self, user, start, end):
+        """
+        Returns the per-category expenses and incomes of the user in ``[start, end)`` together
+        with the totals and the balance.
+        """
         category_summary = []
-        
+
         total_expenses = 0
         total_incomes = 0
-        
-        for category in Category.objects.all():
-            category_expenses = Expense.objects.filter(category=category, user=self.request.user, date__month=last_month)
-            category_incomes = Income.objects.filter(category=category, user=self.request.user, date__month=last_month)
-
-            total_expenses_in_category = category_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-            total_incomes_in_category = category_incomes.aggregate(Sum('amount'))['amount__sum'] or 0
 
+        for category in category_totals(user, start, end):
             category_summary.append({
                 'category': category,
-                'total_expenses_in_category': total_expenses_in_category,
-                'total_incomes_in_category': total_incomes_in_category,
+                'total_expenses_in_category': category.total_expenses,
+                'total_incomes_in_category': category.total_incomes,
             })
-            
-            total_expenses += total_expenses_in_category
-            total_incomes += total_incomes_in_category
-        
-        total_balance = total_incomes - total_expenses
-        
-        context.update({
-            'user_goals': goals_with_progress,
-            'user_contribution': user_contribution,
-            'other_contribution': other_contribution,
+
+            total_expenses += category.total_expenses
+            total_incomes += category.total_incomes
+
+        return {
             'category_summary': category_summary,
             'total_expenses': total_expenses,
             'total_incomes': total_incomes,
-            'total_balance': total_balance,
-        })
-        return context
-    
+            'total_balance': total_incomes - total_expenses,
+        }
+
+
+class AsyncDashboardView(DashboardView):
+    """
+    Async version of `DashboardView`, used for the dashboard when the project is served through
+    `cl_budget_app/asgi.py` (see `ASYNC_DASHBOARD`).
+
+    The goals, both contribution lists and the category summary do not depend on each other, so
+    on a cache miss they are computed concurrently and the latency is that of the slowest one
+    rather than their sum. Each section gets `DASHBOARD_SECTION_TIMEOUT` seconds; a section that
+    takes longer is rendered as unavailable and the incomplete result is not cached.
+
+    Sections run in worker threads with their own database connections. Django's async ORM
+    would not help here: it runs every query on the one thread shared by all sync code, so the
+    queries would still run one after another.
+
+    Context data:
+        - Everything `DashboardView` provides
+        - 'unavailable_sections': Names of the sections that timed out
+    """
+    SECTION_DEFAULTS = {
+        'user_goals': [],
+        'user_contribution': [],
+        'other_contribution': [],
+        'category_summary': {'category_summary': [], 'total_expenses': 0, 'total_incomes': 0, 'total_balance': 0},
+    }
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        start, end = previous_month_range()
+        context = super(DashboardView, self).get_context_data(**kwargs)
+        context['unavailable_sections'] = []
+        context.update(await aget_or_compute(
+            user.pk, 'dashboard', lambda: self.aget_summary(user, start, end), start.isoformat(),
+            await sync_to_async(category_version)(),
+            cacheable=lambda summary: not summary['unavailable_sections'],
+        ))
+        return self.render_to_response(context)
+
+    async def aget_summary(self, user, start, end):
+        """
+        Computes the same data as `DashboardView.get_summary`, running the sections concurrently.
+        """
+        names = list(self.SECTION_DEFAULTS)
+        results = await asyncio.gather(
+            self.run_section('user_goals', self.get_goals, user),
+            self.run_section('user_contribution', self.get_user_contribution, user),
+            self.run_section('other_contribution', self.get_other_contribution, user),
+            self.run_section('category_summary', self.get_category_summary, user, start, end),
+        )
+        summary = {'unavailable_sections': [name for name, result in zip(names, results) if result is None]}
+        for name, result in zip(names, results):
+            if result is None:
+                result = self.SECTION_DEFAULTS[name]
+            summary.update(result if name == 'category_summary' else {name: result})
+        return summary
+
+    async def run_section(self, name, compute, *args):
+        """
+        Runs `compute(*args)` in a worker thread and returns its result, or None if it did not
+        finish within `DASHBOARD_SECTION_TIMEOUT` seconds. A timed out query is not interrupted,
+        its result is only no longer waited for.
+        """
+        def run():
+            try:
+                return compute(*args)
+            finally:
+                close_old_connections()
+
+        try:
+            return await asyncio.wait_for(
+                sync_to_async(run, thread_sensitive=False)(),
+                timeout=getattr(settings, 'DASHBOARD_SECTION_TIMEOUT', 5),
+            )
+        except asyncio.TimeoutError:
+            logger.warning('Dashboard section %s timed out', name)
+            return None
+
 @login_required
+@conditional_view(goals_version)
 def goals(request):
     """
     View that displays goals assigned to the logged-in user and goals of other users.
@@ -153,29 +284,36 @@ def goals(request):
     Decorator:
     - @login_required: This decorator ensures that only authenticated users can access this view.
       If the user is not logged in, they will be redirected to the login page.
+    - @conditional_view(goals_version): Answers a reload with 304 Not Modified, without running the
+      queries, until the user's data or any goal or contribution changes.
 
     Logic:
     1. Retrieve goals assigned to the logged-in user and other users.
        - `my_goals`: Goals assigned to the logged-in user.
-       - `others_goals`: Goals assigned to other users.
-    2. Calculate the total contributions for each goal.
-    3. Calculate the progress percentage for each goal.
-    4. Render the `goals.html` template with the goals data.
+       - `others_goals`: One page of goals assigned to other users, newest first, with their
+         owners loaded in the same query. Pages use keyset cursors on the goal id, so their
+         cost does not grow with the number of goals on the platform.
+    2. Read the total contributions and the progress percentage of each goal from the
+       `current_amount` column maintained on `Goal`, without aggregating contributions.
+    3. Render the `goals.html` template with the goals data.
+
+    Parameters:
+    - `q` (optional): Only list other users' goals whose name contains this text. On PostgreSQL
+      the search uses the trigram index on the upper-cased goal names.
+    - `after`/`before` (optional): Cursors of the neighbouring pages of other users' goals.
     """
+    search = request.GET.get('q', '').strip()
     my_goals = Goal.objects.filter(owner=request.user)
-    others_goals = Goal.objects.exclude(owner=request.user)
-
-    for goal in my_goals:
-        total_contributions = Contribution.objects.filter(goal=goal).aggregate(total_amount=models.Sum('amount'))['total_amount'] or 0
-        goal.current_amount = total_contributions
-        goal.current_percentage = round((total_contributions / goal.target_amount) * 100, 2) if goal.target_amount > 0 else 0
+    others_goals = Goal.objects.exclude(owner=request.user).select_related('owner')
+    if search:
+        others_goals = others_goals.filter(name__icontains=search)
 
-    for goal in others_goals:
-        total_contributions = Contribution.objects.filter(goal=goal).aggregate(total_amount=models.Sum('amount'))['total_amount'] or 0
-        goal.current_amount = total_contributions
-        goal.current_percentage = round((total_contributions / goal.target_amount) * 100, 2) if goal.target_amount > 0 else 0
-
-    return render(request, 'goals.html', {'my_goals': my_goals, 'others_goals': others_goals})
+    page = id_keyset_page(
+        others_goals, request.GET.get('after'), request.GET.get('before'),
+        getattr(settings, 'GOALS_PAGE_SIZE', 20),
+    )
+    page.set_urls(request, 'after', 'before')
+    return render(request, 'goals.html', {'my_goals': my_goals, 'others_goals': page, 'search': search})
 
 @login_required
 def add_goal(request):
@@ -233,7 +371,20 @@ def donation(request, goal_id):
         form = ContributionForm
     return render(request, 'donate.html', {'form':form, 'goal':goal})
 
+def _page_size(request):
+    """
+    Returns the page size requested with `page_size`, falling back to `TRANSACTIONS_PAGE_SIZE`
+    and capped at `TRANSACTIONS_MAX_PAGE_SIZE`.
+    """
+    default = getattr(settings, 'TRANSACTIONS_PAGE_SIZE', 50)
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, getattr(settings, 'TRANSACTIONS_MAX_PAGE_SIZE', 200)))
+
 @login_required
+@conditional_view(category_version)
 def transactions(request):
     """
     This view is responsible for displaying the user's transactions, including both expenses and incomes.
@@ -241,14 +392,221 @@ def transactions(request):
     Decorator:
     - @login_required: This decorator ensures that only authenticated users can access this view.
       If the user is not logged in, they will be redirected to the login page.
+    - @conditional_view(category_version): Answers a reload with 304 Not Modified, without running
+      the queries, until the user's data or the categories change.
 
-    - Retrieves the expenses and incomes associated with the authenticated user from the database.
-    - Filters the `Expense` and `Income` models based on the currently logged-in user (`request.user`).
-    - Renders the `transactions.html` template, passing the filtered `expenses` and `incomes` as context to the template.
+    - Retrieves the expenses and incomes associated with the authenticated user from the database,
+      newest first, one page at a time.
+    - Pages are selected with keyset cursors on (date, id) rather than offsets, so deep pages cost
+      the same as the first one.
+    - Renders the `transactions.html` template with the `expenses` and `incomes` pages, each with
+      its own next and previous links.
+
+    Parameters:
+    - `page_size` (optional): Number of transactions per page. Defaults to `TRANSACTIONS_PAGE_SIZE`.
+    - `combined` (optional): If set, expenses and incomes are interleaved into a single ordered
+      stream, passed to the template as `transactions`.
+    - `after`/`before`, `expenses_after`/`expenses_before`, `incomes_after`/`incomes_before` (optional):
+      Cursors of the neighbouring pages, as produced by the page links.
     """
+    page_size = _page_size(request)
     expenses = Expense.objects.filter(user=request.user)
     incomes = Income.objects.filter(user=request.user)
-    return render(request, 'transactions.html', {'expenses':expenses, 'incomes':incomes})
+
+    if request.GET.get('combined'):
+        page = keyset_page(
+            [('expense', expenses), ('income', incomes)],
+            request.GET.get('after'), request.GET.get('before'), page_size,
+        )
+        page.set_urls(request, 'after', 'before')
+        categories.attach(page)
+        return render(request, 'transactions.html', {'combined': True, 'transactions': page, 'bulk_form': TransactionBulkForm()})
+
+    expense_page = keyset_page(
+        [('expense', expenses)], request.GET.get('expenses_after'), request.GET.get('expenses_before'), page_size
+    )
+    expense_page.set_urls(request, 'expenses_after', 'expenses_before')
+    income_page = keyset_page(
+        [('income', incomes)], request.GET.get('incomes_after'), request.GET.get('incomes_before'), page_size
+    )
+    income_page.set_urls(request, 'incomes_after', 'incomes_before')
+    categories.attach(itertools.chain(expense_page, income_page))
+    return render(request, 'transactions.html', {'expenses': expense_page, 'incomes': income_page, 'bulk_form': TransactionBulkForm()})
+
+@login_required
+@require_POST
+def bulk_transactions(request):
+    """
+    Applies one action to many of the user's expenses and incomes selected on the transactions page.
+
+    Decorator:
+    - @login_required: This decorator ensures that only authenticated users can access this view.
+      If the user is not logged in, they will be redirected to the login page.
+    - @require_POST: Only POST requests are accepted.
+
+    POST:
+        - `action`: 'recategorize' moves the selected rows to `category`, 'redate' moves them to
+          `date` and 'delete' deletes them.
+        - `expenses`, `incomes`: Ids of the selected rows; rows of other users are ignored.
+        - `next` (optional): Page of the transactions list to return to.
+
+    Each action is a single `update()` or DELETE per type through `update_transactions` and
+    `delete_transactions`, which keep the monthly rollup and the daily running totals correct.
+    The outcome is reported with a message on the transactions page.
+    """
+    form = TransactionBulkForm(request.POST)
+    if form.is_valid():
+        data = form.cleaned_data
+        changed = 0
+        for model, ids in ((Expense, data['expenses']), (Income, data['incomes'])):
+            if not ids:
+                continue
+            if data['action'] == 'delete':
+                changed += delete_transactions(request.user.pk, model, ids)
+            else:
+                category = data['category'] if data['action'] == 'recategorize' else None
+                day = data['date'] if data['action'] == 'redate' else None
+                changed += update_transactions(request.user.pk, model, ids, category_id=getattr(category, 'pk', None), day=day)
+        verb = 'Deleted' if data['action'] == 'delete' else 'Updated'
+        messages.success(request, f'{verb} {changed} transaction(s).')
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        return redirect(next_url)
+    return redirect('transactions')
+
+class Echo:
+    """
+    Pseudo-buffer whose `write` returns the value instead of storing it, so `csv.writer`
+    can produce rows one at a time for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _day_after(day):
+    # Exclusive end of a range ending on `day`; None leaves the range open after the last date.
+    return day + timedelta(days=1) if day < date.max else None
+
+@login_required
+def export_transactions(request):
+    """
+    Streams the user's full ledger of expenses and incomes as a CSV file, ordered by date.
+
+    Decorator:
+    - @login_required: This decorator ensures that only authenticated users can access this view.
+      If the user is not logged in, they will be redirected to the login page.
+
+    - The rows come from `exports.ledger_rows`, which reads expenses and incomes in chunks of
+      `EXPORT_CHUNK_SIZE` rows and merges them lazily into one stream.
+    - Rows are written to the response as they are produced, so memory stays flat however many
+      transactions the user has. `export_transactions_job` writes the same file in the background.
+
+    Parameters:
+    - `start_date`, `end_date` (optional): Only export transactions in this inclusive date range.
+    - `category` (optional): Only export transactions of the category with this id.
+    """
+    try:
+        start_date = _parse_date(request.GET.get('start_date'))
+        end_date = _parse_date(request.GET.get('end_date'))
+        category = int(request.GET['category']) if request.GET.get('category') else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid start_date, end_date or category.')
+
+    writer = csv.writer(Echo())
+    lines = (writer.writerow(row) for row in ledger_rows(request.user.pk, start_date, end_date, category))
+    response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
+    return response
+
+@login_required
+@require_POST
+def export_transactions_job(request):
+    """
+    Queues a CSV export of the user's ledger to be written in the background, for ledgers too
+    large to stream within a request.
+
+    Decorator:
+    - @login_required: This decorator ensures that only authenticated users can access this view.
+      If the user is not logged in, they will be redirected to the login page.
+    - @require_POST: Only POST requests are accepted.
+
+    POST:
+    - Takes the same optional `start_date`, `end_date` and `category` as `export_transactions`
+      and queues an `export_transactions` job.
+    - Responds with 202 and the job status as JSON; its `status_url` can be polled until a
+      `download_url` appears.
+    """
+    try:
+        start_date = _parse_date(request.POST.get('start_date'))
+        end_date = _parse_date(request.POST.get('end_date'))
+        category = int(request.POST['category']) if request.POST.get('category') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start_date, end_date or category.'}, status=400)
+
+    job = jobs.enqueue('export_transactions', user=request.user, payload={
+        'start_date': start_date and start_date.isoformat(),
+        'end_date': end_date and end_date.isoformat(),
+        'category': category,
+    })
+    return JsonResponse(_job_json(job), status=202)
+
+def _job_json(job):
+    data = {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'progress': {'done': job.progress_done, 'total': job.progress_total, 'percent': job.percent},
+        'message': job.message,
+        'status_url': reverse('job_status', args=[job.pk]),
+    }
+    if job.status == Job.SUCCEEDED and (job.result or {}).get('file'):
+        data['download_url'] = reverse('job_download', args=[job.pk])
+    if job.status == Job.FAILED:
+        data['error'] = job.error.strip().splitlines()[-1] if job.error.strip() else ''
+    return data
+
+@login_required
+def job_status(request, job_id):
+    """
+    Returns the status and progress of one of the user's background jobs as JSON, for pages
+    polling a job they queued.
+
+    Decorator:
+    - @login_required: This decorator ensures that only authenticated users can access this view.
+      If the user is not logged in, they will be redirected to the login page.
+
+    Parameters:
+    - `job_id`: The id of the job. Jobs of other users are answered with 404.
+    """
+    job = get_object_or_404(Job, pk=job_id, user=request.user)
+    return JsonResponse(_job_json(job))
+
+@login_required
+def job_download(request, job_id):
+    """
+    Serves the file written by one of the user's finished export jobs.
+
+    Decorator:
+    - @login_required: This decorator ensures that only authenticated users can access this view.
+      If the user is not logged in, they will be redirected to the login page.
+
+    Parameters:
+    - `job_id`: The id of the job. Jobs of other users, and jobs without a file yet, are answered with 404.
+    """
+    job = get_object_or_404(Job, pk=job_id, user=request.user, status=Job.SUCCEEDED)
+    name = (job.result or {}).get('file')
+    if not name or not default_storage.exists(name):
+        raise Http404('The file of this job is not available.')
+    return FileResponse(default_storage.open(name, 'rb'), as_attachment=True, filename='transactions.csv')
 
 @login_required
 def add_income(request):
@@ -368,6 +726,7 @@ def edit_expense(request, transaction_id):
     return render(request, 'edit_transaction.html', {'form': form, 'type': 'expense'})
 
 @login_required
+@conditional_view(date.today)
 def budgets(request):
     """
     The `budgets` view calculates and displays the total income and total expenses of a user within 
@@ -377,10 +736,15 @@ def budgets(request):
     Decorator:
     - @login_required: This decorator ensures that only authenticated users can access this view.
       If the user is not logged in, they will be redirected to the login page.
+    - @conditional_view(date.today): Answers a reload with 304 Not Modified, without running the
+      queries, until the user's data changes or, for the default range, the day changes.
 
     Parameters:
     - `start_date` (optional): The start date of the period for calculation. Defaults to the first day of the current month.
-    - `end_date` (optional): The end date of the period for calculation. Defaults to the current date.
+    - `end_date` (optional): The end date of the period for calculation, inclusive. Defaults to the current date.
+
+    The totals are the difference of the user's running totals in `DailyBalance` at both ends of the
+    period, so any period costs two point lookups. They are cached per user and data version.
     """
     start_date = request.GET.get('start_date', datetime.today().replace(day=1).strftime('%Y-%m-%d'))
     end_date = request.GET.get('end_date', datetime.today().strftime('%Y-%m-%d'))
@@ -393,15 +757,12 @@ def budgets(request):
         start_date_obj = datetime.today().replace(day=1)
         end_date_obj = datetime.today()
 
-    total_income = Income.objects.filter(
-        user=request.user,
-        date__range=[start_date_obj, end_date_obj]
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-    total_expenses = Expense.objects.filter(
-        user=request.user,
-        date__range=[start_date_obj, end_date_obj]
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    start, last = start_date_obj.date(), end_date_obj.date()
+    end = _day_after(last)
+    total_income, total_expenses = get_or_compute(
+        request.user.pk, 'budgets', lambda: balance_totals(request.user, start, end),
+        start.isoformat(), last.isoformat(),
+    )
 
     net_budget = total_income - total_expenses
 
@@ -413,4 +774,139 @@ def budgets(request):
         'net_budget': net_budget,
     }
 
-    return render(request, 'budgets.html', context)
\ No newline at end of file
+    return render(request, 'budgets.html', context)
+
+@login_required
+def budget_series(request):
+    """
+    Returns the user's income, expense and net amounts over time as JSON, one value per day, week,
+    month or year, for drawing charts without calling `budgets` once per period.
+
+    Decorator:
+    - @login_required: This decorator ensures that only authenticated users can access this view.
+      If the user is not logged in, they will be redirected to the login page.
+
+    Parameters:
+    - `start_date` (optional): First day of the series. Defaults to the first day of the month eleven months ago.
+    - `end_date` (optional): Last day of the series, inclusive. Defaults to the current date.
+    - `interval` (optional): One of 'day', 'week', 'month' or 'year'. Defaults to 'month'.
+    - `by_category` (optional): If set, returns one set of series per category.
+
+    Every series is computed in a single grouped query with database date truncation; buckets
+    without transactions are filled with zeros.
+    """
+    today = date.today()
+    default_start = (today.replace(day=1) - timedelta(days=320)).replace(day=1)
+    interval = request.GET.get('interval', 'month')
+    by_category = bool(request.GET.get('by_category'))
+    try:
+        start = _parse_date(request.GET.get('start_date')) or default_start
+        last = _parse_date(request.GET.get('end_date')) or today
+    except ValueError:
+        return HttpResponseBadRequest('Invalid start_date or end_date.')
+    if interval not in SERIES_INTERVALS:
+        return HttpResponseBadRequest(f"interval must be one of: {', '.join(SERIES_INTERVALS)}.")
+    if start > last:
+        return HttpResponseBadRequest('start_date must not be after end_date.')
+    end = _day_after(last)
+    if series_bucket_count(start, end, interval) > MAX_SERIES_BUCKETS:
+        return HttpResponseBadRequest(f'The range spans more than {MAX_SERIES_BUCKETS} buckets, use a longer interval.')
+
+    buckets, series = time_series(request.user, start, end, interval, by_category)
+
+    def serialize(values):
+        return {kind: [float(amount) for amount in amounts] for kind, amounts in values.items()}
+
+    data = {
+        'interval': interval,
+        'start_date': start.isoformat(),
+        'end_date': last.isoformat(),
+        'buckets': [bucket.isoformat() for bucket in buckets],
+    }
+    if by_category:
+        data['categories'] = [
+            {'id': category_id, 'name': getattr(categories.get(category_id), 'name', None), **serialize(values)}
+            for category_id, values in sorted(series.items())
+        ]
+    else:
+        data['series'] = serialize(series[None])
+    return JsonResponse(data)
+
+@require_POST
+def api_create_transactions(request):
+    """
+    Creates a batch of the user's expenses and incomes from a JSON request body and returns JSON.
+
+    The body is ``{"transactions": [{"type": "expense" | "income", "name", "category", "amount", "date"}, ...]}``
+    with at most `API_MAX_BATCH_SIZE` items, `category` being a category id. Requests are
+    authenticated with the session and need a CSRF token, like the HTML forms.
+
+    Responses:
+    - 201: Every item was valid and all of them were inserted, returns ``{"created": n, "ids": [...]}``
+      with one ``{"type", "id"}`` per item, in request order.
+    - 400: The body is not a valid batch, or some items are invalid. Returns ``{"errors": [...]}``
+      with ``{"index", "errors"}`` per invalid item, the errors as reported by `IncomeForm`/`ExpenseForm`.
+      Nothing is inserted unless every item is valid.
+    - 401: The user is not logged in.
+
+    Valid batches are inserted with `create_transactions`: one `bulk_create` per type in a single
+    transaction, which also updates the derived totals.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        items = json.loads(request.body)['transactions']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'The body must be a JSON object with a "transactions" list.'}, status=400)
+    max_size = getattr(settings, 'API_MAX_BATCH_SIZE', 500)
+    if not isinstance(items, list) or not 0 < len(items) <= max_size:
+        return JsonResponse({'error': f'"transactions" must be a list of 1 to {max_size} items.'}, status=400)
+
+    forms_by_type = {'expense': BatchExpenseForm, 'income': BatchIncomeForm}
+    batch = {'expense': [], 'income': []}
+    created, errors = [], []
+    for index, item in enumerate(items):
+        form_class = forms_by_type.get(item.get('type')) if isinstance(item, dict) else None
+        if form_class is None:
+            errors.append({'index': index, 'errors': {'type': [{'message': 'Must be "expense" or "income".', 'code': 'invalid'}]}})
+            continue
+        form = form_class(item)
+        if not form.is_valid():
+            errors.append({'index': index, 'errors': form.errors.get_json_data()})
+            continue
+        transaction = form.save(commit=False)
+        transaction.user = request.user
+        batch[item['type']].append(transaction)
+        created.append((item['type'], transaction))
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    try:
+        create_transactions(request.user.pk, batch['expense'], batch['income'])
+    except IntegrityError:
+        # A category was deleted after the registry validated it.
+        return JsonResponse({'error': 'A category no longer exists, reload and try again.'}, status=400)
+    return JsonResponse(
+        {'created': len(created), 'ids': [{'type': kind, 'id': transaction.pk} for kind, transaction in created]},
+        status=201,
+    )
+
+def metrics(request):
+    """
+    Exposes the request, database, cache and job queue metrics in the Prometheus text format,
+    summed over every worker process of the host.
+
+    GET:
+    - The request must carry `METRICS_TOKEN` as `Authorization: Bearer <token>` or come from a
+      logged-in staff user, unless `METRICS_PUBLIC` is set; otherwise it is answered with 401
+      before any metric is read.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = (
+        getattr(settings, 'METRICS_PUBLIC', False)
+        or request.user.is_staff
+        or (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    )
+    if not authorized:
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
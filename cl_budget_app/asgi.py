@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cl_budget_app.settings')
+os.environ.setdefault('ASYNC_DASHBOARD', 'True')
 
 application = get_asgi_application()
@@ -43,13 +43,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'budget.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'budget.middleware.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'budget.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'budget.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'cl_budget_app.urls'
@@ -87,6 +91,130 @@ DATABASES = {
     }  
 }
 
+# Optional read replica. When DB_REPLICA_HOST is set, GET requests of the read-heavy views are
+# served from it, except for users who changed data in the last REPLICA_STICKY_SECONDS.
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": config('DB_REPLICA_HOST'),
+        "PORT": config('DB_REPLICA_PORT', default='5432'),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ['budget.routers.PrimaryReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=15, cast=int)
+
+
+# SQL instrumentation
+# Per-request query counts and timings are logged on the 'budget.sql' logger; set
+# SQL_INSTRUMENTATION_HEADERS to also return them as X-DB-* response headers.
+
+SQL_INSTRUMENTATION_ENABLED = config('SQL_INSTRUMENTATION_ENABLED', default=True, cast=bool)
+SQL_INSTRUMENTATION_HEADERS = config('SQL_INSTRUMENTATION_HEADERS', default=DEBUG, cast=bool)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "budget": {
+            "handlers": ["console"],
+            "level": config('BUDGET_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
+
+
+# Prometheus metrics
+# Request latency, status codes and query counts per view are exposed at /metrics. Each worker
+# process writes its numbers to its own file in METRICS_DIR every METRICS_FLUSH_SECONDS, so all
+# workers of a host must share the directory; the files of exited processes are merged into one
+# archive file. Clear it when deploying to start the counters over. Scrapes must send
+# METRICS_TOKEN as a bearer token or come from a staff user, unless METRICS_PUBLIC is set.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_PUBLIC = config('METRICS_PUBLIC', default=False, cast=bool)
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The data versions, the category version and the hit/miss counters live in the cache, so every
+# worker process must use the same one. The default keeps it in the database; create its table
+# once with `python manage.py createcachetable`. Redis is faster, e.g. with
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and CACHE_LOCATION=redis://host:6379/1.
+# A local-memory cache is only correct with a single process (check budget.W001).
+
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        "LOCATION": config('CACHE_LOCATION', default='budget_cache'),
+    }
+}
+
+# Seconds a computed dashboard or budget summary stays cached. Entries are invalidated
+# earlier by bumping the user's data version whenever their data changes.
+BUDGET_CACHE_TIMEOUT = config('BUDGET_CACHE_TIMEOUT', default=300, cast=int)
+
+
+# Transactions per page of the transaction history, and the largest page a client may request.
+TRANSACTIONS_PAGE_SIZE = config('TRANSACTIONS_PAGE_SIZE', default=50, cast=int)
+TRANSACTIONS_MAX_PAGE_SIZE = config('TRANSACTIONS_MAX_PAGE_SIZE', default=200, cast=int)
+
+# Other users' goals listed per page of the goals view.
+GOALS_PAGE_SIZE = config('GOALS_PAGE_SIZE', default=20, cast=int)
+
+# Most transactions accepted by one request to the batch creation API.
+API_MAX_BATCH_SIZE = config('API_MAX_BATCH_SIZE', default=500, cast=int)
+
+# Rows fetched per database round trip when streaming a CSV export.
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# On PostgreSQL expenses and incomes are partitioned by year. `manage.py manage_partitions`,
+# run e.g. daily, creates the partitions this many years ahead and, when TRANSACTION_RETAIN_YEARS
+# is set, detaches the partitions of years older than that many years. Detached years are
+# archived: they are left out of the monthly rollup and the daily balances as well.
+TRANSACTION_PARTITION_YEARS_AHEAD = config('TRANSACTION_PARTITION_YEARS_AHEAD', default=1, cast=int)
+TRANSACTION_RETAIN_YEARS = config('TRANSACTION_RETAIN_YEARS', default=0, cast=int)
+
+# Background jobs run by `manage.py run_worker`. A failed job is retried after JOB_RETRY_DELAY
+# seconds, doubled after every further failure up to JOB_RETRY_MAX_DELAY, until it used up
+# JOB_MAX_ATTEMPTS. A running job whose heartbeat is older than JOB_STALE_SECONDS is assumed to
+# have lost its worker and is claimed again. The files of finished exports are deleted by the
+# workers EXPORT_RETENTION_HOURS after the export finished.
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=30, cast=int)
+JOB_RETRY_MAX_DELAY = config('JOB_RETRY_MAX_DELAY', default=3600, cast=int)
+JOB_STALE_SECONDS = config('JOB_STALE_SECONDS', default=600, cast=int)
+JOB_WORKER_CONCURRENCY = config('JOB_WORKER_CONCURRENCY', default=2, cast=int)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=2, cast=float)
+EXPORT_RETENTION_HOURS = config('EXPORT_RETENTION_HOURS', default=24, cast=float)
+
+# Per-request profiler
+# Staff users can add ?profile=1 (or ?profile=cold to skip the caches) to a page, or send an
+# X-Profile: 1 header, to get a cProfile and SQL report of the view instead of the page. The
+# report lists PROFILER_TOP_FUNCTIONS functions and the plans of the PROFILER_EXPLAIN_QUERIES
+# slowest SELECTs; on PostgreSQL these run again under EXPLAIN ANALYZE in a rolled-back transaction.
+PROFILER_ENABLED = config('PROFILER_ENABLED', default=True, cast=bool)
+PROFILER_TOP_FUNCTIONS = config('PROFILER_TOP_FUNCTIONS', default=40, cast=int)
+PROFILER_EXPLAIN_QUERIES = config('PROFILER_EXPLAIN_QUERIES', default=3, cast=int)
+
+# Identifies the deployed code. It is part of the ETags of the read views, so pages cached by
+# browsers before a deploy that changed templates are not revalidated as unchanged.
+RELEASE_VERSION = config('RELEASE_VERSION', default='')
+
+# Serve the dashboard with the async view, whose sections run concurrently. asgi.py turns this
+# on; under WSGI every async view would need its own event loop, so the sync view is kept.
+ASYNC_DASHBOARD = config('ASYNC_DASHBOARD', default=False, cast=bool)
+
+# Seconds each section of the async dashboard may take before it is shown as unavailable.
+DASHBOARD_SECTION_TIMEOUT = config('DASHBOARD_SECTION_TIMEOUT', default=5, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -124,6 +252,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Files written by background jobs, such as CSV exports, are stored here.
+MEDIA_ROOT = config('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 